@@ -1,10 +1,7 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from vllm import LLM, SamplingParams
-from transformers import AutoTokenizer
-import uvicorn
 import os
+from typing import Optional
 
+from serving.startup import StartupTimer, load_tokenizer
 
 # Получаем имя модели из переменной окружения (обязательно)
 MODEL_NAME = os.environ.get("MODEL_NAME")
@@ -25,114 +22,149 @@ print(f"   Max Model Length: {max_model_length}")
 print(f"   Trust Remote Code: {trust_remote_code}")
 print(f"   Endpoint: /{endpoint_name}")
 
-# Загружаем tokenizer
-try:
-    tokenizer = AutoTokenizer.from_pretrained(
-        MODEL_NAME,
-        trust_remote_code=trust_remote_code
-    )
-except Exception as e:
-    print(f"⚠️  Ошибка загрузки tokenizer: {e}")
-    print("💡 Пробую с trust_remote_code=True...")
-    tokenizer = AutoTokenizer.from_pretrained(
-        MODEL_NAME,
-        trust_remote_code=True
-    )
-    trust_remote_code = True
-
-# Загружаем модель
-try:
-    llm = LLM(
-        model=MODEL_NAME,
-        tensor_parallel_size=1,
-        gpu_memory_utilization=gpu_memory_util,
-        max_model_len=max_model_length,
-        enforce_eager=False,
-        trust_remote_code=trust_remote_code,
-    )
-except ValueError as e:
-    if "max seq len" in str(e).lower() or "kv cache" in str(e).lower():
-        print(f"⚠️  Ошибка с max_model_len={max_model_length}, пробую уменьшить до 2048...")
-        max_model_length = 2048
-        llm = LLM(
-            model=MODEL_NAME,
+startup = StartupTimer(MODEL_NAME)
+
+
+def load_generic_tokenizer():
+    try:
+        return load_tokenizer(MODEL_NAME, trust_remote_code=trust_remote_code)
+    except Exception as e:
+        print(f"⚠️  Ошибка загрузки tokenizer: {e}")
+        print("💡 Пробую с trust_remote_code=True...")
+        return load_tokenizer(MODEL_NAME, trust_remote_code=True)
+
+
+# Токенизатор грузится в фоне, пока импортируется vLLM и строится движок;
+# если ему нужен trust_remote_code, движок повторит загрузку с ним сам
+tokenizer_future = startup.background("tokenizer", load_generic_tokenizer)
+
+with startup.stage("import"):
+    from fastapi import FastAPI
+    import uvicorn
+
+    from serving.batch import add_batch_endpoint
+    from serving.candidates import candidate_params, candidates_response
+    from serving.chat import add_chat_endpoint
+    from serving.endpoints import add_service_endpoints
+    from serving.engine import create_engine, prefix_caching_enabled
+    from serving.health import add_health_endpoints
+    from serving.metrics import timed_template
+    from serving.profiles import load_llm_profiled
+    from serving.sampling import SamplingParams
+    from serving.schemas import GenerateOptions
+    from serving.sessions import add_session_endpoints
+    from serving.streaming import stream_response
+    from serving.templates import ChatTemplate
+
+with startup.engine_init():
+    # Загружаем модель; удачная конфигурация запоминается для этой машины,
+    # и следующий старт не повторяет загрузку, падающую на KV cache
+    engine_candidates = [
+        dict(max_model_len=max_model_length, gpu_memory_utilization=gpu_memory_util),
+        dict(max_model_len=2048, gpu_memory_utilization=0.7),
+    ]
+    try:
+        llm, engine_config = load_llm_profiled(
+            MODEL_NAME,
+            engine_candidates,
             tensor_parallel_size=1,
-            gpu_memory_utilization=0.7,
-            max_model_len=2048,
             enforce_eager=False,
+            enable_prefix_caching=prefix_caching_enabled(),
             trust_remote_code=trust_remote_code,
         )
-    else:
-        raise
-except Exception as e:
-    if "model type" in str(e).lower() or "architecture" in str(e).lower():
-        print(f"⚠️  Ошибка загрузки модели: {e}")
-        if not trust_remote_code:
-            print("💡 Пробую с trust_remote_code=True...")
-            try:
-                llm = LLM(
-                    model=MODEL_NAME,
-                    tensor_parallel_size=1,
-                    gpu_memory_utilization=gpu_memory_util,
-                    max_model_len=max_model_length,
-                    enforce_eager=False,
-                    trust_remote_code=True,
-                )
-            except Exception as e2:
-                print(f"❌ Ошибка даже с trust_remote_code=True: {e2}")
+    except Exception as e:
+        if "model type" in str(e).lower() or "architecture" in str(e).lower():
+            print(f"⚠️  Ошибка загрузки модели: {e}")
+            if not trust_remote_code:
+                print("💡 Пробую с trust_remote_code=True...")
+                try:
+                    llm, engine_config = load_llm_profiled(
+                        MODEL_NAME,
+                        engine_candidates,
+                        tensor_parallel_size=1,
+                        enforce_eager=False,
+                        enable_prefix_caching=prefix_caching_enabled(),
+                        trust_remote_code=True,
+                    )
+                except Exception as e2:
+                    print(f"❌ Ошибка даже с trust_remote_code=True: {e2}")
+                    raise
+            else:
                 raise
         else:
             raise
-    else:
-        raise
+max_model_length = engine_config["max_model_len"]
+
+# Конкурентные запросы батчатся движком (ENGINE_MODE=batch|async)
+engine = create_engine(llm, MODEL_NAME)
+tokenizer = tokenizer_future.result()
+startup.report()
 
 app = FastAPI(title=api_title)
 
+# Обёртка шаблона вокруг сообщения токенизируется один раз при старте
+chat_template = ChatTemplate(tokenizer)
 
-class GenerateRequest(BaseModel):
+
+class GenerateRequest(GenerateOptions):
     prompt: str
     temperature: float = 0.3
     max_tokens: int = 1024
+    # Несколько вариантов ответа с общим prefill: n вернуть, best_of сгенерировать
+    n: int = 1
+    best_of: Optional[int] = None
 
 
-@app.post(f"/{endpoint_name}")
-async def generate(request: GenerateRequest):
-    messages = [{"role": "user", "content": request.prompt}]
-    
-    # Пробуем применить chat template
-    try:
-        prompt_text = tokenizer.apply_chat_template(
-            messages,
-            tokenize=False,
-            add_generation_prompt=True,
-        )
-    except Exception:
-        # Если chat template не работает, используем просто prompt
-        prompt_text = request.prompt
-    
-    sampling_params = SamplingParams(
+def sampling_params_for(request):
+    return SamplingParams(
         temperature=request.temperature,
         top_p=0.9,
         top_k=50,
         max_tokens=request.max_tokens,
+        **candidate_params(request),
     )
 
-    outputs = llm.generate(
-        prompt_text,
-        use_tqdm=False,
-        sampling_params=sampling_params,
-    )
 
+@timed_template
+def prepare(request):
+    # Пробуем применить chat template
+    try:
+        prompt = {"prompt_token_ids": chat_template.token_ids(request.prompt)}
+    except Exception:
+        # Если chat template не работает, используем просто prompt
+        prompt = request.prompt
+    return prompt, sampling_params_for(request)
+
+
+def response_text(output):
     # Получаем ответ
-    if hasattr(outputs[0].outputs[0], 'text'):
-        response_text = outputs[0].outputs[0].text.strip()
-    else:
-        response_text = tokenizer.decode(
-            outputs[0].outputs[0].token_ids,
-            skip_special_tokens=True
-        ).strip()
-    
-    return {"response": response_text}
+    if hasattr(output.outputs[0], 'text'):
+        return output.outputs[0].text.strip()
+    return tokenizer.decode(
+        output.outputs[0].token_ids,
+        skip_special_tokens=True
+    ).strip()
+
+
+@app.post(f"/{endpoint_name}")
+async def generate(request: GenerateRequest):
+    prompt_text, sampling_params = prepare(request)
+
+    if request.stream:
+        return stream_response(engine.stream(prompt_text, sampling_params, request))
+
+    output = await engine.generate(prompt_text, sampling_params, request)
+    if len(output.outputs) > 1:
+        return candidates_response(output)
+    return {"response": response_text(output)}
+
+
+add_batch_endpoint(app, engine, GenerateRequest, prepare, response_text, path=f"/{endpoint_name}_batch")
+add_chat_endpoint(app, engine, chat_template, GenerateRequest, sampling_params_for, response_text)
+add_session_endpoints(app, engine, chat_template, GenerateRequest, sampling_params_for, response_text,
+                      max_model_len=max_model_length)
+add_service_endpoints(app, engine)
+add_health_endpoints(app, engine, GenerateRequest, prepare)
 
 
 if __name__ == "__main__":
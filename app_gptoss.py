@@ -1,14 +1,32 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from vllm import LLM, SamplingParams
-from transformers import AutoTokenizer
-import uvicorn
 import os
+from typing import Literal, Optional
 
+from serving.startup import StartupTimer, load_tokenizer
 
 MODEL_NAME = "TeichAI/gpt-oss-20b-claude-4.5-sonnet-high-reasoning-distill"
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+startup = StartupTimer(MODEL_NAME)
+
+# Токенизатор грузится в фоне, пока импортируется vLLM и строится движок
+tokenizer_future = startup.background("tokenizer", load_tokenizer, MODEL_NAME)
+
+with startup.stage("import"):
+    from fastapi import FastAPI
+    import uvicorn
+
+    from serving.batch import add_batch_endpoint
+    from serving.chat import add_chat_endpoint
+    from serving.endpoints import add_service_endpoints
+    from serving.engine import create_engine, prefix_caching_enabled
+    from serving.health import add_health_endpoints
+    from serving.metrics import timed_template
+    from serving.profiles import load_llm_profiled
+    from serving.reasoning import HARMONY, Reasoning
+    from serving.sampling import SamplingParams
+    from serving.schemas import GenerateOptions
+    from serving.sessions import add_session_endpoints
+    from serving.streaming import stream_response
+    from serving.templates import ChatTemplate
 
 # Получаем параметры из переменных окружения или используем значения по умолчанию
 gpu_memory_util = float(os.environ.get("GPU_MEMORY_UTILIZATION", "0.75"))
@@ -18,62 +36,91 @@ print(f"🔧 Параметры загрузки модели:")
 print(f"   GPU Memory Utilization: {gpu_memory_util}")
 print(f"   Max Model Length: {max_model_length}")
 
-try:
-    llm = LLM(
-        model=MODEL_NAME,
+with startup.engine_init():
+    # Удачная конфигурация запоминается для этой машины: следующий старт
+    # сразу грузит модель с ней, без повторной ошибки KV cache
+    llm, engine_config = load_llm_profiled(
+        MODEL_NAME,
+        [
+            # Ограничиваем длину контекста для экономии памяти KV cache
+            dict(max_model_len=max_model_length, gpu_memory_utilization=gpu_memory_util),
+            dict(max_model_len=2048, gpu_memory_utilization=0.7),  # Еще меньше
+        ],
         tensor_parallel_size=1,
-        gpu_memory_utilization=gpu_memory_util,
-        max_model_len=max_model_length,  # Ограничиваем длину контекста для экономии памяти KV cache
         enforce_eager=False,  # Используем оптимизированный режим
+        # Sliding window attention в vLLM 0.6 несовместимо с prefix caching
+        enable_prefix_caching=prefix_caching_enabled(default=False),
     )
-except ValueError as e:
-    if "max seq len" in str(e).lower() or "kv cache" in str(e).lower():
-        print(f"⚠️  Ошибка с max_model_len={max_model_length}, пробую уменьшить до 2048...")
-        max_model_length = 2048
-        llm = LLM(
-            model=MODEL_NAME,
-            tensor_parallel_size=1,
-            gpu_memory_utilization=0.7,  # Еще меньше
-            max_model_len=2048,
-            enforce_eager=False,
-        )
-    else:
-        raise
+max_model_length = engine_config["max_model_len"]
+
+# Конкурентные запросы батчатся движком (ENGINE_MODE=batch|async)
+engine = create_engine(llm, MODEL_NAME)
+tokenizer = tokenizer_future.result()
+startup.report()
 
 app = FastAPI(title="GPT-OSS-20B-Claude-4.5-Sonnet-High-Reasoning-Distill API")
 
+# Обёртка шаблона вокруг сообщения токенизируется один раз при старте
+chat_template = ChatTemplate(tokenizer)
+
+# Бюджет рассуждений и отделение их от ответа (reasoning_budget, reasoning)
+reasoning = Reasoning(tokenizer, HARMONY, MODEL_NAME)
+
 
-class GenerateRequest(BaseModel):
+class GenerateRequest(GenerateOptions):
     prompt: str
     temperature: float = 0.3
+    # Не больше стольких токенов на рассуждения, затем сразу ответ
+    reasoning_budget: Optional[int] = None
+    # inline — текст как есть, strip — только ответ, separate — ответ и рассуждения отдельно
+    reasoning: Optional[Literal["inline", "strip", "separate"]] = None
 
 
-@app.post("/generate_gptoss")
-async def generate_gptoss(request: GenerateRequest):
-    messages = [{"role": "user", "content": request.prompt}]
-    
-    # Применяем chat template
-    prompt_text = tokenizer.apply_chat_template(
-        messages,
-        tokenize=False,
-        add_generation_prompt=True,
-    )
-    
+def sampling_params_for(request):
     sampling_params = SamplingParams(
         temperature=request.temperature,
         top_p=0.9,
         top_k=50,
         max_tokens=1024,
     )
+    return reasoning.apply(sampling_params, request)
+
+
+@timed_template
+def prepare(request):
+    # Применяем chat template: токенизируется только текст пользователя
+    prompt_ids = chat_template.token_ids(request.prompt)
+    return {"prompt_token_ids": prompt_ids}, sampling_params_for(request)
+
+
+def response_text(output):
+    return output.outputs[0].text.strip()
+
+
+def response_body(output, request=None):
+    # Режим reasoning: текст целиком, только ответ или ответ и рассуждения
+    return reasoning.response(output, request)
+
+
+@app.post("/generate_gptoss")
+async def generate_gptoss(request: GenerateRequest):
+    prompt_text, sampling_params = prepare(request)
+
+    if request.stream:
+        return stream_response(engine.stream(prompt_text, sampling_params, request), reasoning.events(request))
+
+    output = await engine.generate(prompt_text, sampling_params, request)
+    return response_body(output, request)
 
-    outputs = llm.generate(
-        prompt_text,
-        use_tqdm=False,
-        sampling_params=sampling_params,
-    )
 
-    response_text = outputs[0].outputs[0].text.strip()
-    return {"response": response_text}
+add_batch_endpoint(app, engine, GenerateRequest, prepare, response_text, response_body=response_body)
+add_chat_endpoint(app, engine, chat_template, GenerateRequest, sampling_params_for, response_text,
+                  response_body=response_body, events=reasoning.events)
+add_session_endpoints(app, engine, chat_template, GenerateRequest, sampling_params_for, response_text,
+                      max_model_len=max_model_length, response_body=response_body, events=reasoning.events,
+                      answer_text=reasoning.answer)
+add_service_endpoints(app, engine)
+add_health_endpoints(app, engine, GenerateRequest, prepare)
 
 
 if __name__ == "__main__":
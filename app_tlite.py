@@ -1,67 +1,112 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from transformers import AutoTokenizer
-from vllm import LLM, SamplingParams
-import uvicorn
 import os
 
+from serving.startup import StartupTimer, load_tokenizer
 
 MODEL_NAME = "t-tech/T-lite-it-1.0"
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-llm = LLM(
-    model=MODEL_NAME,
-    tensor_parallel_size=1,
-    gpu_memory_utilization=0.9,
-    max_model_len=2048,
-)
+startup = StartupTimer(MODEL_NAME)
+
+# Токенизатор грузится в фоне, пока импортируется vLLM и строится движок
+tokenizer_future = startup.background("tokenizer", load_tokenizer, MODEL_NAME)
+
+with startup.stage("import"):
+    from fastapi import FastAPI
+    import uvicorn
+
+    from serving.batch import add_batch_endpoint
+    from serving.chat import add_chat_endpoint
+    from serving.endpoints import add_service_endpoints
+    from serving.engine import create_engine, load_llm, prefix_caching_enabled
+    from serving.health import add_health_endpoints
+    from serving.metrics import timed_template
+    from serving.sampling import SamplingParams
+    from serving.schemas import GenerateOptions
+    from serving.sessions import add_session_endpoints
+    from serving.streaming import stream_response
+    from serving.templates import ChatTemplate
+
+max_model_length = 2048
+
+with startup.engine_init():
+    llm = load_llm(
+        model=MODEL_NAME,
+        tensor_parallel_size=1,
+        gpu_memory_utilization=0.9,
+        max_model_len=max_model_length,
+        # Длинное системное сообщение одинаково у всех запросов: его prefill
+        # берётся из кэша, а не считается заново
+        enable_prefix_caching=prefix_caching_enabled(),
+    )
+
+# Конкурентные запросы батчатся движком (ENGINE_MODE=batch|async)
+engine = create_engine(llm, MODEL_NAME)
+tokenizer = tokenizer_future.result()
+startup.report()
 
 
 app = FastAPI(title="T-lite-it-1.0 API")
 
+SYSTEM_PROMPT = (
+    "Ты T-lite, виртуальный ассистент в Weyland-Yutani. "
+    "Твоя задача — быть полезным диалоговым ассистентом."
+)
+
+
+def build_messages(content):
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": content},
+    ]
+
+
+# Системное сообщение и обёртка шаблона токенизируются один раз при старте
+chat_template = ChatTemplate(tokenizer, build_messages)
 
-class GenerateRequest(BaseModel):
+
+class GenerateRequest(GenerateOptions):
     prompt: str
     temperature: float = 0.3
     top_p: float = 0.8
     top_k: int = 70
 
 
-@app.post("/generate_tlite")
-async def generate_tlite(request: GenerateRequest):
-    messages = [
-        {
-            "role": "system",
-            "content": (
-                "Ты T-lite, виртуальный ассистент в Weyland-Yutani. "
-                "Твоя задача — быть полезным диалоговым ассистентом."
-            ),
-        },
-        {"role": "user", "content": request.prompt},
-    ]
-    sampling_params = SamplingParams(
+def sampling_params_for(request):
+    return SamplingParams(
         temperature=request.temperature,
         repetition_penalty=1.05,
         top_p=request.top_p,
         top_k=request.top_k,
         max_tokens=2048,
-        )
+    )
 
 
-    prompt_token_ids = tokenizer.apply_chat_template(
-        messages,
-        add_generation_prompt=True,
-        tokenize=False,
-    )
+@timed_template
+def prepare(request):
+    prompt_ids = chat_template.token_ids(request.prompt)
+    return {"prompt_token_ids": prompt_ids}, sampling_params_for(request)
 
 
-    outputs = llm.generate(
-        prompt_token_ids,
-        sampling_params=sampling_params,
-    )
+def response_text(output):
+    return output.outputs[0].text.strip()
+
+
+@app.post("/generate_tlite")
+async def generate_tlite(request: GenerateRequest):
+    prompt_text, sampling_params = prepare(request)
+
+    if request.stream:
+        return stream_response(engine.stream(prompt_text, sampling_params, request))
+
+    output = await engine.generate(prompt_text, sampling_params, request)
+    return {"response": response_text(output)}
+
 
-    result = outputs[0].outputs[0].text.strip()
-    return {"response": result}
+add_batch_endpoint(app, engine, GenerateRequest, prepare, response_text)
+add_chat_endpoint(app, engine, chat_template, GenerateRequest, sampling_params_for, response_text, system_prompt=SYSTEM_PROMPT)
+add_session_endpoints(app, engine, chat_template, GenerateRequest, sampling_params_for, response_text,
+                      system_prompt=SYSTEM_PROMPT, max_model_len=max_model_length)
+add_service_endpoints(app, engine)
+add_health_endpoints(app, engine, GenerateRequest, prepare)
 
 
 if __name__ == "__main__":
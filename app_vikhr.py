@@ -1,46 +1,103 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from vllm import LLM, SamplingParams
-from transformers import AutoTokenizer
-import uvicorn
 import os
+from typing import Optional
 
+from serving.startup import StartupTimer, load_tokenizer
 
 MODEL_NAME = "Vikhrmodels/Vikhr-Nemo-12B-Instruct-R-21-09-24"
 
+startup = StartupTimer(MODEL_NAME)
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+# Токенизатор грузится в фоне, пока импортируется vLLM и строится движок
+tokenizer_future = startup.background("tokenizer", load_tokenizer, MODEL_NAME)
 
-llm = LLM(
-    model=MODEL_NAME,
-    tensor_parallel_size=1,
-    gpu_memory_utilization=0.9,
-    max_model_len=1024,
-)
+with startup.stage("import"):
+    from fastapi import FastAPI
+    import uvicorn
+
+    from serving.batch import add_batch_endpoint
+    from serving.candidates import candidate_params, output_body
+    from serving.chat import add_chat_endpoint
+    from serving.endpoints import add_service_endpoints
+    from serving.engine import create_engine, load_llm, prefix_caching_enabled
+    from serving.health import add_health_endpoints
+    from serving.metrics import timed_template
+    from serving.sampling import SamplingParams
+    from serving.schemas import GenerateOptions
+    from serving.sessions import add_session_endpoints
+    from serving.streaming import stream_response
+    from serving.templates import ChatTemplate
+
+max_model_length = 1024
+
+with startup.engine_init():
+    llm = load_llm(
+        model=MODEL_NAME,
+        tensor_parallel_size=1,
+        gpu_memory_utilization=0.9,
+        max_model_len=max_model_length,
+        enable_prefix_caching=prefix_caching_enabled(),  # PREFIX_CACHING=false выключает
+    )
+
+# Конкурентные запросы батчатся движком (ENGINE_MODE=batch|async)
+engine = create_engine(llm, MODEL_NAME)
+tokenizer = tokenizer_future.result()
+startup.report()
 
 
 app = FastAPI(title="Vikhr-Nemo-12B-Instruct API")
 
-class GenerateRequest(BaseModel):
+# Обёртка шаблона вокруг сообщения токенизируется один раз при старте
+chat_template = ChatTemplate(tokenizer)
+
+class GenerateRequest(GenerateOptions):
     prompt: str
     temperature: float = 0.3
+    # Несколько вариантов ответа с общим prefill: n вернуть, best_of сгенерировать
+    n: int = 1
+    best_of: Optional[int] = None
 
 
-@app.post("/generate_vikhr")
-def generate_vikhr(request: GenerateRequest):
-    messages = [{"role": "user", "content": request.prompt}]
-    prompt_text = tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
-    sampling_params = SamplingParams(
+def sampling_params_for(request):
+    return SamplingParams(
         temperature=request.temperature,
         top_p=0.9,
         top_k=42,
         max_tokens=1024,
+        **candidate_params(request),
     )
 
-    outputs = llm.generate(prompt_text, use_tqdm=False, sampling_params=sampling_params)
-    response_text = outputs[0].outputs[0].text
 
-    return {"response": response_text}
+@timed_template
+def prepare(request):
+    prompt_ids = chat_template.token_ids(request.prompt)
+    return {"prompt_token_ids": prompt_ids}, sampling_params_for(request)
+
+
+def response_text(output):
+    return output.outputs[0].text
+
+
+def response_body(output, request=None):
+    return output_body(output, response_text, strip=False)
+
+
+@app.post("/generate_vikhr")
+async def generate_vikhr(request: GenerateRequest):
+    prompt_text, sampling_params = prepare(request)
+
+    if request.stream:
+        return stream_response(engine.stream(prompt_text, sampling_params, request))
+
+    output = await engine.generate(prompt_text, sampling_params, request)
+    return response_body(output)
+
+
+add_batch_endpoint(app, engine, GenerateRequest, prepare, response_text, response_body=response_body)
+add_chat_endpoint(app, engine, chat_template, GenerateRequest, sampling_params_for, response_text)
+add_session_endpoints(app, engine, chat_template, GenerateRequest, sampling_params_for, response_text,
+                      max_model_len=max_model_length)
+add_service_endpoints(app, engine)
+add_health_endpoints(app, engine, GenerateRequest, prepare)
 
 
 if __name__ == "__main__":
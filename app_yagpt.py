@@ -1,14 +1,30 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
-from vllm import LLM, SamplingParams
-from transformers import AutoTokenizer
-import uvicorn
 import os
 
+from serving.startup import StartupTimer, load_tokenizer
 
 MODEL_NAME = "yandex/YandexGPT-5-Lite-8B-instruct"
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+startup = StartupTimer(MODEL_NAME)
+
+# Токенизатор грузится в фоне, пока импортируется vLLM и строится движок
+tokenizer_future = startup.background("tokenizer", load_tokenizer, MODEL_NAME)
+
+with startup.stage("import"):
+    from fastapi import FastAPI
+    import uvicorn
+
+    from serving.batch import add_batch_endpoint
+    from serving.chat import add_chat_endpoint
+    from serving.endpoints import add_service_endpoints
+    from serving.engine import create_engine, prefix_caching_enabled
+    from serving.health import add_health_endpoints
+    from serving.metrics import timed_template
+    from serving.profiles import load_llm_profiled
+    from serving.sampling import SamplingParams
+    from serving.schemas import GenerateOptions
+    from serving.sessions import add_session_endpoints
+    from serving.streaming import stream_response
+    from serving.templates import ChatTemplate
 
 # Получаем параметры из переменных окружения или используем значения по умолчанию
 gpu_memory_util = float(os.environ.get("GPU_MEMORY_UTILIZATION", "0.75"))
@@ -18,55 +34,76 @@ print(f"🔧 Параметры загрузки модели:")
 print(f"   GPU Memory Utilization: {gpu_memory_util}")
 print(f"   Max Model Length: {max_model_length}")
 
-try:
-    llm = LLM(
-        model=MODEL_NAME,
+with startup.engine_init():
+    # Удачная конфигурация запоминается для этой машины: следующий старт
+    # сразу грузит модель с ней, без повторной ошибки KV cache
+    llm, engine_config = load_llm_profiled(
+        MODEL_NAME,
+        [
+            # Ограничиваем длину контекста для экономии памяти KV cache
+            dict(max_model_len=max_model_length, gpu_memory_utilization=gpu_memory_util),
+            dict(max_model_len=2048, gpu_memory_utilization=0.7),  # Еще меньше
+        ],
         tensor_parallel_size=1,
-        gpu_memory_utilization=gpu_memory_util,
-        max_model_len=max_model_length,  # Ограничиваем длину контекста для экономии памяти KV cache
         enforce_eager=False,  # Используем оптимизированный режим
+        enable_prefix_caching=prefix_caching_enabled(),  # PREFIX_CACHING=false выключает
     )
-except ValueError as e:
-    if "max seq len" in str(e).lower() or "kv cache" in str(e).lower():
-        print(f"⚠️  Ошибка с max_model_len={max_model_length}, пробую уменьшить до 2048...")
-        max_model_length = 2048
-        llm = LLM(
-            model=MODEL_NAME,
-            tensor_parallel_size=1,
-            gpu_memory_utilization=0.7,  # Еще меньше
-            max_model_len=2048,
-            enforce_eager=False,
-        )
-    else:
-        raise
+max_model_length = engine_config["max_model_len"]
+
+# Конкурентные запросы батчатся движком (ENGINE_MODE=batch|async)
+engine = create_engine(llm, MODEL_NAME)
+tokenizer = tokenizer_future.result()
+startup.report()
 
 app = FastAPI(title="YandexGPT-8B-Lite-Instruct service")
 
+# Обёртка шаблона вокруг сообщения токенизируется один раз при старте
+chat_template = ChatTemplate(tokenizer, add_special_tokens=False)
+
 
-class GenerateRequest(BaseModel):
+class GenerateRequest(GenerateOptions):
     prompt: str
     temperature: float = 0.4
 
 
-@app.post("/generate_yagpt")
-def generate_yagpt(request: GenerateRequest):
-    messages = [{"role": "user", "content": request.prompt}]
-    input_ids = tokenizer.apply_chat_template(
-        messages, tokenize=True, add_generation_prompt=True
-    )[1:]
-    text = tokenizer.decode(input_ids)
-
-    sampling_params = SamplingParams(
+def sampling_params_for(request):
+    return SamplingParams(
         temperature=request.temperature,
         top_p=0.7,
         max_tokens=1024,
     )
 
-    outputs = llm.generate(text, use_tqdm=False, sampling_params=sampling_params)
-    response_text = tokenizer.decode(
-        outputs[0].outputs[0].token_ids, skip_special_tokens=True
-    )
-    return {"response": response_text}
+
+@timed_template
+def prepare(request):
+    # ID токенов (вместе с BOS из шаблона) уходят в движок напрямую:
+    # без decode в текст и повторной токенизации внутри vLLM
+    input_ids = chat_template.token_ids(request.prompt)
+    return {"prompt_token_ids": input_ids}, sampling_params_for(request)
+
+
+def response_text(output):
+    # vLLM уже детокенизировал ответ (skip_special_tokens=True по умолчанию)
+    return output.outputs[0].text
+
+
+@app.post("/generate_yagpt")
+async def generate_yagpt(request: GenerateRequest):
+    prompt, sampling_params = prepare(request)
+
+    if request.stream:
+        return stream_response(engine.stream(prompt, sampling_params, request))
+
+    output = await engine.generate(prompt, sampling_params, request)
+    return {"response": response_text(output)}
+
+
+add_batch_endpoint(app, engine, GenerateRequest, prepare, response_text)
+add_chat_endpoint(app, engine, chat_template, GenerateRequest, sampling_params_for, response_text)
+add_session_endpoints(app, engine, chat_template, GenerateRequest, sampling_params_for, response_text,
+                      max_model_len=max_model_length)
+add_service_endpoints(app, engine)
+add_health_endpoints(app, engine, GenerateRequest, prepare)
 
 
 if __name__ == "__main__":
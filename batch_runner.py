@@ -0,0 +1,178 @@
+"""Офлайн-прогон JSONL-файла через модель большими вызовами llm.generate.
+
+Входной файл читается потоково (в памяти только текущая группа строк),
+результаты дописываются в выходной JSONL после каждой группы, а в файл
+``<output>.ckpt`` сохраняется позиция во входном и выходном файлах. После
+падения повторный запуск с теми же аргументами продолжит с последней
+сохранённой группы.
+
+Использование:
+    python batch_runner.py tlite --input requests.jsonl --output results.jsonl
+    python batch_runner.py deepseek --input evals.jsonl --output out.jsonl \\
+        --prompt-field body --id-field request_id --group-size 256
+"""
+import argparse
+import importlib
+import json
+import os
+import time
+
+from serving.candidates import output_body
+
+MODELS = {
+    "tlite": "app_tlite",
+    "yagpt": "app_yagpt",
+    "vikhr": "app_vikhr",
+    "gptoss": "app_gptoss",
+    "deepseek": "app_deepseek",
+    "generic": "app_generic",
+}
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, state):
+    # Пишем во временный файл и атомарно подменяем, чтобы не получить
+    # обрезанный чекпоинт при падении посреди записи
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_group(fin, group_size, state, args, request_model):
+    """Читает до ``group_size`` непустых строк.
+
+    Возвращает список слотов: ``(record_id, request, error)``.
+    """
+    slots = []
+    while len(slots) < group_size:
+        line = fin.readline()
+        if not line:
+            break
+        state["lines"] += 1
+        if not line.strip():
+            continue
+        record_id = state["lines"]
+        try:
+            data = json.loads(line)
+            record_id = data.get(args.id_field, record_id)
+            payload = dict(data)
+            payload["prompt"] = data[args.prompt_field]
+            slots.append((record_id, request_model.model_validate(payload), None))
+        except Exception as e:
+            slots.append((record_id, None, f"{type(e).__name__}: {e}"))
+    return slots
+
+
+def prepare_slots(slots, app_module):
+    """``prepare`` для каждого слота; его ошибка (например, неверные n/best_of)
+    становится ошибкой этой записи, а не всего прогона."""
+    prepared = []
+    for i, (record_id, request, error) in enumerate(slots):
+        if error is not None:
+            continue
+        try:
+            prepared.append(app_module.prepare(request))
+        except Exception as e:
+            slots[i] = (record_id, None, f"{type(e).__name__}: {e}")
+    return prepared
+
+
+def response_body(app_module, output, request):
+    """Тело ответа, как у батч-эндпоинта модели: свой ``response_body`` приложения
+    или ``response`` (и ``completions`` при нескольких вариантах)."""
+    if hasattr(app_module, "response_body"):
+        return app_module.response_body(output, request)
+    return output_body(output, app_module.response_text)
+
+
+def run_group(slots, app_module, engine):
+    prepared = prepare_slots(slots, app_module)
+    outputs = iter(engine.generate(
+        [prompt for prompt, _ in prepared],
+        [sampling_params for _, sampling_params in prepared],
+    ) if prepared else [])
+
+    records = []
+    for record_id, request, error in slots:
+        if error is not None:
+            records.append({"id": record_id, "error": error})
+            continue
+        output = next(outputs)
+        records.append({
+            "id": record_id,
+            **response_body(app_module, output, request),
+            "prompt_tokens": len(output.prompt_token_ids or []),
+            "completion_tokens": sum(len(c.token_ids) for c in output.outputs),
+        })
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Офлайн-прогон JSONL через модель")
+    parser.add_argument("model", choices=sorted(MODELS))
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--group-size", type=int, default=512,
+                        help="сколько строк отправлять в один вызов llm.generate")
+    parser.add_argument("--prompt-field", default="prompt")
+    parser.add_argument("--id-field", default="request_id")
+    parser.add_argument("--restart", action="store_true",
+                        help="игнорировать чекпоинт и начать заново")
+    args = parser.parse_args()
+
+    checkpoint_path = args.output + ".ckpt"
+    state = None if args.restart else load_checkpoint(checkpoint_path)
+    if state is None:
+        state = {"input_offset": 0, "output_offset": 0, "lines": 0, "done": 0, "errors": 0}
+    else:
+        print(f"♻️  Продолжаю с чекпоинта: обработано {state['done']} записей")
+
+    # Офлайн-прогону не нужен async-движок: вызываем llm.generate напрямую
+    os.environ["ENGINE_MODE"] = "batch"
+    app_module = importlib.import_module(MODELS[args.model])
+    from serving.engine import VLLMEngine
+    engine = VLLMEngine(app_module.llm)
+
+    mode = "r+b" if os.path.exists(args.output) else "wb"
+    with open(args.input, "rb") as fin, open(args.output, mode) as fout:
+        fin.seek(state["input_offset"])
+        # Отбрасываем строки, записанные после последнего чекпоинта
+        fout.truncate(state["output_offset"])
+        fout.seek(state["output_offset"])
+
+        started = time.monotonic()
+        processed = 0
+        while True:
+            slots = read_group(fin, args.group_size, state, args, app_module.GenerateRequest)
+            if not slots:
+                break
+
+            for record in run_group(slots, app_module, engine):
+                fout.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+                state["errors"] += "error" in record
+            fout.flush()
+            os.fsync(fout.fileno())
+
+            state["done"] += len(slots)
+            state["input_offset"] = fin.tell()
+            state["output_offset"] = fout.tell()
+            save_checkpoint(checkpoint_path, state)
+
+            processed += len(slots)
+            rate = processed / max(time.monotonic() - started, 1e-9)
+            print(f"✅ Обработано {state['done']} записей (ошибок: {state['errors']}), {rate:.1f} записей/с")
+
+    print(f"🏁 Готово: {state['done']} записей, результаты в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
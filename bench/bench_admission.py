@@ -0,0 +1,133 @@
+"""Ограничение нагрузки: задержка принятых запросов при перегрузке.
+
+Поднимает FastAPI-сервис на CPU-заглушке движка (MicroBatcher с небольшим
+батчем, чтобы у «GPU» была конечная пропускная способность) и подаёт
+открытый поток запросов (пуассоновский, не ждёт ответов) с интенсивностью
+``--overload`` × ёмкость. Печатает для каждого режима:
+
+    off — без ограничений: очередь растёт, задержка растёт вместе с ней
+    on  — AdmissionEngine: лишнее сразу получает 429, задержка принятых ровная
+
+    pip install httpx
+    python bench/bench_admission.py --overload 2 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serving.admission import AdmissionEngine
+from serving.batching import MicroBatcher
+from serving.endpoints import add_service_endpoints
+from serving.engine import FakeEngine
+from serving.metrics import MetricsEngine
+
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    max_tokens: int = 32
+
+
+def build_app(mode, batch_size, output_tokens, max_requests):
+    engine = MicroBatcher(FakeEngine(output_tokens=output_tokens), max_batch_size=batch_size)
+    engine = MetricsEngine(engine, "fake")
+    if mode == "on":
+        engine = AdmissionEngine(engine, "fake", max_requests=max_requests)
+
+    app = FastAPI()
+
+    @app.post("/generate")
+    async def generate_endpoint(request: GenerateRequest):
+        params = SimpleNamespace(max_tokens=request.max_tokens)
+        output = await engine.generate(request.prompt, params, request)
+        return {"response": output.outputs[0].text}
+
+    add_service_endpoints(app, engine)
+    return app
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app):
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def drive(base_url, rate, duration, max_tokens):
+    latencies = []
+    statuses = {}
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None,
+                                 limits=httpx.Limits(max_connections=None)) as client:
+        async def one():
+            start = time.perf_counter()
+            response = await client.post("/generate", json={"prompt": "привет " * 64, "max_tokens": max_tokens})
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+
+        tasks = []
+        start = time.monotonic()
+        stop = start + duration
+        while time.monotonic() < stop:
+            tasks.append(asyncio.ensure_future(one()))
+            await asyncio.sleep(random.expovariate(rate))
+        await asyncio.gather(*tasks)
+    return latencies, statuses, time.monotonic() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", default="off,on")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--output-tokens", type=int, default=16)
+    parser.add_argument("--max-requests", type=int, default=16,
+                        help="ADMISSION_MAX_REQUESTS для режима on")
+    parser.add_argument("--overload", type=float, default=2.0, help="во сколько раз поток больше ёмкости")
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    # Ёмкость заглушки: один батч за decode_step × output_tokens (+ префилл)
+    fake = FakeEngine(output_tokens=args.output_tokens)
+    batch_s = fake.decode_step_s * args.output_tokens + args.batch_size * 64 / fake.prefill_tokens_per_s
+    capacity = args.batch_size / batch_s
+    rate = capacity * args.overload
+    print(f"Ёмкость ≈ {capacity:.1f} запр/с, подаём {rate:.1f} запр/с в течение {args.duration:.0f} с")
+
+    print(f"{'mode':<6}{'p50, ms':>10}{'p95, ms':>10}{'max, ms':>10}{'ok':>7}{'429':>7}{'ok/s':>8}")
+    for mode in args.modes.split(","):
+        server, base_url = start_server(build_app(mode, args.batch_size, args.output_tokens, args.max_requests))
+        latencies, statuses, elapsed = asyncio.run(drive(base_url, rate, args.duration, args.output_tokens))
+        server.should_exit = True
+        ok = statuses.get(200, 0)
+        print(f"{mode:<6}{percentile(latencies, 0.5) * 1000:>10.0f}{percentile(latencies, 0.95) * 1000:>10.0f}"
+              f"{max(latencies) * 1000:>10.0f}{ok:>7}{statuses.get(429, 0):>7}{ok / elapsed:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Нагрузочный тест микро-батчинга на CPU-заглушке движка.
+
+Сравнивает пропускную способность при последовательной отправке запросов
+по одному и при прохождении тех же конкурентных запросов через MicroBatcher.
+
+    python bench/bench_batching.py --requests 64 --concurrency 64
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serving.batching import MicroBatcher
+from serving.engine import FakeEngine
+
+
+def run_unbatched(engine, prompts, params):
+    start = time.perf_counter()
+    for prompt in prompts:
+        engine.generate([prompt], [params])
+    return time.perf_counter() - start
+
+
+def run_batched(engine, prompts, params, concurrency, max_batch_size, max_wait_ms):
+    batcher = MicroBatcher(engine, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda p: batcher.generate_sync(p, params), prompts))
+    elapsed = time.perf_counter() - start
+    batcher.close()
+    return elapsed, batcher
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--max-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    engine = FakeEngine()
+    prompts = [f"Запрос номер {i}: расскажи что-нибудь интересное" for i in range(args.requests)]
+    params = SimpleNamespace(max_tokens=args.max_tokens)
+
+    unbatched = run_unbatched(engine, prompts, params)
+    batched, batcher = run_batched(
+        engine, prompts, params, args.concurrency, args.max_batch_size, args.max_wait_ms
+    )
+
+    print(f"Запросов: {args.requests}, конкурентность: {args.concurrency}")
+    print(f"Без батчинга: {unbatched:.2f} с ({args.requests / unbatched:.1f} req/s)")
+    print(f"С батчингом:  {batched:.2f} с ({args.requests / batched:.1f} req/s), "
+          f"батчей: {batcher.batches}, средний размер: {batcher.requests / max(batcher.batches, 1):.1f}")
+
+
+if __name__ == "__main__":
+    main()
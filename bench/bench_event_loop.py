@@ -0,0 +1,126 @@
+"""Отзывчивость event loop во время генерации.
+
+Поднимает FastAPI-сервис на CPU-заглушке движка, держит ``--inflight``
+одновременных генераций и параллельно опрашивает тривиальный ``/ping``.
+Печатает p50/p99 задержки ``/ping`` для каждого режима:
+
+    blocking — синхронный engine.generate прямо в async-хендлере (как было раньше)
+    batch    — MicroBatcher в отдельном потоке (ENGINE_MODE=batch)
+    async    — движок с интерфейсом AsyncLLMEngine (ENGINE_MODE=async)
+
+    pip install httpx
+    python bench/bench_event_loop.py --inflight 8 --duration 5
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serving.batching import MicroBatcher
+from serving.engine import AsyncVLLMEngine, FakeAsyncLLMEngine, FakeEngine
+
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    max_tokens: int = 64
+
+
+def build_app(mode):
+    app = FastAPI()
+
+    if mode == "blocking":
+        fake = FakeEngine()
+
+        async def generate(prompt, params):
+            return fake.generate([prompt], [params])[0]
+    elif mode == "batch":
+        generate = MicroBatcher(FakeEngine()).generate
+    else:
+        generate = AsyncVLLMEngine(FakeAsyncLLMEngine()).generate
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.post("/generate")
+    async def generate_endpoint(request: GenerateRequest):
+        params = SimpleNamespace(max_tokens=request.max_tokens)
+        output = await generate(request.prompt, params)
+        return {"response": output.outputs[0].text}
+
+    return app
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app):
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def drive(base_url, inflight, duration, max_tokens):
+    stop = time.monotonic() + duration
+    latencies = []
+    completed = 0
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        async def generator():
+            nonlocal completed
+            while time.monotonic() < stop:
+                await client.post("/generate", json={"prompt": "привет " * 64, "max_tokens": max_tokens})
+                completed += 1
+
+        async def pinger():
+            while time.monotonic() < stop:
+                start = time.perf_counter()
+                await client.get("/ping")
+                latencies.append(time.perf_counter() - start)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(pinger(), *(generator() for _ in range(inflight)))
+    return latencies, completed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", default="blocking,batch,async")
+    parser.add_argument("--inflight", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--max-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"{'mode':<10}{'ping p50, ms':>14}{'ping p99, ms':>14}{'pings':>8}{'generations':>13}")
+    for mode in args.modes.split(","):
+        server, base_url = start_server(build_app(mode))
+        latencies, completed = asyncio.run(drive(base_url, args.inflight, args.duration, args.max_tokens))
+        server.should_exit = True
+        print(f"{mode:<10}{percentile(latencies, 0.5) * 1000:>14.1f}"
+              f"{percentile(latencies, 0.99) * 1000:>14.1f}{len(latencies):>8}{completed:>13}")
+
+
+if __name__ == "__main__":
+    main()
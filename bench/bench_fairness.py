@@ -0,0 +1,102 @@
+"""Симуляция честной очереди: интерактивные клиенты рядом с массовым прогоном.
+
+Без HTTP: запросы идут прямо в слои движка на CPU-заглушке. Места у движка
+(``--slots``) — узкое место, как места в батче на GPU. Нагрузка:
+
+    eval        — bulk, замкнутый цикл из ``--bulk-concurrency`` длинных запросов
+    carol       — bulk, один поток длинных запросов (второй массовый клиент)
+    alice, bob  — interactive, пуассоновский поток коротких запросов
+
+Режимы:
+
+    fifo — одна общая очередь в порядке прихода (как было)
+    fair — FairQueueEngine: приоритет interactive, резерв мест, WFQ между клиентами
+
+    python bench/bench_fairness.py --slots 8 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serving.admission import CLIENT
+from serving.engine import AsyncVLLMEngine, FakeAsyncLLMEngine
+from serving.fairness import FairQueueEngine
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def simulate(mode, args):
+    base = AsyncVLLMEngine(FakeAsyncLLMEngine(decode_step_s=args.decode_step_ms / 1000, output_tokens=10_000))
+    if mode == "fifo":
+        engine = FairQueueEngine(base, "fake", args.slots, interactive_slots=0)
+    else:
+        engine = FairQueueEngine(base, "fake", args.slots, interactive_slots=args.interactive_slots)
+
+    latencies = {}
+    stop = time.monotonic() + args.duration
+
+    async def one(tenant, priority, max_tokens):
+        CLIENT.set("all" if mode == "fifo" else tenant)
+        options = SimpleNamespace(priority="bulk" if mode == "fifo" else priority)
+        start = time.perf_counter()
+        await engine.generate("x", SimpleNamespace(max_tokens=max_tokens), options)
+        latencies.setdefault(tenant, []).append(time.perf_counter() - start)
+
+    async def closed_loop(tenant, max_tokens):
+        while time.monotonic() < stop:
+            await one(tenant, "bulk", max_tokens)
+
+    async def open_loop(tenant, rate, max_tokens):
+        tasks = []
+        while time.monotonic() < stop:
+            tasks.append(asyncio.ensure_future(one(tenant, "interactive", max_tokens)))
+            await asyncio.sleep(random.expovariate(rate))
+        await asyncio.gather(*tasks)
+
+    await asyncio.gather(
+        *(closed_loop("eval", args.bulk_tokens) for _ in range(args.bulk_concurrency)),
+        closed_loop("carol", args.bulk_tokens),
+        open_loop("alice", args.interactive_rate, args.interactive_tokens),
+        open_loop("bob", args.interactive_rate, args.interactive_tokens),
+    )
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modes", default="fifo,fair")
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--interactive-slots", type=int, default=2)
+    parser.add_argument("--bulk-concurrency", type=int, default=32)
+    parser.add_argument("--bulk-tokens", type=int, default=64)
+    parser.add_argument("--interactive-rate", type=float, default=2.0, help="запросов в секунду на клиента")
+    parser.add_argument("--interactive-tokens", type=int, default=16)
+    parser.add_argument("--decode-step-ms", type=float, default=5)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'mode':<6}{'tenant':<8}{'requests':>10}{'p50, ms':>10}{'p95, ms':>10}")
+    for mode in args.modes.split(","):
+        random.seed(args.seed)
+        latencies = asyncio.run(simulate(mode, args))
+        for tenant in ("alice", "bob", "carol", "eval"):
+            values = latencies.get(tenant, [])
+            if not values:
+                print(f"{mode:<6}{tenant:<8}{0:>10}")
+                continue
+            print(f"{mode:<6}{tenant:<8}{len(values):>10}"
+                  f"{percentile(values, 0.5) * 1000:>10.0f}{percentile(values, 0.95) * 1000:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Масштабирование пропускной способности с числом реплик за шлюзом.
+
+Поднимает K реплик-заглушек (MicroBatcher поверх FakeEngine, ограниченный
+размер батча — как у реальной GPU) и gateway.py перед ними, затем гоняет
+замкнутую нагрузку через шлюз и печатает req/s для каждого K.
+
+    python bench/bench_replicas.py --replicas 1,2,4 --concurrency 64 --duration 5
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import gateway
+from serving.batching import MicroBatcher
+from serving.engine import FakeEngine
+
+
+class GenerateRequest(BaseModel):
+    prompt: str
+    max_tokens: int = 32
+
+
+def build_replica(max_batch_size):
+    app = FastAPI()
+    engine = MicroBatcher(FakeEngine(), max_batch_size=max_batch_size)
+
+    @app.post("/generate_fake")
+    async def generate_fake(request: GenerateRequest):
+        output = await engine.generate(request.prompt, SimpleNamespace(max_tokens=request.max_tokens))
+        return {"response": output.outputs[0].text}
+
+    # Шлюз проверяет реплики по /health/ready; заглушка готова сразу
+    @app.get("/health/ready")
+    async def health_ready():
+        return {"status": "ready", "ready": True}
+
+    return app
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app):
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+async def drive(base_url, concurrency, duration):
+    stop = time.monotonic() + duration
+    completed = 0
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        async def user():
+            nonlocal completed
+            while time.monotonic() < stop:
+                response = await client.post("/generate_fake", json={"prompt": "привет " * 32})
+                response.raise_for_status()
+                completed += 1
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return completed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replicas", default="1,2,4")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    print(f"{'replicas':<10}{'req/s':>10}{'speedup':>10}")
+    baseline = None
+    for count in [int(x) for x in args.replicas.split(",")]:
+        replicas = [start_server(build_replica(args.max_batch_size)) for _ in range(count)]
+        gateway.workers = {
+            "fake": gateway.Worker("fake", [url for _, url in replicas], args.concurrency),
+        }
+        gateway_server, gateway_url = start_server(gateway.app)
+
+        completed = asyncio.run(drive(gateway_url, args.concurrency, args.duration))
+        throughput = completed / args.duration
+        baseline = baseline or throughput
+        print(f"{count:<10}{throughput:>10.1f}{throughput / baseline:>9.2f}x")
+
+        gateway_server.should_exit = True
+        for server, _ in replicas:
+            server.should_exit = True
+        time.sleep(0.5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Проверка API сессий (serving/sessions.py) на настоящих длинах контекста.
+
+У app_tlite и app_vikhr ``max_tokens`` равен всему ``max_model_len``
+(2048/2048 и 1024/1024), и запас на ответ раньше съедал весь контекст: любой
+ход сессии получал 413. Скрипт импортирует приложения с заглушкой движка
+(``LLM_ENGINE=fake``, без GPU, vllm и токенизатора модели) и для каждого
+проверяет, что:
+
+    - ходы сессии проходят, а промпт вместе с ``max_tokens`` ответа, который
+      получает движок, помещается в ``max_model_len`` приложения;
+    - длинная история обрезается по старым ходам, а не отвечает 413;
+    - при перегрузке (429) — и в обычном, и в потоковом режиме — и при
+      ошибке движка посреди потока сообщение пользователя не остаётся в
+      истории без ответа.
+
+    python bench/bench_sessions.py
+    python bench/bench_sessions.py app_yagpt app_deepseek
+"""
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+APPS = ["app_tlite", "app_vikhr", "app_yagpt", "app_deepseek", "app_gptoss"]
+
+
+class Spy:
+    """Подменяет ``engine.stream``: запоминает промпты и по запросу сбоит."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.original = engine.stream
+        self.calls = []
+        self.fail = None
+        engine.stream = self.stream
+
+    def stream(self, prompt, sampling_params, options=None):
+        self.calls.append((len(prompt["prompt_token_ids"]), sampling_params.max_tokens))
+        if self.fail == "overload":
+            from serving.admission import Overloaded
+            raise Overloaded("Сервис перегружен", 1, "requests")
+        outputs = self.original(prompt, sampling_params, options)
+        if self.fail == "midstream":
+            return self.broken(outputs)
+        return outputs
+
+    async def broken(self, outputs):
+        async for output in outputs:
+            yield output
+            raise RuntimeError("ошибка движка")
+
+
+def check(name, ok, detail=""):
+    print(f"   {'✅' if ok else '❌'} {name}{': ' + detail if detail else ''}")
+    return ok
+
+
+def run(app_name):
+    from fastapi.testclient import TestClient
+
+    module = importlib.import_module(app_name)
+    max_model_len = module.max_model_length
+    spy = Spy(module.engine)
+    results = []
+    print(f"🔧 {app_name}: max_model_len={max_model_len}")
+
+    with TestClient(module.app) as client:
+        session_id = client.post("/sessions").json()["session_id"]
+        url = f"/sessions/{session_id}/generate"
+
+        statuses = [client.post(url, json={"prompt": f"Вопрос номер {i}?"}).status_code for i in range(3)]
+        results.append(check("ходы сессии", statuses == [200] * 3, str(statuses)))
+        fits = all(prompt + max_tokens <= max_model_len for prompt, max_tokens in spy.calls)
+        results.append(check("промпт + max_tokens помещаются в контекст", fits, str(spy.calls[-1])))
+
+        # История длиннее контекста: старые ходы отбрасываются
+        for i in range(4):
+            client.post(f"/sessions/{session_id}/messages",
+                        json={"role": "user", "content": "слово " * (max_model_len // 4)})
+        response = client.post(url, json={"prompt": "И последний вопрос"})
+        body = response.json()
+        results.append(check(
+            "длинная история обрезается",
+            response.status_code == 200 and body.get("truncated_turns", 0) > 0,
+            f"{response.status_code}, truncated_turns={body.get('truncated_turns')}",
+        ))
+
+        turns = client.get(f"/sessions/{session_id}").json()["turns"]
+        for fail, stream in (("overload", False), ("overload", True), ("midstream", True)):
+            spy.fail = fail
+            response = client.post(url, json={"prompt": "Не должно остаться в истории", "stream": stream})
+            spy.fail = None
+            expected = 429 if fail == "overload" else 200
+            if fail == "midstream":
+                events = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line]
+                expected_body = any("error" in event for event in events)
+            else:
+                expected_body = True
+            after = client.get(f"/sessions/{session_id}").json()["turns"]
+            results.append(check(
+                f"{fail}, stream={stream}",
+                response.status_code == expected and expected_body and after == turns,
+                f"{response.status_code}, ходов {turns} → {after}",
+            ))
+    return all(results)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("apps", nargs="*", default=APPS)
+    args = parser.parse_args()
+
+    os.environ["LLM_ENGINE"] = "fake"
+    os.environ.setdefault("ENGINE_MODE", "batch")
+    if len(args.apps) == 1:
+        sys.exit(0 if run(args.apps[0].removesuffix(".py")) else 1)
+
+    # Каждое приложение — в своём процессе: слив и готовность у сервиса глобальные
+    ok = all([subprocess.run([sys.executable, __file__, app_name]).returncode == 0 for app_name in args.apps])
+    print("✅ Все проверки пройдены" if ok else "❌ Есть ошибки")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
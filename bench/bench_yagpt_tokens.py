@@ -0,0 +1,157 @@
+"""Паритет и накладные расходы CPU для токенного пайплайна app_yagpt.py.
+
+Раньше промпт проходил путь ``apply_chat_template(tokenize=True)[1:]`` →
+``decode`` → повторная токенизация в vLLM, а ответ ещё раз декодировался из
+``token_ids``. Теперь в движок уходят ID токенов из шаблона, а ответ берётся
+из ``.text``, который vLLM уже посчитал.
+
+Скрипт импортирует сам app_yagpt.py с заглушкой вместо модели
+(``LLM_ENGINE=fake``: настоящие токенизатор, ``ChatTemplate`` и ``prepare``,
+без GPU) и проверяет на наборе промптов, что ``prepare`` отдаёт движку те же
+самые ID токенов, что получал vLLM при старом пути, а также замеряет
+CPU-время на запрос до и после. Сверка кэша шаблона при старте выключена,
+чтобы проверялся именно быстрый путь, а не откат на полный рендеринг.
+С ``--engine`` дополнительно загружает модель в vLLM и проверяет, что ответы
+побайтно совпадают: при старом и новом промпте, и ``.text`` с ``decode``.
+
+    python bench/bench_yagpt_tokens.py
+    python bench/bench_yagpt_tokens.py --engine --max-tokens 64
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODEL_NAME = "yandex/YandexGPT-5-Lite-8B-instruct"
+
+PROMPTS = [
+    "Привет!",
+    "Расскажи анекдот про программиста.",
+    "Переведи на английский: «Мама мыла раму».",
+    "  Пробелы в начале и в конце  ",
+    "Многострочный\nзапрос\n\nс пустой строкой",
+    "Emoji 🚀🔥 и символы <s> </s> [INST] {json: true}",
+    "Код: def f(x):\n    return x ** 2  # квадрат",
+    "Очень длинный запрос. " * 200,
+    "Mixed language: что такое attention in transformers?",
+    "Числа 3.14159, 2,71828 и 1e-10",
+]
+
+
+def messages_for(prompt):
+    return [{"role": "user", "content": prompt}]
+
+
+def legacy_engine_ids(tokenizer, prompt):
+    """Старый путь: что получал vLLM после decode и повторной токенизации."""
+    input_ids = tokenizer.apply_chat_template(
+        messages_for(prompt), tokenize=True, add_generation_prompt=True
+    )[1:]
+    text = tokenizer.decode(input_ids)
+    # Так vLLM токенизирует текстовый промпт (с добавлением BOS)
+    return text, tokenizer(text).input_ids
+
+
+def load_app():
+    """app_yagpt с заглушкой вместо модели: настоящие токенизатор, шаблон и prepare."""
+    os.environ["LLM_ENGINE"] = "fake"
+    os.environ["ENGINE_MODE"] = "batch"
+    os.environ["CHAT_TEMPLATE_VERIFY"] = "false"
+    import app_yagpt
+    return app_yagpt
+
+
+def token_ids(app, prompt):
+    """Новый путь: ID, которые ``app_yagpt.prepare`` отдаёт движку."""
+    engine_prompt, _ = app.prepare(app.GenerateRequest(prompt=prompt))
+    return engine_prompt["prompt_token_ids"]
+
+
+def check_prompts(app):
+    tokenizer = app.tokenizer
+    failures = 0
+    for prompt in PROMPTS:
+        _, old_ids = legacy_engine_ids(tokenizer, prompt)
+        new_ids = token_ids(app, prompt)
+        if old_ids != new_ids:
+            failures += 1
+            print(f"❌ Промпт расходится: {prompt[:40]!r}")
+            print(f"   было:  {old_ids[:16]}... ({len(old_ids)} токенов)")
+            print(f"   стало: {new_ids[:16]}... ({len(new_ids)} токенов)")
+    print(f"Промпты: совпало {len(PROMPTS) - failures} из {len(PROMPTS)}")
+    return failures
+
+
+def check_outputs(app, max_tokens):
+    from vllm import LLM, SamplingParams
+
+    tokenizer = app.tokenizer
+    llm = LLM(model=MODEL_NAME, max_model_len=4096, gpu_memory_utilization=0.75)
+    params = SamplingParams(temperature=0, max_tokens=max_tokens)
+    legacy = [legacy_engine_ids(tokenizer, p)[0] for p in PROMPTS]
+    new = [{"prompt_token_ids": token_ids(app, p)} for p in PROMPTS]
+    legacy_outputs = llm.generate(legacy, params, use_tqdm=False)
+    new_outputs = llm.generate(new, params, use_tqdm=False)
+
+    failures = 0
+    for prompt, old, cur in zip(PROMPTS, legacy_outputs, new_outputs):
+        old_text = tokenizer.decode(old.outputs[0].token_ids, skip_special_tokens=True)
+        if old.prompt_token_ids != cur.prompt_token_ids:
+            failures += 1
+            print(f"❌ Движок получил разные промпты: {prompt[:40]!r}")
+        elif old_text.encode() != cur.outputs[0].text.encode():
+            failures += 1
+            print(f"❌ Ответ расходится: {prompt[:40]!r}")
+            print(f"   было:  {old_text[:80]!r}")
+            print(f"   стало: {cur.outputs[0].text[:80]!r}")
+    print(f"Ответы: совпало {len(PROMPTS) - failures} из {len(PROMPTS)}")
+    return failures
+
+
+def bench_cpu(app, iterations, output_tokens):
+    tokenizer = app.tokenizer
+    # Типичный ответ для замера декодирования
+    answer_ids = tokenizer("Ответ модели средней длины. " * 40).input_ids[:output_tokens]
+
+    def legacy(prompt):
+        _, ids = legacy_engine_ids(tokenizer, prompt)
+        tokenizer.decode(answer_ids, skip_special_tokens=True)
+        return ids
+
+    def current(prompt):
+        return token_ids(app, prompt)
+
+    results = {}
+    for name, fn in (("было", legacy), ("стало", current)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for prompt in PROMPTS:
+                fn(prompt)
+        results[name] = (time.perf_counter() - start) / (iterations * len(PROMPTS))
+    print(f"CPU на запрос (шаблон, токенизация, декодирование ответа из {len(answer_ids)} токенов):")
+    for name, seconds in results.items():
+        print(f"   {name:<6} {seconds * 1e6:>9.1f} мкс")
+    print(f"   ускорение: {results['было'] / results['стало']:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", action="store_true", help="проверить и ответы модели (нужна GPU)")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--output-tokens", type=int, default=256)
+    args = parser.parse_args()
+
+    app = load_app()
+
+    failures = check_prompts(app)
+    if args.engine:
+        failures += check_outputs(app, args.max_tokens)
+    bench_cpu(app, args.iterations, args.output_tokens)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
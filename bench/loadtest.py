@@ -0,0 +1,391 @@
+"""Нагрузочный тест любого app_*.py с воспроизводимым результатом в JSON.
+
+Запускает сервис отдельным процессом (по умолчанию на CPU-заглушке движка,
+LLM_ENGINE=fake — не нужны ни GPU, ни пакет vllm, ни токенизатор модели,
+вместо них заглушки из ``serving/fake.py``), ждёт ``/health/ready`` и
+подаёт нагрузку на эндпоинт генерации:
+
+    closed — ``--concurrency`` клиентов, каждый шлёт следующий запрос сразу
+             после ответа на предыдущий (пропускная способность)
+    open   — пуассоновский поток ``--rate`` запросов в секунду, не ждёт ответов
+             (задержка при заданной нагрузке, как у живых пользователей)
+
+Длины промптов — логнормальные (``--prompt-words``, ``--prompt-sigma``),
+длины ответов задаёт заглушка (``--output-tokens``, по умолчанию
+``lognormal:128:0.8``); всё детерминировано ``--seed``. Запросы идут
+потоком (SSE), поэтому меряется и TTFT. Для каждого уровня нагрузки
+печатаются и пишутся в ``--out`` пропускная способность, TTFT и задержка
+(p50/p95/p99); в JSON также коммит и параметры прогона.
+
+    python bench/loadtest.py app_tlite.py --load closed --concurrency 1,8,32 --out tlite.json
+    python bench/loadtest.py app_yagpt.py --engine-mode async --load open --rate 2,8,32 \\
+        --env FAIR_SLOTS=16 --out yagpt.json
+    python bench/loadtest.py --url http://127.0.0.1:8083 --endpoint /generate_tlite  # уже запущенный сервис
+    python bench/loadtest.py --compare before.json after.json
+
+Сравнение показывает изменение каждой метрики между прогонами (например,
+до и после коммита) на одинаковых уровнях нагрузки.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "модель запрос ответ данные сервис время система пример вопрос текст "
+    "задача работа результат пользователь функция значение список ошибка "
+    "расскажи объясни подробно кратко почему как когда где сравни опиши"
+).split()
+
+# Метрики в сравнении: чем больше, тем лучше — у остальных наоборот
+HIGHER_IS_BETTER = ("throughput_rps", "output_tokens_per_s")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def summary(values):
+    if not values:
+        return None
+    return {
+        "mean": sum(values) / len(values),
+        "p50": percentile(values, 0.5),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values),
+    }
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(dirty)
+
+
+def prompts(seed, median_words, sigma):
+    """Бесконечный детерминированный поток промптов логнормальной длины."""
+    rng = random.Random(seed)
+    while True:
+        n = max(round(rng.lognormvariate(math.log(median_words), sigma)), 1)
+        yield " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def start_service(app, port, args):
+    env = {
+        **os.environ,
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        "LLM_ENGINE": args.engine,
+        "ENGINE_MODE": args.engine_mode,
+        "FAKE_PREFILL_TPS": str(args.prefill_tps),
+        "FAKE_DECODE_STEP_MS": str(args.decode_step_ms),
+        "FAKE_OUTPUT_TOKENS": args.output_tokens,
+        "REQUEST_LOG": "false",
+    }
+    for item in args.env:
+        key, _, value = item.partition("=")
+        env[key] = value
+    log = tempfile.NamedTemporaryFile("w", prefix="loadtest-", suffix=".log", delete=False)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "serving.launcher", os.path.join(ROOT, app)],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return process, log.name
+
+
+def wait_ready(base_url, process, timeout):
+    """Ждёт ``/health/ready``; возвращает время до готовности."""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"сервис завершился с кодом {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/health/ready", timeout=5).status_code == 200:
+                return time.monotonic() - start
+        except httpx.TransportError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"сервис не стал готов за {timeout:.0f} с")
+
+
+def find_endpoint(base_url):
+    """Первый POST ``/generate_*`` из OpenAPI, кроме батч-эндпоинта."""
+    spec = httpx.get(f"{base_url}/openapi.json", timeout=10).json()
+    for path, methods in spec.get("paths", {}).items():
+        if "post" in methods and path.startswith("/generate") and not path.endswith("_batch"):
+            return path
+    raise RuntimeError("не найден эндпоинт генерации, укажите --endpoint")
+
+
+class Run:
+    """Результаты одного уровня нагрузки."""
+
+    def __init__(self):
+        self.ttft = []
+        self.latency = []
+        self.output_tokens = 0
+        self.statuses = {}
+        self.first_sent = None
+        self.last_done = None
+
+    def count(self, status):
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    def result(self, load, level):
+        ok = self.statuses.get("200", 0)
+        elapsed = (self.last_done - self.first_sent) if ok else 0.0
+        return {
+            "load": load,
+            "level": level,
+            "requests": sum(self.statuses.values()),
+            "ok": ok,
+            "statuses": dict(sorted(self.statuses.items())),
+            "elapsed_s": elapsed,
+            "throughput_rps": ok / elapsed if elapsed else 0.0,
+            "output_tokens_per_s": self.output_tokens / elapsed if elapsed else 0.0,
+            "ttft_s": summary(self.ttft),
+            "latency_s": summary(self.latency),
+        }
+
+
+async def send(client, endpoint, prompt, stream, run):
+    start = time.perf_counter()
+    if run.first_sent is None:
+        run.first_sent = start
+    payload = {"prompt": prompt, "stream": stream}
+    try:
+        if not stream:
+            response = await client.post(endpoint, json=payload)
+            run.count(str(response.status_code))
+            if response.status_code == 200:
+                done = time.perf_counter()
+                run.ttft.append(done - start)
+                run.latency.append(done - start)
+                run.last_done = done
+            return
+
+        ttft = None
+        async with client.stream("POST", endpoint, json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                run.count(str(response.status_code))
+                return
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if "error" in event:
+                    run.count("stream_error")
+                    return
+                if ttft is None and ("delta" in event or "reasoning" in event):
+                    ttft = time.perf_counter() - start
+                if event.get("done"):
+                    run.output_tokens += event.get("usage", {}).get("completion_tokens", 0)
+        done = time.perf_counter()
+        run.count("200")
+        run.ttft.append(ttft if ttft is not None else done - start)
+        run.latency.append(done - start)
+        run.last_done = done
+    except httpx.HTTPError as e:
+        run.count(type(e).__name__)
+
+
+async def closed_loop(base_url, endpoint, concurrency, source, args):
+    run = Run()
+    stop = time.monotonic() + args.duration
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        async def worker():
+            while time.monotonic() < stop:
+                await send(client, endpoint, next(source), not args.no_stream, run)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return run
+
+
+async def open_loop(base_url, endpoint, rate, source, args):
+    run = Run()
+    # Отдельный генератор для интервалов: те же промпты при любой интенсивности
+    arrivals = random.Random(args.seed)
+    stop = time.monotonic() + args.duration
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        tasks = []
+        while time.monotonic() < stop:
+            tasks.append(asyncio.ensure_future(send(client, endpoint, next(source), not args.no_stream, run)))
+            await asyncio.sleep(arrivals.expovariate(rate))
+        await asyncio.gather(*tasks)
+    return run
+
+
+def fmt_ms(stats, key):
+    return f"{stats[key] * 1000:>9.0f}" if stats else f"{'-':>9}"
+
+
+def print_header():
+    print(f"{'load':<7}{'level':>7}{'ok':>7}{'err':>6}{'req/s':>8}{'tok/s':>8}"
+          f"{'ttft50':>9}{'ttft99':>9}{'p50':>9}{'p95':>9}{'p99':>9}   (мс)")
+
+
+def print_result(result):
+    errors = result["requests"] - result["ok"]
+    print(f"{result['load']:<7}{result['level']:>7g}{result['ok']:>7}{errors:>6}"
+          f"{result['throughput_rps']:>8.1f}{result['output_tokens_per_s']:>8.0f}"
+          f"{fmt_ms(result['ttft_s'], 'p50')}{fmt_ms(result['ttft_s'], 'p99')}"
+          f"{fmt_ms(result['latency_s'], 'p50')}{fmt_ms(result['latency_s'], 'p95')}"
+          f"{fmt_ms(result['latency_s'], 'p99')}")
+
+
+def metric_values(result):
+    values = {key: result[key] for key in HIGHER_IS_BETTER}
+    for group in ("ttft_s", "latency_s"):
+        for q in ("p50", "p95", "p99"):
+            if result[group]:
+                values[f"{group}.{q}"] = result[group][q]
+    return values
+
+
+def compare(base, new):
+    print(f"Базовый прогон: {base['meta'].get('commit')}  новый: {new['meta'].get('commit')}")
+    print(f"{'load':<7}{'level':>7}  {'metric':<20}{'base':>10}{'new':>10}{'change':>9}")
+    base_results = {(r["load"], r["level"]): r for r in base["results"]}
+    for result in new["results"]:
+        key = (result["load"], result["level"])
+        if key not in base_results:
+            continue
+        old_values = metric_values(base_results[key])
+        for metric, value in metric_values(result).items():
+            old = old_values.get(metric)
+            if not old:
+                continue
+            change = (value - old) / old * 100
+            worse = change < 0 if metric in HIGHER_IS_BETTER else change > 0
+            mark = " ⚠️" if worse and abs(change) >= 10 else ""
+            print(f"{key[0]:<7}{key[1]:>7g}  {metric:<20}{old:>10.3f}{value:>10.3f}{change:>+8.1f}%{mark}")
+
+
+def run_levels(base_url, endpoint, args):
+    results = []
+    print_header()
+    for level in args.levels:
+        # Каждый уровень получает одну и ту же последовательность промптов
+        source = prompts(args.seed, args.prompt_words, args.prompt_sigma)
+        if args.load == "closed":
+            run = asyncio.run(closed_loop(base_url, endpoint, int(level), source, args))
+        else:
+            run = asyncio.run(open_loop(base_url, endpoint, level, source, args))
+        result = run.result(args.load, level)
+        print_result(result)
+        results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("app", nargs="?", help="app_*.py, который запустить (или --url)")
+    parser.add_argument("--url", help="адрес уже запущенного сервиса")
+    parser.add_argument("--endpoint", help="по умолчанию первый /generate_* из OpenAPI")
+    parser.add_argument("--engine", default="fake", choices=("fake", "vllm"), help="LLM_ENGINE сервиса")
+    parser.add_argument("--engine-mode", default="batch", choices=("batch", "async"))
+    parser.add_argument("--prefill-tps", type=float, default=20000, help="скорость prefill заглушки, токенов/с")
+    parser.add_argument("--decode-step-ms", type=float, default=20, help="шаг декода заглушки")
+    parser.add_argument("--output-tokens", default="lognormal:128:0.8", help="FAKE_OUTPUT_TOKENS")
+    parser.add_argument("--env", action="append", default=[], help="KEY=VALUE для сервиса, можно несколько")
+    parser.add_argument("--load", default="closed", choices=("closed", "open"))
+    parser.add_argument("--concurrency", default="1,8,32", help="уровни для closed")
+    parser.add_argument("--rate", default="1,4,16", help="уровни для open, запросов в секунду")
+    parser.add_argument("--duration", type=float, default=20, help="секунд на уровень")
+    parser.add_argument("--prompt-words", type=float, default=60, help="медиана длины промпта, слов")
+    parser.add_argument("--prompt-sigma", type=float, default=0.7)
+    parser.add_argument("--no-stream", action="store_true", help="обычные запросы (TTFT = задержка)")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--startup-timeout", type=float, default=900)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="куда записать JSON")
+    parser.add_argument("--compare", nargs="+", metavar="JSON",
+                        help="BASE [NEW]: сравнить прогоны; с одним файлом — с текущим прогоном")
+    args = parser.parse_args()
+
+    if args.compare and not (args.app or args.url):
+        if len(args.compare) != 2:
+            parser.error("без app/--url для --compare нужны два файла")
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            compare(json.load(f), json.load(g))
+        return
+    if not (args.app or args.url):
+        parser.error("укажите app_*.py или --url")
+    args.levels = [float(x) for x in (args.concurrency if args.load == "closed" else args.rate).split(",")]
+
+    process = log_path = None
+    if args.url:
+        base_url = args.url.rstrip("/")
+    else:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        process, log_path = start_service(args.app, port, args)
+        print(f"🚀 {args.app} (LLM_ENGINE={args.engine}, ENGINE_MODE={args.engine_mode}), лог: {log_path}")
+
+    try:
+        startup_s = wait_ready(base_url, process, args.startup_timeout)
+        endpoint = args.endpoint or find_endpoint(base_url)
+        print(f"✅ Готов за {startup_s:.1f} с, нагрузка на {endpoint}")
+        results = run_levels(base_url, endpoint, args)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    commit, dirty = git_commit()
+    report = {
+        "meta": {
+            "commit": commit,
+            "dirty": dirty,
+            "started_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "app": args.app,
+            "url": args.url,
+            "endpoint": endpoint,
+            "startup_s": startup_s if process is not None else None,
+            "args": {k: v for k, v in vars(args).items() if k not in ("compare", "out")},
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 Результаты: {args.out}")
+    if args.compare:
+        with open(args.compare[0]) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
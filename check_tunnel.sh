@@ -35,19 +35,17 @@ fi
 echo ""
 
 echo "2️⃣ Проверка локального сервера:"
-if curl -s --max-time 2 http://localhost:$PORT/docs >/dev/null 2>&1; then
-    echo "✅ Сервер отвечает на http://localhost:$PORT/docs"
-    RESPONSE=$(curl -s http://localhost:$PORT/docs 2>/dev/null)
-    if echo "$RESPONSE" | grep -q "swagger\|fastapi\|openapi" 2>/dev/null; then
-        echo "✅ Это FastAPI Swagger UI"
+if curl -s --max-time 2 http://localhost:$PORT/health/live >/dev/null 2>&1; then
+    echo "✅ Сервер жив: http://localhost:$PORT/health/live"
+    READY=$(curl -s --max-time 2 -w "\n%{http_code}" http://localhost:$PORT/health/ready 2>/dev/null)
+    if [ "$(echo "$READY" | tail -1)" = "200" ]; then
+        echo "✅ Модель загружена и прогрета"
     else
-        echo "⚠️  Ответ не похож на FastAPI Swagger UI"
-        echo "   Первые 200 символов ответа:"
-        echo "$RESPONSE" | head -c 200
-        echo ""
+        echo "⏳ Модель ещё не готова (загрузка или прогрев)"
     fi
+    echo "   Состояние: $(echo "$READY" | head -1)"
 else
-    echo "❌ Сервер не отвечает на http://localhost:$PORT/docs"
+    echo "❌ Сервер не отвечает на http://localhost:$PORT/health/live"
 fi
 echo ""
 
@@ -91,21 +89,14 @@ fi
 if [ -n "$URL" ]; then
     echo "✅ Найден URL: $URL"
     echo ""
-    echo "   Проверка доступности /docs:"
-    if curl -s --max-time 10 "$URL/docs" >/dev/null 2>&1; then
-        echo "✅ URL доступен"
-        RESPONSE=$(curl -s "$URL/docs" 2>/dev/null)
-        if echo "$RESPONSE" | grep -q "swagger\|fastapi\|openapi" 2>/dev/null; then
-            echo "✅ Это FastAPI Swagger UI"
-        else
-            echo "⚠️  Ответ не похож на FastAPI Swagger UI"
-            echo "   Первые 200 символов ответа:"
-            echo "$RESPONSE" | head -c 200
-            echo ""
-            echo "   Это может быть проблема - туннель проксирует не тот сервис"
-        fi
+    echo "   Проверка доступности /health/ready:"
+    if curl -sf --max-time 10 "$URL/health/ready" >/dev/null 2>&1; then
+        echo "✅ URL доступен, модель готова"
+    elif curl -sf --max-time 10 "$URL/health/live" >/dev/null 2>&1; then
+        echo "⏳ URL доступен, но модель ещё не готова"
     else
-        echo "❌ URL не доступен"
+        echo "❌ URL не доступен или ведёт не на наш сервис"
+        echo "   Это может быть проблема - туннель проксирует не тот сервис"
     fi
 else
     echo "❌ URL не найден"
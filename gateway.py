@@ -0,0 +1,366 @@
+"""Единый шлюз ко всем моделям: один порт и один туннель вместо пяти.
+
+Шлюз проксирует ``/generate_{model}`` (и ``/generate_{model}_batch``) на
+процесс нужной модели, а также принимает унифицированный
+``POST /v1/generate`` с полем ``model``. Соединения к воркерам держатся в
+общем пуле keep-alive, а число одновременных запросов к каждой модели
+ограничено отдельно.
+
+У модели может быть несколько реплик (например, по одной на GPU). Запрос
+уходит реплике с наименьшим числом токенов в обработке; реплики, не
+отвечающие на health-проверку, временно исключаются и возвращаются после
+восстановления. Новую реплику можно добавить на ходу через
+``POST /gateway/replicas`` (только администратор, см. ``ADMIN_TOKEN``). Реплика в drain (см. ``serving.drain``)
+отвечает 503 с ``X-Draining`` — такие запросы шлюз сразу повторяет на
+другой реплике, поэтому перезапуск по одной реплике (``replicas.sh
+restart``) проходит для клиентов без ошибок.
+
+Переменные окружения:
+    GATEWAY_WORKERS  — "tlite=http://127.0.0.1:8083|http://127.0.0.1:8093,yagpt=http://127.0.0.1:8081"
+                       (по умолчанию — порты из run.sh; реплики через "|")
+    GATEWAY_LIMITS   — "deepseek=4,tlite=32": одновременных запросов на модель
+    GATEWAY_DEFAULT_LIMIT — лимит для остальных моделей, по умолчанию 64
+    GATEWAY_HEALTH_PATH   — путь health-проверки реплик, по умолчанию /health/ready
+                            (реплика получает трафик только после прогрева)
+    GATEWAY_HEALTH_INTERVAL_S — период health-проверки, по умолчанию 5
+    ADMIN_TOKEN      — токен (заголовок ``X-Admin-Token``) для ``/gateway/replicas``;
+                       без него менять реплики можно только с localhost напрямую
+"""
+import asyncio
+import json
+import os
+from contextlib import asynccontextmanager
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from serving.drain import admin_allowed
+
+# Порты по умолчанию совпадают с run.sh
+DEFAULT_WORKERS = {
+    "yagpt": "http://127.0.0.1:8081",
+    "vikhr": "http://127.0.0.1:8082",
+    "tlite": "http://127.0.0.1:8083",
+    "gptoss": "http://127.0.0.1:8084",
+    "deepseek": "http://127.0.0.1:8085",
+}
+
+# Заголовки ответа воркера, которые имеет смысл отдать клиенту
+PASSTHROUGH_HEADERS = ("retry-after", "cache-control", "x-accel-buffering")
+
+# Заголовки запроса, по которым воркер различает клиентов (лимиты, приоритеты, дедлайны)
+FORWARD_HEADERS = ("x-api-key", "authorization", "x-tenant", "x-request-timeout",
+                   "cf-connecting-ip", "x-forwarded-for")
+
+# Оценка длины ответа, если клиент не передал max_tokens
+DEFAULT_MAX_TOKENS = 1024
+
+HEALTH_PATH = os.environ.get("GATEWAY_HEALTH_PATH", "/health/ready")
+HEALTH_INTERVAL_S = float(os.environ.get("GATEWAY_HEALTH_INTERVAL_S", "5"))
+
+
+def parse_pairs(value):
+    pairs = {}
+    for item in value.split(","):
+        if "=" in item:
+            key, val = item.split("=", 1)
+            pairs[key.strip()] = val.strip()
+    return pairs
+
+
+def estimate_tokens(payload):
+    """Грубая оценка работы запроса: ~4 символа на токен промпта плюс max_tokens."""
+    items = payload.get("items") if isinstance(payload, dict) else None
+    if items is None:
+        items = [payload] if isinstance(payload, dict) else []
+    total = 0
+    for item in items:
+        if isinstance(item, dict):
+            total += len(str(item.get("prompt", ""))) // 4
+            total += int(item.get("max_tokens") or DEFAULT_MAX_TOKENS)
+    return max(total, 1)
+
+
+class Replica:
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        self.in_flight = 0
+        self.in_flight_tokens = 0
+        self.total = 0
+        self.errors = 0
+
+    def status(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "in_flight_tokens": self.in_flight_tokens,
+            "total": self.total,
+            "errors": self.errors,
+        }
+
+
+class Worker:
+    """Модель за шлюзом: набор реплик и общий лимит одновременных запросов."""
+
+    def __init__(self, name, urls, limit):
+        self.name = name
+        self.replicas = [Replica(url) for url in urls]
+        self.limit = limit
+        self.semaphore = asyncio.Semaphore(limit)
+        self.in_flight = 0
+        self.total = 0
+        self.errors = 0
+
+    def add_replica(self, url):
+        url = url.rstrip("/")
+        for replica in self.replicas:
+            if replica.url == url:
+                return replica
+        replica = Replica(url)
+        self.replicas.append(replica)
+        return replica
+
+    def remove_replica(self, url):
+        url = url.rstrip("/")
+        self.replicas = [r for r in self.replicas if r.url != url]
+
+    def pick(self, exclude=()):
+        candidates = [r for r in self.replicas if r.healthy and r not in exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda r: (r.in_flight_tokens, r.in_flight))
+
+    def status(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "total": self.total,
+            "errors": self.errors,
+            "replicas": [r.status() for r in self.replicas],
+        }
+
+
+def load_workers():
+    urls = parse_pairs(os.environ.get("GATEWAY_WORKERS", "")) or DEFAULT_WORKERS
+    limits = parse_pairs(os.environ.get("GATEWAY_LIMITS", ""))
+    default_limit = int(os.environ.get("GATEWAY_DEFAULT_LIMIT", "64"))
+    return {
+        name: Worker(name, url.split("|"), int(limits.get(name, default_limit)))
+        for name, url in urls.items()
+    }
+
+
+workers = load_workers()
+client = None
+
+
+async def check_replica(replica):
+    try:
+        response = await client.get(replica.url + HEALTH_PATH, timeout=2.0)
+        healthy = response.status_code == 200
+    except httpx.HTTPError:
+        healthy = False
+    if healthy != replica.healthy:
+        print(f"{'✅' if healthy else '⚠️ '} Реплика {replica.url}: "
+              f"{'снова в строю' if healthy else 'исключена из ротации'}")
+    replica.healthy = healthy
+
+
+async def health_loop():
+    while True:
+        replicas = [r for worker in workers.values() for r in worker.replicas]
+        await asyncio.gather(*(check_replica(r) for r in replicas))
+        await asyncio.sleep(HEALTH_INTERVAL_S)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global client
+    # Один пул соединений на все модели; read-таймаута нет — генерации длинные
+    max_connections = sum(w.limit for w in workers.values()) or 64
+    client = httpx.AsyncClient(
+        timeout=httpx.Timeout(connect=5.0, read=None, write=30.0, pool=None),
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        ),
+    )
+    health_task = asyncio.ensure_future(health_loop())
+    yield
+    health_task.cancel()
+    await client.aclose()
+
+
+app = FastAPI(title="LLM Gateway", lifespan=lifespan)
+
+
+def get_worker(name):
+    worker = workers.get(name)
+    if worker is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Неизвестная модель: {name}. Доступные: {', '.join(sorted(workers))}",
+        )
+    return worker
+
+
+def client_headers(request):
+    headers = {k: v for k, v in request.headers.items() if k.lower() in FORWARD_HEADERS}
+    if "cf-connecting-ip" not in headers and "x-forwarded-for" not in headers and request.client:
+        headers["x-forwarded-for"] = request.client.host
+    return headers
+
+
+async def send_to_replica(worker, path, body, tokens, headers=None):
+    """Отправляет запрос наименее загруженной реплике.
+
+    Если реплика не принимает соединение или останавливается (503 с
+    ``X-Draining``), запрос она не выполняла — пробуем следующую, а эту
+    исключаем до ближайшей успешной health-проверки.
+    """
+    tried = []
+    while True:
+        replica = worker.pick(exclude=tried)
+        if replica is None:
+            raise HTTPException(status_code=503, detail=f"Нет доступных реплик {worker.name}")
+        tried.append(replica)
+        # Нагрузку учитываем до отправки: заголовки ответа придут только
+        # после генерации, а следующие запросы должны видеть занятость сразу
+        replica.in_flight += 1
+        replica.in_flight_tokens += tokens
+        try:
+            upstream = await client.send(
+                client.build_request(
+                    "POST",
+                    replica.url + path,
+                    content=body,
+                    headers={"content-type": "application/json", **(headers or {})},
+                ),
+                stream=True,
+            )
+        except httpx.HTTPError as e:
+            replica.in_flight -= 1
+            replica.in_flight_tokens -= tokens
+            replica.errors += 1
+            if isinstance(e, httpx.ConnectError):
+                replica.healthy = False
+                continue
+            raise HTTPException(status_code=502, detail=f"Реплика {replica.url} недоступна: {e}")
+        if upstream.status_code == 503 and upstream.headers.get("x-draining"):
+            # Реплика останавливается (drain) и запрос не выполняла — повторяем на другой
+            await upstream.aclose()
+            replica.in_flight -= 1
+            replica.in_flight_tokens -= tokens
+            replica.healthy = False
+            continue
+        replica.total += 1
+        return replica, upstream
+
+
+async def forward(worker, path, body, headers=None):
+    try:
+        tokens = estimate_tokens(json.loads(body))
+    except ValueError:
+        tokens = DEFAULT_MAX_TOKENS
+
+    await worker.semaphore.acquire()
+    worker.in_flight += 1
+    worker.total += 1
+
+    def release():
+        worker.in_flight -= 1
+        worker.semaphore.release()
+
+    try:
+        replica, upstream = await send_to_replica(worker, path, body, tokens, headers)
+    except HTTPException:
+        worker.errors += 1
+        release()
+        raise
+
+    async def relay():
+        # Отдаём ответ по мере поступления, чтобы SSE-потоки не буферизовались
+        try:
+            async for chunk in upstream.aiter_raw():
+                yield chunk
+        finally:
+            await upstream.aclose()
+            replica.in_flight -= 1
+            replica.in_flight_tokens -= tokens
+            release()
+
+    headers = {k: v for k, v in upstream.headers.items() if k.lower() in PASSTHROUGH_HEADERS}
+    return StreamingResponse(
+        relay(),
+        status_code=upstream.status_code,
+        media_type=upstream.headers.get("content-type"),
+        headers=headers,
+    )
+
+
+@app.post("/v1/generate")
+async def generate_unified(request: Request):
+    try:
+        payload = json.loads(await request.body())
+        model = payload.pop("model")
+    except (ValueError, KeyError, AttributeError):
+        raise HTTPException(status_code=422, detail="Ожидается JSON-объект с полем model")
+    worker = get_worker(model)
+    return await forward(worker, f"/generate_{model}", json.dumps(payload).encode("utf-8"), client_headers(request))
+
+
+@app.post("/generate_{model}")
+async def generate_model(model: str, request: Request):
+    body = await request.body()
+    if model.endswith("_batch"):
+        return await forward(get_worker(model[: -len("_batch")]), "/generate_batch", body, client_headers(request))
+    return await forward(get_worker(model), f"/generate_{model}", body, client_headers(request))
+
+
+class ReplicaRequest(BaseModel):
+    model: str
+    url: str
+
+
+def require_admin(http_request):
+    # Шлюз открыт наружу через туннель: менять реплики может только администратор
+    if not admin_allowed(http_request):
+        raise HTTPException(status_code=403, detail="Нужен X-Admin-Token")
+
+
+@app.post("/gateway/replicas")
+async def add_replica(request: ReplicaRequest, http_request: Request):
+    require_admin(http_request)
+    # Новые модели не заводятся на ходу — только реплики уже настроенных
+    worker = get_worker(request.model)
+    replica = worker.add_replica(request.url)
+    # До первой health-проверки реплика не получает трафик
+    replica.healthy = False
+    await check_replica(replica)
+    return worker.status()
+
+
+@app.delete("/gateway/replicas")
+async def remove_replica(request: ReplicaRequest, http_request: Request):
+    require_admin(http_request)
+    get_worker(request.model).remove_replica(request.url)
+    return workers[request.model].status()
+
+
+@app.get("/gateway/status")
+async def gateway_status():
+    return {name: worker.status() for name, worker in workers.items()}
+
+
+if __name__ == "__main__":
+    host = os.environ.get("HOST", "0.0.0.0")
+    port = int(os.environ.get("PORT", "8000"))
+    print(f"🌐 Шлюз на порту {port}, модели:")
+    for name, worker in workers.items():
+        print(f"   {name}: {', '.join(r.url for r in worker.replicas)} (лимит {worker.limit})")
+    uvicorn.run(app, host=host, port=port)
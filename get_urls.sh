@@ -7,6 +7,19 @@
 echo "🌐 Cloudflare Tunnel URLs:"
 echo ""
 
+# Шлюз (все модели через один URL)
+if tmux has-session -t gateway-tunnel 2>/dev/null; then
+    URL=$(tmux capture-pane -t gateway-tunnel -p | grep -o 'https://[a-z0-9-]*\.trycloudflare\.com' | head -1)
+    if [ -n "$URL" ]; then
+        echo "Шлюз (порт 8000):"
+        echo "  URL: $URL"
+        echo "  Endpoints: POST $URL/generate_{tlite,yagpt,vikhr}"
+        echo "             POST $URL/v1/generate  {\"model\": \"tlite\", \"prompt\": \"...\"}"
+        echo "  Статус: $URL/gateway/status"
+        echo ""
+    fi
+fi
+
 # T-lite
 if tmux has-session -t tlite-tunnel 2>/dev/null; then
     URL=$(tmux capture-pane -t tlite-tunnel -p | grep -o 'https://[a-z0-9-]*\.trycloudflare\.com' | head -1)
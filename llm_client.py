@@ -0,0 +1,381 @@
+"""Клиент к сервисам моделей: пул соединений, параллельные запросы, авто-батчинг.
+
+Вместо ``requests.post`` на каждый запрос (новое TLS-соединение через
+trycloudflare.com) клиент держит пул keep-alive соединений (HTTP/2, если
+установлен пакет ``h2``), ограничивает число одновременных запросов и
+повторяет перегруженные запросы (429/502/503) с экспоненциальной задержкой
+со случайным разбросом, не раньше ``Retry-After`` от сервера.
+
+С ``auto_batch=True`` небольшие одиночные запросы, пришедшие почти
+одновременно, клиент сам складывает в батч-эндпоинт
+(``/generate_{model}_batch`` у шлюза, ``/generate_batch`` у воркера). Батч
+отвечает только ``{"response": ...}``, поэтому авто-батчинг выключен по
+умолчанию, а запросы с полями, меняющими ответ (``n``, ``best_of``,
+``reasoning`` и т.п.), всегда идут по одному. Если батч-эндпоинта нет или
+сервер отклонил батч целиком, запросы тоже идут по одному.
+
+Асинхронно:
+
+    async with AsyncLLMClient("https://xxx.trycloudflare.com", "tlite") as client:
+        result = await client.generate("Привет!")
+        results = await client.gather(["раз", "два", "три"], concurrency=16)
+        async for delta in client.stream("Расскажи сказку"):
+            print(delta, end="")
+
+Синхронно (тот же клиент в фоновом потоке со своим event loop):
+
+    with LLMClient("http://127.0.0.1:8000", "yagpt") as client:
+        print(client.generate("Привет!")["response"])
+        for result in client.map(prompts, concurrency=8, temperature=0.0):
+            ...
+
+По умолчанию запросы идут на ``/generate_{model}``; другой путь задаёт
+``path`` (например, ``path="/generate"`` для app_generic.py, батч — ``path + "_batch"``).
+
+    pip install httpx  # h2 — по желанию, для HTTP/2
+"""
+import asyncio
+import email.utils
+import json
+import random
+import threading
+import time
+
+import httpx
+
+# Повторяем перегрузку и недоступность; 504 — истёк дедлайн запроса, повтор не поможет
+RETRY_STATUSES = (429, 502, 503)
+# Обрыв соединения (туннель); таймаут чтения не повторяем — генерация уже шла
+RETRY_ERRORS = (httpx.NetworkError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+
+class LLMError(Exception):
+    def __init__(self, status_code, detail, retry_after=None):
+        super().__init__(f"{status_code}: {detail}")
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status_code in RETRY_STATUSES
+
+
+# Поля, при которых одиночный эндпоинт отвечает не только ``{"response": ...}``:
+# такие запросы в батч не складываем
+UNBATCHABLE_FIELDS = ("stream", "n", "best_of", "reasoning", "reasoning_budget")
+
+
+class _NoBatchEndpoint(Exception):
+    pass
+
+
+def parse_retry_after(value):
+    """``Retry-After`` в секундах: число или HTTP-дата."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(email.utils.parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def http2_available():
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def error_from_response(response):
+    try:
+        detail = response.json().get("detail", response.text)
+    except ValueError:
+        detail = response.text
+    return LLMError(response.status_code, detail, parse_retry_after(response.headers.get("retry-after")))
+
+
+class _Batcher:
+    """Складывает одиночные запросы в вызовы батч-эндпоинта."""
+
+    def __init__(self, client, max_size, wait_s):
+        self.client = client
+        self.max_size = max_size
+        self.wait_s = wait_s
+        self.path = None
+        self.available = True
+        self._pending = []
+        self._timer = None
+
+    def submit(self, payload):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((payload, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.wait_s, self._flush)
+        return future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, self._pending = self._pending, []
+        if items:
+            asyncio.ensure_future(self._send(items))
+
+    async def _post(self, items):
+        body = {"items": [payload for payload, _ in items]}
+        paths = [self.path] if self.path else self.client.batch_paths()
+        for path in paths:
+            response = await self.client.http.post(path, json=body)
+            if response.status_code in (404, 405):
+                continue
+            self.path = path
+            return response
+        self.available = False
+        raise _NoBatchEndpoint()
+
+    async def _send_single(self, payload, future):
+        try:
+            result = await self.client._post_single(payload)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+
+    async def _send(self, items):
+        try:
+            response = await self._post(items)
+            if response.status_code == 200:
+                results = response.json()["responses"]
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        if response.status_code != 200:
+            # Батч отклонён целиком (422 из-за одного элемента, 503 и т.п.) —
+            # отправляем элементы по одному, чтобы каждый получил свой ответ
+            await asyncio.gather(*(self._send_single(payload, future) for payload, future in items))
+            return
+        self.client.batches += 1
+        for (_, future), result in zip(items, results):
+            if future.done():
+                continue
+            if "error" in result:
+                status_code = result.get("status_code") or (429 if "retry_after" in result else 500)
+                future.set_exception(LLMError(status_code, result["error"], result.get("retry_after")))
+            else:
+                future.set_result(result)
+
+
+class AsyncLLMClient:
+    def __init__(self, base_url, model, api_key=None, tenant=None, timeout=300.0,
+                 max_connections=64, http2=None, retries=4, backoff_s=0.5, max_backoff_s=30.0,
+                 auto_batch=False, batch_size=32, batch_wait_ms=5.0, path=None):
+        self.model = model
+        # Свой путь эндпоинта, например "/generate" у app_generic.py
+        self._path = path
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+
+        headers = {}
+        if api_key:
+            headers["X-API-Key"] = api_key
+        if tenant:
+            headers["X-Tenant"] = tenant
+        self.http = httpx.AsyncClient(
+            base_url=base_url.rstrip("/"),
+            headers=headers,
+            timeout=httpx.Timeout(timeout, connect=30.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            http2=http2_available() if http2 is None else http2,
+        )
+        self._batcher = _Batcher(self, batch_size, batch_wait_ms / 1000) if auto_batch else None
+
+        # Счётчики для диагностики
+        self.requests = 0
+        self.retried = 0
+        self.batches = 0
+
+    def path(self):
+        return self._path or f"/generate_{self.model}"
+
+    def batch_paths(self):
+        if self._path:
+            return [f"{self._path}_batch"]
+        # Шлюз и воркер называют батч-эндпоинт по-разному
+        return [f"/generate_{self.model}_batch", "/generate_batch"]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        await self.http.aclose()
+
+    def _delay(self, attempt, retry_after):
+        # Full jitter: клиенты, получившие 429 одновременно, не вернутся толпой
+        delay = random.uniform(0, min(self.max_backoff_s, self.backoff_s * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def _with_retries(self, send):
+        attempt = 0
+        while True:
+            try:
+                return await send()
+            except (LLMError, *RETRY_ERRORS) as e:
+                retryable = not isinstance(e, LLMError) or e.retryable
+                if not retryable or attempt >= self.retries:
+                    raise
+                retry_after = getattr(e, "retry_after", None)
+            self.retried += 1
+            await asyncio.sleep(self._delay(attempt, retry_after))
+            attempt += 1
+
+    async def _post_single(self, payload):
+        response = await self.http.post(self.path(), json=payload)
+        if response.status_code != 200:
+            raise error_from_response(response)
+        return response.json()
+
+    async def generate(self, prompt, **params):
+        """Один запрос; возвращает тело ответа (``{"response": ...}``)."""
+        self.requests += 1
+        payload = {"prompt": prompt, **params}
+
+        async def send():
+            batchable = not any(params.get(name) for name in UNBATCHABLE_FIELDS)
+            if self._batcher is not None and self._batcher.available and batchable:
+                # Иначе элемент батча получил бы на сервере приоритет bulk
+                item = {"priority": "interactive", **payload}
+                try:
+                    return await self._batcher.submit(item)
+                except _NoBatchEndpoint:
+                    pass
+            return await self._post_single(payload)
+
+        return await self._with_retries(send)
+
+    async def stream(self, prompt, **params):
+        """Потоковый запрос: отдаёт приращения текста ответа."""
+        self.requests += 1
+        payload = {"prompt": prompt, **params, "stream": True}
+
+        async def open_stream():
+            request = self.http.build_request("POST", self.path(), json=payload)
+            response = await self.http.send(request, stream=True)
+            if response.status_code != 200:
+                await response.aread()
+                await response.aclose()
+                raise error_from_response(response)
+            return response
+
+        # Повторяем только установку потока: после первых токенов повтор задвоил бы текст
+        response = await self._with_retries(open_stream)
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if "error" in event:
+                    raise LLMError(500, event["error"])
+                if "delta" in event:
+                    yield event["delta"]
+        finally:
+            await response.aclose()
+
+    async def map(self, prompts, concurrency=16, **params):
+        """Как ``map``: результаты в порядке входа, не больше ``concurrency`` запросов одновременно."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(prompt):
+            async with semaphore:
+                return await self.generate(prompt, **params)
+
+        # Задачи создаём окном, чтобы не держать в памяти миллион корутин
+        window = []
+        try:
+            for prompt in prompts:
+                window.append(asyncio.ensure_future(one(prompt)))
+                if len(window) >= concurrency * 2:
+                    yield await window.pop(0)
+            while window:
+                yield await window.pop(0)
+        finally:
+            # Итерацию прервали или запрос упал — отменяем запросы, оставшиеся в окне
+            for task in window:
+                task.cancel()
+
+    async def gather(self, prompts, concurrency=16, return_exceptions=False, **params):
+        """Все результаты списком; с ``return_exceptions`` ошибки не прерывают остальные запросы."""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(prompt):
+            async with semaphore:
+                return await self.generate(prompt, **params)
+
+        return await asyncio.gather(*(one(prompt) for prompt in prompts), return_exceptions=return_exceptions)
+
+
+class LLMClient:
+    """Синхронная обёртка: ``AsyncLLMClient`` в фоновом потоке со своим event loop."""
+
+    def __init__(self, base_url, model, **kwargs):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-client", daemon=True)
+        self._thread.start()
+
+        async def create():
+            return AsyncLLMClient(base_url, model, **kwargs)
+
+        self._client = self._call(create())
+
+    def _call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._call(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    def generate(self, prompt, **params):
+        return self._call(self._client.generate(prompt, **params))
+
+    def gather(self, prompts, concurrency=16, return_exceptions=False, **params):
+        return self._call(self._client.gather(prompts, concurrency, return_exceptions, **params))
+
+    def _iterate(self, agen):
+        try:
+            while True:
+                try:
+                    yield self._call(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._call(agen.aclose())
+
+    def map(self, prompts, concurrency=16, **params):
+        return self._iterate(self._client.map(prompts, concurrency, **params))
+
+    def stream(self, prompt, **params):
+        return self._iterate(self._client.stream(prompt, **params))
@@ -0,0 +1,197 @@
+#!/bin/bash
+
+##############################################
+# Несколько реплик одной модели за шлюзом
+# (по одной реплике на GPU)
+##############################################
+#
+# Использование:
+#   bash replicas.sh tlite 4       — 4 реплики T-lite на GPU 0..3 и шлюз на порту 8000
+#   bash replicas.sh add tlite 2   — добавить реплику на GPU 2 к уже работающему шлюзу
+#   bash replicas.sh restart tlite — перезапустить реплики по одной без ошибок у клиентов
+#   STANDBY_GPU=1 bash replicas.sh restart tlite — то же для единственной реплики:
+#                                    на время перезапуска трафик берёт запасная на GPU 1
+#   MODEL_NAME=org/model bash replicas.sh generic 2
+#
+# Если у шлюза и моделей задан ADMIN_TOKEN, передай его и сюда.
+#
+# Реплика i слушает порт BASE_PORT + 10*i, чтобы не пересекаться с портами
+# других моделей из run.sh. Запасная реплика — порт BASE_PORT + 100.
+#
+# Перезапуск: реплика получает POST /admin/drain, доделывает запросы в работе
+# (не дольше DRAIN_TIMEOUT_S) и завершается, новые запросы шлюз отдаёт другим
+# репликам; затем реплика стартует заново и возвращается в шлюз после прогрева.
+
+GATEWAY_PORT=${GATEWAY_PORT:-8000}
+GATEWAY_URL="http://127.0.0.1:$GATEWAY_PORT"
+DRAIN_TIMEOUT_S=${DRAIN_TIMEOUT_S:-120}
+# Реплики в шлюзе меняет только администратор: токен, если задан ADMIN_TOKEN
+ADMIN_HEADER=()
+[ -n "$ADMIN_TOKEN" ] && ADMIN_HEADER=(-H "X-Admin-Token: $ADMIN_TOKEN")
+LOG_DIR=/tmp/llm_logs
+mkdir -p $LOG_DIR
+
+model_params() {
+    case $1 in
+        tlite)    SCRIPT="app_tlite.py";    BASE_PORT=8083 ;;
+        yagpt)    SCRIPT="app_yagpt.py";    BASE_PORT=8081 ;;
+        vikhr)    SCRIPT="app_vikhr.py";    BASE_PORT=8082 ;;
+        gptoss)   SCRIPT="app_gptoss.py";   BASE_PORT=8084 ;;
+        deepseek) SCRIPT="app_deepseek.py"; BASE_PORT=8085 ;;
+        generic)  SCRIPT="app_generic.py";  BASE_PORT=8080 ;;
+        *)
+            echo "❌ Неизвестная модель: $1"
+            echo "💡 Доступные: tlite, yagpt, vikhr, gptoss, deepseek, generic"
+            exit 1
+            ;;
+    esac
+}
+
+# Запуск одной реплики на GPU с номером $2 (порт и имя сессии — по умолчанию от номера GPU)
+start_replica() {
+    local model=$1
+    local gpu=$2
+    local port=${3:-$((BASE_PORT + 10 * gpu))}
+    local session=${4:-$model-$gpu}
+    local env="export CUDA_VISIBLE_DEVICES=$gpu && export HOST=127.0.0.1 && export PORT=$port"
+    if [ "$model" = "generic" ]; then
+        # Шлюз ходит на /generate_{model}
+        env="$env && export ENDPOINT_NAME=generate_generic"
+    fi
+    tmux kill-session -t "$session" 2>/dev/null
+    tmux new -s "$session" -d "$env && python -u -m serving.launcher $SCRIPT 2>&1 | tee $LOG_DIR/$session.log"
+    echo "   GPU $gpu → http://127.0.0.1:$port (tmux: $session)"
+    REPLICA_URL="http://127.0.0.1:$port"
+}
+
+wait_ready() {
+    local url=$1
+    for i in $(seq 1 300); do
+        # 200 только после загрузки и прогрева модели
+        if curl -sf --max-time 2 "$url/health/ready" >/dev/null 2>&1; then
+            return 0
+        fi
+        sleep 2
+    done
+    return 1
+}
+
+register_replica() {
+    if ! curl -fsS -X "${3:-POST}" "$GATEWAY_URL/gateway/replicas" \
+        -H "Content-Type: application/json" "${ADMIN_HEADER[@]}" \
+        -d "{\"model\": \"$1\", \"url\": \"$2\"}" >/dev/null; then
+        echo "❌ Шлюз не принял изменение реплик $1 (проверь ADMIN_TOKEN)"
+        exit 1
+    fi
+}
+
+# Drain реплики и ожидание, пока процесс завершится
+drain_replica() {
+    local url=$1
+    if ! curl -fsS -X POST --max-time 5 "${ADMIN_HEADER[@]}" "$url/admin/drain" >/dev/null; then
+        # Реплика уже не отвечает — ждать нечего
+        curl -s --max-time 1 "$url/health/live" >/dev/null 2>&1 || return 0
+        echo "❌ $url отклонила drain (проверь ADMIN_TOKEN)"
+        return 2
+    fi
+    for i in $(seq 1 $((DRAIN_TIMEOUT_S + 30))); do
+        curl -s --max-time 1 "$url/health/live" >/dev/null 2>&1 || return 0
+        sleep 1
+    done
+    return 1
+}
+
+if [ "$1" = "restart" ]; then
+    MODEL=${2:-tlite}
+    model_params $MODEL
+    URLS=$(curl -sf "$GATEWAY_URL/gateway/status" | python3 -c "
+import json, sys
+for replica in json.load(sys.stdin).get('$MODEL', {}).get('replicas', []):
+    print(replica['url'])
+")
+    if [ -z "$URLS" ]; then
+        echo "❌ В шлюзе $GATEWAY_URL нет реплик $MODEL"
+        exit 1
+    fi
+
+    STANDBY_URL=""
+    if [ -n "$STANDBY_GPU" ]; then
+        echo "🧍 Запасная реплика $MODEL на GPU $STANDBY_GPU..."
+        start_replica $MODEL $STANDBY_GPU $((BASE_PORT + 100)) "$MODEL-standby"
+        STANDBY_URL=$REPLICA_URL
+        if ! wait_ready $STANDBY_URL; then
+            echo "❌ Запасная реплика не запустилась, лог: $LOG_DIR/$MODEL-standby.log"
+            exit 1
+        fi
+        register_replica $MODEL $STANDBY_URL
+    elif [ $(echo "$URLS" | wc -l) -lt 2 ]; then
+        echo "⚠️  Реплика одна: пока она перезапускается, шлюз будет отвечать 503"
+        echo "💡 Без перерыва: STANDBY_GPU=<номер GPU> bash replicas.sh restart $MODEL"
+    fi
+
+    for url in $URLS; do
+        port=${url##*:}
+        gpu=$(( (port - BASE_PORT) / 10 ))
+        echo "🚰 Drain $url..."
+        drain_replica $url
+        case $? in
+            0) ;;
+            2) exit 1 ;;
+            *) echo "❌ $url не завершилась за $((DRAIN_TIMEOUT_S + 30)) с"; exit 1 ;;
+        esac
+        echo "🔄 Запуск заново:"
+        start_replica $MODEL $gpu
+        if ! wait_ready $REPLICA_URL; then
+            echo "❌ Реплика не запустилась, лог: $LOG_DIR/$MODEL-$gpu.log"
+            exit 1
+        fi
+        # Шлюз вернул бы реплику и сам на health-проверке — так быстрее
+        register_replica $MODEL $REPLICA_URL
+        echo "✅ $REPLICA_URL снова в шлюзе"
+    done
+
+    if [ -n "$STANDBY_URL" ]; then
+        echo "🧍 Убираю запасную реплику..."
+        register_replica $MODEL $STANDBY_URL DELETE
+        drain_replica $STANDBY_URL || echo "⚠️  Запасная реплика не остановилась: $STANDBY_URL"
+    fi
+    echo "✅ Реплики $MODEL перезапущены"
+    exit 0
+fi
+
+if [ "$1" = "add" ]; then
+    MODEL=$2
+    GPU=${3:?Укажи номер GPU}
+    model_params $MODEL
+    echo "➕ Добавление реплики $MODEL на GPU $GPU..."
+    start_replica $MODEL $GPU
+    echo "⏳ Ожидание готовности реплики..."
+    if ! wait_ready $REPLICA_URL; then
+        echo "❌ Реплика не запустилась, лог: $LOG_DIR/$MODEL-$GPU.log"
+        exit 1
+    fi
+    register_replica $MODEL $REPLICA_URL
+    echo "✅ Реплика зарегистрирована в шлюзе"
+    exit 0
+fi
+
+MODEL=${1:-tlite}
+COUNT=${2:-$(nvidia-smi -L 2>/dev/null | wc -l)}
+COUNT=${COUNT:-1}
+[ "$COUNT" -lt 1 ] && COUNT=1
+model_params $MODEL
+
+echo "🚀 Запуск $COUNT реплик $MODEL..."
+URLS=""
+for gpu in $(seq 0 $((COUNT - 1))); do
+    start_replica $MODEL $gpu
+    URLS="${URLS:+$URLS|}$REPLICA_URL"
+done
+
+echo "🌐 Запуск шлюза на порту $GATEWAY_PORT..."
+tmux kill-session -t gateway 2>/dev/null
+tmux new -s gateway -d "GATEWAY_WORKERS='$MODEL=$URLS' PORT=$GATEWAY_PORT python -u gateway.py 2>&1 | tee $LOG_DIR/gateway.log"
+
+echo ""
+echo "✅ Реплики запускаются, шлюз подключит их после загрузки"
+echo "📊 Статус: curl http://127.0.0.1:$GATEWAY_PORT/gateway/status"
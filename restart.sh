@@ -3,6 +3,15 @@
 ##############################################
 # Перезапуск всех сервисов
 ##############################################
+#
+#   ./restart.sh        — все сервисы: плавная остановка (drain) и запуск
+#   ./restart.sh tlite  — одна модель за шлюзом, без ошибок у клиентов
+#                         (см. replicas.sh restart; для единственной реплики
+#                         нужна запасная: STANDBY_GPU=1 ./restart.sh tlite)
+
+if [ -n "$1" ]; then
+    exec bash replicas.sh restart "$1"
+fi
 
 echo "🔄 Перезапуск сервисов..."
 
@@ -135,157 +135,30 @@ case $MODEL in
         ;;
 esac
 
-# Функция проверки свободен ли порт
-check_port_free() {
-    local port=$1
-    
-    # Метод 1: через Python (самый надежный)
-    if command -v python3 &>/dev/null; then
-        python3 -c "
-import socket
-import sys
-try:
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    s.settimeout(1)
-    s.bind(('0.0.0.0', $port))
-    s.close()
-    sys.exit(0)
-except (OSError, socket.error):
-    sys.exit(1)
-except Exception:
-    sys.exit(1)
-" 2>/dev/null
-        if [ $? -eq 0 ]; then
-            return 0
-        fi
-    fi
-    
-    # Метод 2: через netcat (nc) если доступен
-    if command -v nc &>/dev/null; then
-        if ! nc -z localhost $port 2>/dev/null; then
-            return 0
-        fi
-    fi
-    
-    # Метод 3: через /dev/tcp (встроенный в bash)
-    if timeout 1 bash -c "echo > /dev/tcp/localhost/$port" 2>/dev/null; then
-        return 1  # Порт занят
-    else
-        return 0  # Порт свободен
-    fi
-}
-
-# Функция поиска свободного порта
-find_free_port() {
-    local start_port=$1
-    local max_attempts=50  # Увеличил количество попыток
-    
-    # Сначала пробуем исходный порт
-    if check_port_free $start_port; then
-        echo $start_port
-        return 0
-    fi
-    
-    echo "   [INFO] Порт $start_port занят, ищу свободный порт..." >&2
-    
-    # Ищем свободный порт начиная с исходного (пробуем +1, +2, +3...)
-    for offset in $(seq 1 $max_attempts); do
-        test_port=$((start_port + offset))
-        if [ $test_port -le 65535 ]; then
-            if check_port_free $test_port; then
-                echo "   [INFO] Найден свободный порт: $test_port" >&2
-                echo $test_port
-                return 0
-            fi
-        fi
-    done
-    
-    # Если не нашли в диапазоне выше, пробуем ниже (пробуем -1, -2, -3...)
-    for offset in $(seq 1 $max_attempts); do
-        test_port=$((start_port - offset))
-        if [ $test_port -ge 1024 ]; then  # Минимум 1024 (непривилегированные порты)
-            if check_port_free $test_port; then
-                echo "   [INFO] Найден свободный порт: $test_port" >&2
-                echo $test_port
-                return 0
-            fi
-        fi
-    done
-    
-    # Последняя попытка: пробуем случайные порты в диапазоне 8000-9000
-    echo "   [INFO] Пробую случайные порты в диапазоне 8000-9000..." >&2
-    for i in $(seq 1 20); do
-        test_port=$((8000 + RANDOM % 1000))
-        if check_port_free $test_port; then
-            echo "   [INFO] Найден свободный порт: $test_port" >&2
-            echo $test_port
-            return 0
-        fi
-    done
-    
-    return 1
-}
-
-# Проверяем, указан ли порт через переменную окружения
+# Порт занимает сам сервис (serving.launcher) сразу при старте и пишет его
+# в PORT_FILE: проверка «порт свободен» заранее устаревала к моменту запуска.
+# Если PORT задан явно — только он, иначе при занятом берётся следующий
 if [ -n "$PORT" ]; then
     echo "ℹ️  Использую порт из переменной окружения: $PORT"
-    if ! check_port_free $PORT; then
-        echo "❌ Указанный порт $PORT занят!"
-        echo "💡 Освободите порт или используйте другой"
-        exit 1
-    fi
+    PORT_SEARCH=0
 else
-    # Находим свободный порт автоматически
-    PORT=$(find_free_port $DEFAULT_PORT)
-    if [ $? -ne 0 ]; then
-    echo "❌ Не удалось найти свободный порт!"
-    echo "   [DEBUG] Проверяю доступные методы проверки портов..."
-    if command -v python3 &>/dev/null; then
-        echo "   [OK] python3 доступен"
-    else
-        echo "   [WARN] python3 не найден"
-    fi
-    if command -v nc &>/dev/null; then
-        echo "   [OK] nc доступен"
-    else
-        echo "   [WARN] nc не найден"
-    fi
-    echo ""
-    echo "💡 Попробуйте вручную освободить порты или использовать:"
-    echo "   PORT=9001 bash /workspace/run.sh $MODEL"
-    exit 1
-    fi
-fi
-
-if [ "$PORT" != "$DEFAULT_PORT" ]; then
-    echo "⚠️  Использую порт $PORT вместо $DEFAULT_PORT (порт $DEFAULT_PORT занят)"
+    PORT=$DEFAULT_PORT
+    PORT_SEARCH=50
 fi
 
 # Убиваем старые процессы
 echo "🔄 Остановка старых процессов..."
-pkill -f $SCRIPT 2>/dev/null
+# SIGTERM запускает drain: старый процесс доделывает запросы в работе и выходит сам
+pkill -TERM -f "^[^ ]*python[^ ]* .*$SCRIPT" 2>/dev/null
+for i in $(seq 1 $(( ${DRAIN_TIMEOUT_S:-120} + 15 ))); do
+    pgrep -f "^[^ ]*python[^ ]* .*$SCRIPT" >/dev/null || break
+    sleep 1
+done
 pkill -f cloudflared 2>/dev/null
 tmux kill-session -t model 2>/dev/null
 tmux kill-session -t tunnel 2>/dev/null
 sleep 1
 
-echo "✅ Использую порт: $PORT"
-
-# Финальная проверка что порт действительно свободен
-if ! check_port_free $PORT; then
-    echo "❌ ОШИБКА: Порт $PORT недоступен, хотя должен быть свободен!"
-    echo "   [DEBUG] Ищу новый свободный порт..."
-    PORT=$(find_free_port $((DEFAULT_PORT + 1)))
-    if [ $? -ne 0 ]; then
-        echo "❌ Не удалось найти свободный порт"
-        exit 1
-    fi
-    echo "✅ Использую новый порт: $PORT"
-fi
-
-echo ""
-
 # Проверяем что всё установлено
 if ! command -v tmux &>/dev/null; then
     echo "📦 Установка tmux..."
@@ -331,39 +204,48 @@ elif [ "$MODEL" = "deepseek" ]; then
     echo "🔧 Параметры для DeepSeek-R1-Qwen3-8B:"
     echo "   MAX_MODEL_LEN=$MAX_MODEL_LEN"
     echo "   GPU_MEMORY_UTILIZATION=$GPU_MEMORY_UTILIZATION"
-    echo ""
-    echo "📦 Проверка и обновление transformers для поддержки qwen3..."
-    CURRENT_VERSION=$(pip show transformers 2>/dev/null | grep "^Version:" | awk '{print $2}' || echo "неизвестна")
-    echo "   Текущая версия transformers: $CURRENT_VERSION"
-    echo "   Обновление до последней версии..."
-    pip install --upgrade "transformers>=4.40.0" --no-cache-dir 2>&1 | grep -E "(Successfully|Already|ERROR)" || true
-    NEW_VERSION=$(pip show transformers 2>/dev/null | grep "^Version:" | awk '{print $2}' || echo "неизвестна")
-    echo "   Новая версия transformers: $NEW_VERSION"
-    echo ""
-    echo "📦 Проверка vLLM (может потребоваться обновление)..."
-    pip install --upgrade vllm --no-cache-dir 2>&1 | grep -E "(Successfully|Already|ERROR)" || true
-    echo "✅ Зависимости проверены"
+    # Версии transformers проверяет сам app_deepseek.py один раз и запоминает
+    # результат (~/.cache/llm-models), поэтому pip на каждом старте не вызываем
 fi
 
-# Запускаем через tmux с логированием (без буферизации Python)
-echo "🔧 Команда: HOST=0.0.0.0 PORT=$PORT python -u $SCRIPT"
-ENV_VARS="export HF_HUB_ENABLE_HF_TRANSFER=0 && export HOST=0.0.0.0 && export PORT=$PORT"
+# Запускаем через tmux с логированием (без буферизации Python).
+# Лаунчер сразу слушает порт и отвечает о ходе загрузки на /startup/status
+PORT_FILE="/tmp/llm_logs/${MODEL}.port"
+rm -f "$PORT_FILE"
+echo "🔧 Команда: HOST=0.0.0.0 PORT=$PORT python -u -m serving.launcher $SCRIPT"
+ENV_VARS="export HF_HUB_ENABLE_HF_TRANSFER=0 && export HOST=0.0.0.0 && export PORT=$PORT && export PORT_SEARCH=$PORT_SEARCH && export PORT_FILE=$PORT_FILE"
 if [ "$MODEL" = "yagpt" ] || [ "$MODEL" = "gptoss" ] || [ "$MODEL" = "deepseek" ]; then
     ENV_VARS="$ENV_VARS && export MAX_MODEL_LEN=$MAX_MODEL_LEN && export GPU_MEMORY_UTILIZATION=$GPU_MEMORY_UTILIZATION"
 fi
-tmux new -s model -d "cd $PROJECT_DIR && $ENV_VARS && python -u $SCRIPT 2>&1 | tee $LOG_FILE"
-sleep 3
+tmux new -s model -d "cd $PROJECT_DIR && $ENV_VARS && python -u -m serving.launcher $SCRIPT 2>&1 | tee $LOG_FILE"
+
+# Ждём, пока сервис займёт порт (секунды: модель грузится уже после этого)
+for i in $(seq 1 30); do
+    [ -s "$PORT_FILE" ] && break
+    if ! tmux has-session -t model 2>/dev/null; then
+        break
+    fi
+    sleep 1
+done
 
 # Проверяем что tmux сессия запустилась
-if ! tmux has-session -t model 2>/dev/null; then
-    echo "❌ Не удалось запустить tmux сессию!"
-    echo "💡 Попробуй запустить напрямую: python $SCRIPT"
+if ! tmux has-session -t model 2>/dev/null || [ ! -s "$PORT_FILE" ]; then
+    echo "❌ Сервис не запустился или не смог занять порт!"
+    echo "💡 Попробуй запустить напрямую: python -m serving.launcher $SCRIPT"
     echo "💡 Или посмотри лог: cat $LOG_FILE"
     exit 1
 fi
 
+BOUND_PORT=$(cat "$PORT_FILE")
+if [ "$BOUND_PORT" != "$PORT" ]; then
+    echo "⚠️  Порт $PORT занят, сервис слушает порт $BOUND_PORT"
+fi
+PORT=$BOUND_PORT
+echo "✅ Порт: $PORT"
+
 # Ждём готовности и показываем прогресс
 PREV_LINE_COUNT=0
+PREV_STAGES=""
 echo "📊 Прогресс загрузки:"
 echo ""
 
@@ -380,27 +262,25 @@ while [ $WAIT_COUNTER -lt $MAX_WAIT_ITERATIONS ]; do
         exit 1
     fi
     
-    # Проверяем доступность сервера
-    if curl -s --max-time 5 http://localhost:$PORT/docs >/dev/null 2>&1; then
-        # Дополнительная проверка: убеждаемся что сервер стабилен
-        # Проверяем несколько раз подряд
-        STABLE_COUNT=0
-        for i in 1 2 3; do
-            if curl -s --max-time 2 http://localhost:$PORT/docs >/dev/null 2>&1; then
-                STABLE_COUNT=$((STABLE_COUNT + 1))
-            fi
-            sleep 1
-        done
-        
-        # Если сервер отвечает стабильно и сессия еще жива
-        if [ $STABLE_COUNT -eq 3 ] && tmux has-session -t model 2>/dev/null; then
-            # Проверяем что это действительно FastAPI с правильным ответом
-            RESPONSE=$(curl -s --max-time 2 http://localhost:$PORT/docs 2>/dev/null)
-            if echo "$RESPONSE" | grep -q "swagger\|fastapi\|openapi" 2>/dev/null; then
-                SERVER_READY=1
-                break
-            fi
-        fi
+    # Проверяем готовность сервера: /health/ready отвечает 200 только
+    # после того, как модель загружена и прогрета на тестовых промптах
+    HEALTH=$(curl -s --max-time 5 -w "\n%{http_code}" http://localhost:$PORT/health/ready 2>/dev/null)
+    if [ "$(echo "$HEALTH" | tail -1)" = "200" ]; then
+        SERVER_READY=1
+        break
+    fi
+    # Текущие этапы старта (токенизатор, движок, прогрев) — из /startup/status
+    STAGES=$(curl -s --max-time 2 http://localhost:$PORT/startup/status 2>/dev/null | grep -o '"active":{[^}]*}' | head -1)
+    if [ -n "$STAGES" ] && [ "$STAGES" != "$PREV_STAGES" ]; then
+        echo "   ⏱️  Идут этапы: ${STAGES#\"active\":}"
+        PREV_STAGES=$STAGES
+    fi
+    if echo "$HEALTH" | grep -q '"status":"failed"'; then
+        echo ""
+        echo "❌ Прогрев модели завершился ошибкой:"
+        echo "   $(echo "$HEALTH" | head -1)"
+        echo "💡 Проверь логи: cat $LOG_FILE"
+        exit 1
     fi
     
     # Проверяем что файл существует
@@ -464,17 +344,9 @@ fi
 
 # Проверяем что сервер действительно доступен на нужном порту
 echo "🔍 Финальная проверка доступности сервера на порту $PORT..."
-if curl -s --max-time 2 http://localhost:$PORT/docs >/dev/null 2>&1; then
-    echo "✅ Сервер доступен на порту $PORT"
-    
-    # Проверяем что это действительно наш FastAPI сервер
-    RESPONSE=$(curl -s --max-time 2 http://localhost:$PORT/docs 2>/dev/null)
-    if echo "$RESPONSE" | grep -q "swagger\|fastapi\|openapi" 2>/dev/null; then
-        echo "✅ Подтверждено: это FastAPI сервер"
-    else
-        echo "⚠️  Внимание: ответ на /docs не похож на FastAPI Swagger UI"
-        echo "   Возможно, на порту $PORT запущен другой сервис"
-    fi
+if curl -sf --max-time 2 http://localhost:$PORT/health/ready >/dev/null 2>&1; then
+    echo "✅ Сервер доступен на порту $PORT и прогрет"
+    echo "   $(curl -s --max-time 2 http://localhost:$PORT/health/ready 2>/dev/null)"
 else
     echo "⚠️  Сервер не отвечает на порту $PORT"
     echo "💡 Проверь что модель запущена: tmux attach -t model"
@@ -558,12 +430,12 @@ else
     # Проверяем что URL действительно ведет на наш сервис
     echo ""
     echo "🔍 Проверка доступности через туннель..."
-    if curl -s --max-time 10 "$URL/docs" >/dev/null 2>&1; then
+    if curl -sf --max-time 10 "$URL/health/ready" >/dev/null 2>&1; then
         echo "✅ Туннель работает корректно!"
     else
-        echo "⚠️  Туннель создан, но не отвечает на /docs"
+        echo "⚠️  Туннель создан, но не отвечает на /health/ready"
         echo "💡 Проверь что сервер запущен на порту $PORT"
-        echo "💡 Локальная проверка: curl http://localhost:$PORT/docs"
+        echo "💡 Локальная проверка: curl http://localhost:$PORT/health/ready"
     fi
 fi
 
@@ -576,7 +448,7 @@ if ! tmux has-session -t model 2>/dev/null; then
     echo "💡 Проверь логи: cat $LOG_FILE"
     echo "💡 Туннель может быть создан, но сервер не работает"
     echo ""
-elif curl -s --max-time 2 http://localhost:$PORT/docs >/dev/null 2>&1; then
+elif curl -sf --max-time 2 http://localhost:$PORT/health/ready >/dev/null 2>&1; then
     echo "✅ $NAME ГОТОВ И РАБОТАЕТ!"
 else
     echo "⚠️  $NAME - сервер не отвечает на порту $PORT"
@@ -1064,39 +936,48 @@ elif [ "$MODEL" = "deepseek" ]; then
     echo "🔧 Параметры для DeepSeek-R1-Qwen3-8B:"
     echo "   MAX_MODEL_LEN=$MAX_MODEL_LEN"
     echo "   GPU_MEMORY_UTILIZATION=$GPU_MEMORY_UTILIZATION"
-    echo ""
-    echo "📦 Проверка и обновление transformers для поддержки qwen3..."
-    CURRENT_VERSION=$(pip show transformers 2>/dev/null | grep "^Version:" | awk '{print $2}' || echo "неизвестна")
-    echo "   Текущая версия transformers: $CURRENT_VERSION"
-    echo "   Обновление до последней версии..."
-    pip install --upgrade "transformers>=4.40.0" --no-cache-dir 2>&1 | grep -E "(Successfully|Already|ERROR)" || true
-    NEW_VERSION=$(pip show transformers 2>/dev/null | grep "^Version:" | awk '{print $2}' || echo "неизвестна")
-    echo "   Новая версия transformers: $NEW_VERSION"
-    echo ""
-    echo "📦 Проверка vLLM (может потребоваться обновление)..."
-    pip install --upgrade vllm --no-cache-dir 2>&1 | grep -E "(Successfully|Already|ERROR)" || true
-    echo "✅ Зависимости проверены"
+    # Версии transformers проверяет сам app_deepseek.py один раз и запоминает
+    # результат (~/.cache/llm-models), поэтому pip на каждом старте не вызываем
 fi
 
-# Запускаем через tmux с логированием (без буферизации Python)
-echo "🔧 Команда: HOST=0.0.0.0 PORT=$PORT python -u $SCRIPT"
-ENV_VARS="export HF_HUB_ENABLE_HF_TRANSFER=0 && export HOST=0.0.0.0 && export PORT=$PORT"
+# Запускаем через tmux с логированием (без буферизации Python).
+# Лаунчер сразу слушает порт и отвечает о ходе загрузки на /startup/status
+PORT_FILE="/tmp/llm_logs/${MODEL}.port"
+rm -f "$PORT_FILE"
+echo "🔧 Команда: HOST=0.0.0.0 PORT=$PORT python -u -m serving.launcher $SCRIPT"
+ENV_VARS="export HF_HUB_ENABLE_HF_TRANSFER=0 && export HOST=0.0.0.0 && export PORT=$PORT && export PORT_SEARCH=$PORT_SEARCH && export PORT_FILE=$PORT_FILE"
 if [ "$MODEL" = "yagpt" ] || [ "$MODEL" = "gptoss" ] || [ "$MODEL" = "deepseek" ]; then
     ENV_VARS="$ENV_VARS && export MAX_MODEL_LEN=$MAX_MODEL_LEN && export GPU_MEMORY_UTILIZATION=$GPU_MEMORY_UTILIZATION"
 fi
-tmux new -s model -d "cd $PROJECT_DIR && $ENV_VARS && python -u $SCRIPT 2>&1 | tee $LOG_FILE"
-sleep 3
+tmux new -s model -d "cd $PROJECT_DIR && $ENV_VARS && python -u -m serving.launcher $SCRIPT 2>&1 | tee $LOG_FILE"
+
+# Ждём, пока сервис займёт порт (секунды: модель грузится уже после этого)
+for i in $(seq 1 30); do
+    [ -s "$PORT_FILE" ] && break
+    if ! tmux has-session -t model 2>/dev/null; then
+        break
+    fi
+    sleep 1
+done
 
 # Проверяем что tmux сессия запустилась
-if ! tmux has-session -t model 2>/dev/null; then
-    echo "❌ Не удалось запустить tmux сессию!"
-    echo "💡 Попробуй запустить напрямую: python $SCRIPT"
+if ! tmux has-session -t model 2>/dev/null || [ ! -s "$PORT_FILE" ]; then
+    echo "❌ Сервис не запустился или не смог занять порт!"
+    echo "💡 Попробуй запустить напрямую: python -m serving.launcher $SCRIPT"
     echo "💡 Или посмотри лог: cat $LOG_FILE"
     exit 1
 fi
 
+BOUND_PORT=$(cat "$PORT_FILE")
+if [ "$BOUND_PORT" != "$PORT" ]; then
+    echo "⚠️  Порт $PORT занят, сервис слушает порт $BOUND_PORT"
+fi
+PORT=$BOUND_PORT
+echo "✅ Порт: $PORT"
+
 # Ждём готовности и показываем прогресс
 PREV_LINE_COUNT=0
+PREV_STAGES=""
 echo "📊 Прогресс загрузки:"
 echo ""
 
@@ -1113,27 +994,25 @@ while [ $WAIT_COUNTER -lt $MAX_WAIT_ITERATIONS ]; do
         exit 1
     fi
     
-    # Проверяем доступность сервера
-    if curl -s --max-time 5 http://localhost:$PORT/docs >/dev/null 2>&1; then
-        # Дополнительная проверка: убеждаемся что сервер стабилен
-        # Проверяем несколько раз подряд
-        STABLE_COUNT=0
-        for i in 1 2 3; do
-            if curl -s --max-time 2 http://localhost:$PORT/docs >/dev/null 2>&1; then
-                STABLE_COUNT=$((STABLE_COUNT + 1))
-            fi
-            sleep 1
-        done
-        
-        # Если сервер отвечает стабильно и сессия еще жива
-        if [ $STABLE_COUNT -eq 3 ] && tmux has-session -t model 2>/dev/null; then
-            # Проверяем что это действительно FastAPI с правильным ответом
-            RESPONSE=$(curl -s --max-time 2 http://localhost:$PORT/docs 2>/dev/null)
-            if echo "$RESPONSE" | grep -q "swagger\|fastapi\|openapi" 2>/dev/null; then
-                SERVER_READY=1
-                break
-            fi
-        fi
+    # Проверяем готовность сервера: /health/ready отвечает 200 только
+    # после того, как модель загружена и прогрета на тестовых промптах
+    HEALTH=$(curl -s --max-time 5 -w "\n%{http_code}" http://localhost:$PORT/health/ready 2>/dev/null)
+    if [ "$(echo "$HEALTH" | tail -1)" = "200" ]; then
+        SERVER_READY=1
+        break
+    fi
+    # Текущие этапы старта (токенизатор, движок, прогрев) — из /startup/status
+    STAGES=$(curl -s --max-time 2 http://localhost:$PORT/startup/status 2>/dev/null | grep -o '"active":{[^}]*}' | head -1)
+    if [ -n "$STAGES" ] && [ "$STAGES" != "$PREV_STAGES" ]; then
+        echo "   ⏱️  Идут этапы: ${STAGES#\"active\":}"
+        PREV_STAGES=$STAGES
+    fi
+    if echo "$HEALTH" | grep -q '"status":"failed"'; then
+        echo ""
+        echo "❌ Прогрев модели завершился ошибкой:"
+        echo "   $(echo "$HEALTH" | head -1)"
+        echo "💡 Проверь логи: cat $LOG_FILE"
+        exit 1
     fi
     
     # Проверяем что файл существует
@@ -1197,17 +1076,9 @@ fi
 
 # Проверяем что сервер действительно доступен на нужном порту
 echo "🔍 Финальная проверка доступности сервера на порту $PORT..."
-if curl -s --max-time 2 http://localhost:$PORT/docs >/dev/null 2>&1; then
-    echo "✅ Сервер доступен на порту $PORT"
-    
-    # Проверяем что это действительно наш FastAPI сервер
-    RESPONSE=$(curl -s --max-time 2 http://localhost:$PORT/docs 2>/dev/null)
-    if echo "$RESPONSE" | grep -q "swagger\|fastapi\|openapi" 2>/dev/null; then
-        echo "✅ Подтверждено: это FastAPI сервер"
-    else
-        echo "⚠️  Внимание: ответ на /docs не похож на FastAPI Swagger UI"
-        echo "   Возможно, на порту $PORT запущен другой сервис"
-    fi
+if curl -sf --max-time 2 http://localhost:$PORT/health/ready >/dev/null 2>&1; then
+    echo "✅ Сервер доступен на порту $PORT и прогрет"
+    echo "   $(curl -s --max-time 2 http://localhost:$PORT/health/ready 2>/dev/null)"
 else
     echo "⚠️  Сервер не отвечает на порту $PORT"
     echo "💡 Проверь что модель запущена: tmux attach -t model"
@@ -1291,12 +1162,12 @@ else
     # Проверяем что URL действительно ведет на наш сервис
     echo ""
     echo "🔍 Проверка доступности через туннель..."
-    if curl -s --max-time 10 "$URL/docs" >/dev/null 2>&1; then
+    if curl -sf --max-time 10 "$URL/health/ready" >/dev/null 2>&1; then
         echo "✅ Туннель работает корректно!"
     else
-        echo "⚠️  Туннель создан, но не отвечает на /docs"
+        echo "⚠️  Туннель создан, но не отвечает на /health/ready"
         echo "💡 Проверь что сервер запущен на порту $PORT"
-        echo "💡 Локальная проверка: curl http://localhost:$PORT/docs"
+        echo "💡 Локальная проверка: curl http://localhost:$PORT/health/ready"
     fi
 fi
 
@@ -1309,7 +1180,7 @@ if ! tmux has-session -t model 2>/dev/null; then
     echo "💡 Проверь логи: cat $LOG_FILE"
     echo "💡 Туннель может быть создан, но сервер не работает"
     echo ""
-elif curl -s --max-time 2 http://localhost:$PORT/docs >/dev/null 2>&1; then
+elif curl -sf --max-time 2 http://localhost:$PORT/health/ready >/dev/null 2>&1; then
     echo "✅ $NAME ГОТОВ И РАБОТАЕТ!"
 else
     echo "⚠️  $NAME - сервер не отвечает на порту $PORT"
@@ -0,0 +1 @@
+"""Общая инфраструктура обслуживания запросов для app_*.py."""
@@ -0,0 +1,246 @@
+"""Ограничение нагрузки: сразу 429 вместо бесконечной очереди.
+
+Раньше всплеск запросов через туннель копился в uvicorn, пока клиенты не
+отваливались по таймауту, а GPU всё равно дорабатывала брошенные запросы.
+``AdmissionEngine`` — внешний слой движка — пропускает запрос, только если в
+работе (в очереди и на GPU) меньше ``ADMISSION_MAX_REQUESTS`` запросов и
+меньше ``ADMISSION_MAX_TOKENS`` оценочных токенов. Оценка — длина промпта
+плюс ``max_tokens``. Лишние запросы сразу получают 429 с ``Retry-After``.
+
+Дополнительно можно ограничить скорость для каждого клиента (token bucket):
+клиент определяется по ``X-Tenant``, ``X-API-Key``/``Authorization``, иначе по IP
+(``CF-Connecting-IP`` от cloudflared, ``X-Forwarded-For``). После ответа
+неиспользованная часть ``max_tokens`` возвращается клиенту в бакет.
+
+Переменные окружения:
+    ADMISSION_MAX_REQUESTS    — запросов в работе, по умолчанию 256 (0 — без лимита)
+    ADMISSION_MAX_TOKENS      — оценочных токенов в работе, по умолчанию 0 (без лимита)
+    CLIENT_TOKENS_PER_MIN     — токенов в минуту на клиента, по умолчанию 0 (без лимита)
+    CLIENT_BURST_TOKENS       — ёмкость бакета клиента, по умолчанию = CLIENT_TOKENS_PER_MIN
+"""
+import contextvars
+import hashlib
+import math
+import os
+import time
+import weakref
+
+from serving import metrics
+
+# Клиент текущего HTTP-запроса
+CLIENT = contextvars.ContextVar("client", default="anonymous")
+
+REJECTED = metrics.Counter(
+    "llm_requests_rejected_total", "Запросы, отклонённые с 429",
+    labels=("model", "endpoint", "reason"),
+)
+
+
+class Overloaded(Exception):
+    """Запрос не принят; эндпоинты отвечают 429 с ``Retry-After``."""
+
+    def __init__(self, detail, retry_after, reason):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def estimate_tokens(prompt, sampling_params):
+    if isinstance(prompt, dict):
+        prompt_tokens = len(prompt.get("prompt_token_ids") or [])
+    else:
+        # ~4 символа на токен, как в оценке шлюза
+        prompt_tokens = len(str(prompt)) // 4
+    # Промпт считается один раз на все варианты ответа (n, best_of), декод — у каждого свой
+    n = getattr(sampling_params, "n", None) or 1
+    sequences = max(getattr(sampling_params, "best_of", None) or n, n)
+    return prompt_tokens + (getattr(sampling_params, "max_tokens", None) or 0) * sequences
+
+
+def client_id(scope):
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+    if headers.get("x-tenant"):
+        return headers["x-tenant"]
+    key = headers.get("x-api-key") or headers.get("authorization", "").split(" ")[-1]
+    if key:
+        # Сам ключ не должен попасть в метки метрик и /stats
+        return "key:" + hashlib.sha256(key.encode()).hexdigest()[:12]
+    ip = headers.get("cf-connecting-ip") or headers.get("x-forwarded-for", "").split(",")[0].strip()
+    if not ip and scope.get("client"):
+        ip = scope["client"][0]
+    return "ip:" + (ip or "unknown")
+
+
+class ClientIdMiddleware:
+    """ASGI-middleware: запоминает клиента для лимитов на клиента."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            CLIENT.set(client_id(scope))
+        await self.app(scope, receive, send)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_s, capacity):
+        self.rate = rate_per_s
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, cost):
+        """Списывает ``cost``; если не хватает — возвращает, сколько секунд ждать."""
+        self._refill()
+        # Запрос дороже всего бакета пропускаем, когда бакет полон
+        need = min(cost, self.capacity)
+        if self.tokens < need:
+            return (need - self.tokens) / self.rate
+        self.tokens -= cost
+        return 0.0
+
+    def refund(self, amount):
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _Ticket:
+    __slots__ = ("cost", "bucket", "started", "released")
+
+    def __init__(self, cost, bucket):
+        self.cost = cost
+        self.bucket = bucket
+        self.started = time.monotonic()
+        self.released = False
+
+
+class AdmissionEngine:
+    def __init__(self, inner, model_name, max_requests=0, max_tokens=0,
+                 client_tokens_per_min=0, client_burst_tokens=None):
+        self.inner = inner
+        self.model_name = model_name
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self.client_rate = client_tokens_per_min / 60
+        self.client_burst = client_burst_tokens or client_tokens_per_min
+        self._buckets = {}
+
+        self.requests = 0
+        self.tokens = 0
+        self.admitted = 0
+        self.rejected = {}
+        # Скользящее среднее длительности запроса для Retry-After
+        self.avg_duration_s = None
+
+    @classmethod
+    def wrap_from_env(cls, inner, model_name):
+        max_requests = int(os.environ.get("ADMISSION_MAX_REQUESTS", "256"))
+        max_tokens = int(os.environ.get("ADMISSION_MAX_TOKENS", "0"))
+        client_rate = int(os.environ.get("CLIENT_TOKENS_PER_MIN", "0"))
+        if not (max_requests or max_tokens or client_rate):
+            return inner
+        return cls(
+            inner,
+            model_name,
+            max_requests=max_requests,
+            max_tokens=max_tokens,
+            client_tokens_per_min=client_rate,
+            client_burst_tokens=int(os.environ.get("CLIENT_BURST_TOKENS", "0")) or None,
+        )
+
+    def _retry_after(self):
+        return min(max(math.ceil(self.avg_duration_s or 1.0), 1), 60)
+
+    def _reject(self, reason, detail, retry_after=None):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        REJECTED.inc(self.model_name, metrics.ENDPOINT.get(), reason)
+        raise Overloaded(detail, retry_after or self._retry_after(), reason)
+
+    def _bucket(self):
+        client = CLIENT.get()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            if len(self._buckets) > 10000:
+                # Полные бакеты ничем не отличаются от новых
+                for key in [k for k, b in self._buckets.items() if b.tokens >= b.capacity]:
+                    del self._buckets[key]
+            bucket = self._buckets[client] = TokenBucket(self.client_rate, self.client_burst)
+        return bucket
+
+    def _admit(self, prompt, sampling_params):
+        cost = estimate_tokens(prompt, sampling_params)
+        if self.max_requests and self.requests >= self.max_requests:
+            self._reject("requests", f"Слишком много запросов в работе: {self.requests}")
+        # Одиночный запрос больше лимита пропускаем, только когда очередь пуста
+        if self.max_tokens and self.requests and self.tokens + cost > self.max_tokens:
+            self._reject("tokens", f"Слишком много токенов в работе: {self.tokens} + {cost}")
+        bucket = None
+        if self.client_rate:
+            bucket = self._bucket()
+            wait_s = bucket.take(cost)
+            if wait_s:
+                self._reject("client_rate", "Превышен лимит токенов клиента", math.ceil(wait_s))
+        self.requests += 1
+        self.tokens += cost
+        self.admitted += 1
+        return _Ticket(cost, bucket)
+
+    def _release(self, ticket, output=None):
+        if ticket.released:
+            return
+        ticket.released = True
+        self.requests -= 1
+        self.tokens -= ticket.cost
+        duration = time.monotonic() - ticket.started
+        self.avg_duration_s = duration if self.avg_duration_s is None else (
+            0.9 * self.avg_duration_s + 0.1 * duration
+        )
+        if ticket.bucket is not None and output is not None:
+            used = len(output.prompt_token_ids or []) + sum(len(c.token_ids) for c in output.outputs)
+            ticket.bucket.refund(max(ticket.cost - used, 0))
+
+    async def generate(self, prompt, sampling_params, options=None):
+        ticket = self._admit(prompt, sampling_params)
+        output = None
+        try:
+            output = await self.inner.generate(prompt, sampling_params, options)
+            return output
+        finally:
+            self._release(ticket, output)
+
+    def stream(self, prompt, sampling_params, options=None):
+        # Проверка — до начала ответа, чтобы эндпоинт успел вернуть 429,
+        # а не событие ошибки внутри уже открытого потока
+        ticket = self._admit(prompt, sampling_params)
+        outputs = self._stream(ticket, prompt, sampling_params, options)
+        # Если поток так и не начнут читать, место освободится при сборке мусора
+        weakref.finalize(outputs, self._release, ticket)
+        return outputs
+
+    async def _stream(self, ticket, prompt, sampling_params, options):
+        final = None
+        try:
+            async for output in self.inner.stream(prompt, sampling_params, options):
+                final = output
+                yield output
+        finally:
+            self._release(ticket, final)
+
+    def stats(self):
+        return {
+            "in_flight_requests": self.requests,
+            "in_flight_tokens": self.tokens,
+            "max_requests": self.max_requests,
+            "max_tokens": self.max_tokens,
+            "client_tokens_per_min": self.client_rate * 60,
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "retry_after_s": self._retry_after(),
+        }
@@ -0,0 +1,67 @@
+"""Эндпоинт ``/generate_batch``: список промптов за один HTTP-запрос.
+
+Элементы батча — это обычные ``GenerateRequest`` модели, поэтому у каждого
+элемента можно переопределить параметры сэмплинга. Все элементы уходят в
+движок одновременно и попадают в общие вызовы ``llm.generate``.
+"""
+import asyncio
+import os
+from typing import List
+
+from fastapi import HTTPException
+from pydantic import create_model
+
+from serving.admission import Overloaded
+from serving.cancellation import RequestCancelled
+from serving.candidates import output_body
+
+
+def add_batch_endpoint(app, engine, request_model, prepare, response_text, path="/generate_batch",
+                       response_body=None):
+    """Регистрирует батч-эндпоинт.
+
+    ``prepare(item)`` возвращает ``(prompt, sampling_params)``,
+    ``response_text(output)`` — текст ответа, как в одиночном эндпоинте.
+    ``response_body(output, item)`` — тело ответа элемента, если оно у
+    модели своё; по умолчанию ``{"response": ...}``, а при нескольких
+    вариантах (n/best_of) — ``response`` и ``completions``.
+    """
+    if response_body is None:
+        def response_body(output, item):
+            return output_body(output, response_text)
+
+    max_items = int(os.environ.get("BATCH_ENDPOINT_MAX_ITEMS", "256"))
+    BatchRequest = create_model("BatchRequest", items=(List[request_model], ...))
+
+    @app.post(path)
+    async def generate_batch(request: BatchRequest):
+        if len(request.items) > max_items:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Слишком много элементов: {len(request.items)} > {max_items}",
+            )
+
+        async def run(item):
+            # prepare внутри задачи: неверные параметры одного элемента
+            # (например, n/best_of) — ошибка этого элемента, а не всего батча
+            prompt, sampling_params = prepare(item)
+            return await engine.generate(prompt, sampling_params, item)
+
+        outputs = await asyncio.gather(*(run(item) for item in request.items), return_exceptions=True)
+
+        # Ошибка одного элемента не роняет весь батч
+        responses = []
+        for item, output in zip(request.items, outputs):
+            if isinstance(output, Overloaded):
+                responses.append({"error": str(output), "retry_after": output.retry_after})
+            elif isinstance(output, RequestCancelled) and output.reason == "drain":
+                responses.append({"error": str(output), "retry_after": 1})
+            elif isinstance(output, HTTPException):
+                responses.append({"error": output.detail, "status_code": output.status_code})
+            elif isinstance(output, Exception):
+                responses.append({"error": str(output)})
+            else:
+                responses.append(response_body(output, item))
+        return {"responses": responses}
+
+    return generate_batch
@@ -0,0 +1,107 @@
+"""Динамический микро-батчинг перед ``llm.generate``.
+
+Конкурентные запросы складываются в общую очередь; отдельный поток собирает
+их в батч (до ``max_batch_size`` штук или пока не истечёт окно
+``max_wait_ms`` с момента прихода первого), отправляет одним вызовом
+``engine.generate`` и раздаёт результаты вызывающим.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    def __init__(self, engine, max_batch_size=None, max_wait_ms=None):
+        self.engine = engine
+        self.max_batch_size = max_batch_size or int(os.environ.get("BATCH_MAX_SIZE", "32"))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.environ.get("BATCH_WAIT_MS", "10"))
+        self.max_wait_s = max_wait_ms / 1000
+
+        # Счётчики для диагностики
+        self.batches = 0
+        self.requests = 0
+        self.running = 0
+        # Отменены, пока ждали в очереди (клиент ушёл, дедлайн), — на GPU не попали
+        self.dropped = 0
+
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt, sampling_params):
+        future = Future()
+        self._queue.put((prompt, sampling_params, future))
+        return future
+
+    async def generate(self, prompt, sampling_params, options=None):
+        # Не блокируем event loop: ждём результат из потока батчера
+        return await asyncio.wrap_future(self.submit(prompt, sampling_params))
+
+    async def stream(self, prompt, sampling_params, options=None):
+        # LLM.generate не отдаёт промежуточных результатов: весь ответ
+        # приходит одним куском. Потоковая выдача по токенам — в ENGINE_MODE=async
+        yield await self.generate(prompt, sampling_params, options)
+
+    def load(self):
+        return {"queued": self._queue.qsize(), "running": self.running}
+
+    def generate_sync(self, prompt, sampling_params):
+        return self.submit(prompt, sampling_params).result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Досчитываем текущий батч, затем останавливаемся
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            # Отменённые запросы не отправляем на GPU
+            size = len(batch)
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            self.dropped += size - len(batch)
+            if batch:
+                self._run(batch)
+
+    def _run(self, batch):
+        prompts = [prompt for prompt, _, _ in batch]
+        params = [sampling_params for _, sampling_params, _ in batch]
+        self.batches += 1
+        self.requests += len(batch)
+        self.running = len(batch)
+        try:
+            outputs = self.engine.generate(prompts, params)
+        except Exception as e:
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        finally:
+            self.running = 0
+        for (_, _, future), output in zip(batch, outputs):
+            future.set_result(output)
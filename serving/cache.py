@@ -0,0 +1,180 @@
+"""Кэш ответов для детерминированных и повторяющихся промптов.
+
+Ключ — имя модели, отрендеренный chat template и полный набор параметров
+сэмплинга. Два уровня: LRU в памяти (ограничение по числу записей и TTL) и
+необязательный SQLite-файл на диске, который переживает restart.sh.
+
+По умолчанию кэшируются только запросы с temperature=0 или явным seed:
+остальные ответы случайны, и повтор из кэша изменил бы поведение сервиса.
+
+Переменные окружения:
+    RESPONSE_CACHE_SIZE    — записей в памяти (0 выключает кэш), по умолчанию 1024
+    RESPONSE_CACHE_TTL_S   — время жизни записи, по умолчанию 3600
+    RESPONSE_CACHE_DIR     — каталог для дискового уровня (пусто — выключен)
+    RESPONSE_CACHE_ALL     — true: кэшировать и запросы с сэмплингом
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+
+from serving.engine import RequestOutputData
+
+
+def is_deterministic(sampling_params):
+    return (
+        getattr(sampling_params, "temperature", 1.0) == 0
+        or getattr(sampling_params, "seed", None) is not None
+    )
+
+
+def request_key(model_name, prompt, sampling_params):
+    # repr(SamplingParams) перечисляет все поля, включая max_tokens и seed,
+    # но не logits processors (бюджет рассуждений) — их добавляем отдельно
+    processors = getattr(sampling_params, "logits_processors", None) or []
+    raw = json.dumps(
+        [model_name, prompt, repr(sampling_params), [repr(p) for p in processors]],
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, model_name, max_entries=1024, ttl_s=3600.0, disk_dir=None, cache_all=False):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.cache_all = cache_all
+        self._memory = OrderedDict()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.skipped = 0
+
+        self._db = None
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            path = os.path.join(disk_dir, model_name.replace("/", "--") + ".sqlite")
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl_s,))
+            self._db.commit()
+
+    @classmethod
+    def from_env(cls, model_name):
+        max_entries = int(os.environ.get("RESPONSE_CACHE_SIZE", "1024"))
+        if max_entries <= 0:
+            return None
+        return cls(
+            model_name,
+            max_entries=max_entries,
+            ttl_s=float(os.environ.get("RESPONSE_CACHE_TTL_S", "3600")),
+            disk_dir=os.environ.get("RESPONSE_CACHE_DIR") or None,
+            cache_all=os.environ.get("RESPONSE_CACHE_ALL", "false").lower() == "true",
+        )
+
+    def key(self, prompt, sampling_params):
+        return request_key(self.model_name, prompt, sampling_params)
+
+    def cacheable(self, sampling_params, options=None):
+        if options is not None and not getattr(options, "use_cache", True):
+            return False
+        return self.cache_all or is_deterministic(sampling_params)
+
+    def get(self, key):
+        now = time.time()
+        entry = self._memory.get(key)
+        if entry is not None:
+            created, output = entry
+            if now - created < self.ttl_s:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return output
+            del self._memory[key]
+
+        if self._db is not None:
+            row = self._db.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] < self.ttl_s:
+                output = RequestOutputData.from_dict(json.loads(row[0]))
+                self._remember(key, output, row[1])
+                self.hits += 1
+                self.disk_hits += 1
+                return output
+
+        self.misses += 1
+        return None
+
+    def put(self, key, output):
+        output = RequestOutputData.snapshot(output)
+        created = time.time()
+        self._remember(key, output, created)
+        if self._db is not None:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(output.to_dict(), ensure_ascii=False), created),
+            )
+            self._db.commit()
+
+    def _remember(self, key, output, created):
+        self._memory[key] = (created, output)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "skipped": self.skipped,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "disk": self._db is not None,
+        }
+
+
+class CachingEngine:
+    """Слой движка, отдающий повторные ответы из ``ResponseCache``."""
+
+    def __init__(self, inner, cache):
+        self.inner = inner
+        self.cache = cache
+
+    def _lookup(self, prompt, sampling_params, options):
+        if not self.cache.cacheable(sampling_params, options):
+            self.cache.skipped += 1
+            return None, None
+        key = self.cache.key(prompt, sampling_params)
+        return key, self.cache.get(key)
+
+    async def generate(self, prompt, sampling_params, options=None):
+        key, cached = self._lookup(prompt, sampling_params, options)
+        if cached is not None:
+            return cached
+        output = await self.inner.generate(prompt, sampling_params, options)
+        if key is not None:
+            self.cache.put(key, output)
+        return output
+
+    async def stream(self, prompt, sampling_params, options=None):
+        key, cached = self._lookup(prompt, sampling_params, options)
+        if cached is not None:
+            yield cached
+            return
+        final = None
+        async for output in self.inner.stream(prompt, sampling_params, options):
+            final = output
+            yield output
+        if key is not None and final is not None and final.finished:
+            self.cache.put(key, final)
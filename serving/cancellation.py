@@ -0,0 +1,208 @@
+"""Отмена генерации, когда клиент ушёл или истёк дедлайн запроса.
+
+Туннель часто рвёт длинные запросы (DeepSeek, GPT-OSS с ``max_tokens``
+2048/1024), а движок до сих пор догенерировал их до конца, занимая KV cache
+и место в батче. ``CancellationEngine`` следит за каждым запросом и при
+обрыве соединения или истечении дедлайна прерывает генерацию: вложенные
+слои закрываются, ``AsyncVLLMEngine`` вызывает ``abort`` в vLLM, а
+MicroBatcher не отправляет на GPU запросы, отменённые в очереди.
+
+Дедлайн задаётся полем ``timeout_s`` запроса или заголовком
+``X-Request-Timeout`` (секунды от прихода запроса); действует меньший.
+Без дедлайна запрос всё равно отменяется при обрыве соединения.
+Запросы, не успевшие закончиться за время drain (см. ``serving.drain``),
+прерываются с причиной ``drain``.
+
+Переменные окружения:
+    REQUEST_TIMEOUT_S — дедлайн по умолчанию, по умолчанию 0 (без дедлайна)
+"""
+import asyncio
+import contextvars
+import os
+import time
+
+from serving import metrics
+from serving.drain import HANDOFF
+
+# Дедлайн из заголовка (time.monotonic) и событие обрыва соединения текущего запроса
+DEADLINE = contextvars.ContextVar("deadline", default=None)
+DISCONNECTED = contextvars.ContextVar("disconnected", default=None)
+
+CANCELLED = metrics.Counter(
+    "llm_requests_cancelled_total", "Запросы, прерванные из-за обрыва соединения или дедлайна",
+    labels=("model", "endpoint", "reason"),
+)
+
+_END = object()
+
+
+class RequestCancelled(Exception):
+    """Генерация прервана; ``reason`` — ``deadline``, ``disconnect`` или ``drain``."""
+
+    def __init__(self, reason):
+        detail = {
+            "deadline": "Истёк дедлайн запроса",
+            "disconnect": "Клиент отключился",
+            "drain": "Сервис перезапускается, повторите запрос",
+        }[reason]
+        super().__init__(detail)
+        self.detail = detail
+        self.reason = reason
+
+
+class DisconnectMiddleware:
+    """ASGI-middleware: дедлайн из заголовка и отслеживание обрыва соединения.
+
+    После того как тело запроса прочитано, фоновая задача ждёт
+    ``http.disconnect``, поэтому обрыв замечается и пока обычный
+    (не потоковый) хендлер ждёт движок.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        arrived = time.monotonic()
+        default_timeout = float(os.environ.get("REQUEST_TIMEOUT_S", "0"))
+        header = dict(scope.get("headers", [])).get(b"x-request-timeout")
+        timeout = default_timeout
+        if header:
+            try:
+                timeout = float(header)
+            except ValueError:
+                pass
+        DEADLINE.set(arrived + timeout if timeout > 0 else None)
+
+        disconnected = asyncio.Event()
+        DISCONNECTED.set(disconnected)
+        watcher = None
+
+        async def watch():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        async def watched_receive():
+            nonlocal watcher
+            if watcher is not None:
+                # Дальше receive читает фоновая задача
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body"):
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        try:
+            await self.app(scope, watched_receive, send)
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+
+def request_deadline(options):
+    deadline = DEADLINE.get()
+    timeout_s = getattr(options, "timeout_s", None)
+    if timeout_s:
+        own = time.monotonic() + timeout_s
+        deadline = own if deadline is None else min(deadline, own)
+    return deadline
+
+
+async def _stopped(deadline, disconnected):
+    """Ждёт обрыва соединения, дедлайна или конца drain и возвращает причину."""
+    waiters = {asyncio.ensure_future(HANDOFF.wait()): "drain"}
+    if disconnected is not None:
+        waiters[asyncio.ensure_future(disconnected.wait())] = "disconnect"
+    timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+    try:
+        done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+    if not done:
+        return "deadline"
+    return waiters[done.pop()]
+
+
+async def _next(outputs):
+    return await anext(outputs, _END)
+
+
+class CancellationEngine:
+    def __init__(self, inner, model_name):
+        self.inner = inner
+        self.model_name = model_name
+        self.cancelled = {}
+
+    def _cancelled(self, reason):
+        self.cancelled[reason] = self.cancelled.get(reason, 0) + 1
+        CANCELLED.inc(self.model_name, metrics.ENDPOINT.get(), reason)
+        return RequestCancelled(reason)
+
+    def _watch(self, options):
+        deadline = request_deadline(options)
+        disconnected = DISCONNECTED.get()
+        if deadline is None and disconnected is None:
+            return None
+        # Истёк ещё до движка (например, долго ждал admission или шаблон)
+        if disconnected is not None and disconnected.is_set():
+            raise self._cancelled("disconnect")
+        if deadline is not None and deadline <= time.monotonic():
+            raise self._cancelled("deadline")
+        return asyncio.ensure_future(_stopped(deadline, disconnected))
+
+    async def _race(self, awaitable, stop):
+        task = asyncio.ensure_future(awaitable)
+        try:
+            await asyncio.wait((task, stop), return_when=asyncio.FIRST_COMPLETED)
+            if task.done():
+                return task.result()
+        finally:
+            if not task.done():
+                # Отмена доходит до нижних слоёв: abort в vLLM, отмена в очереди батчера
+                task.cancel()
+                await asyncio.wait((task,))
+        raise self._cancelled(stop.result())
+
+    async def generate(self, prompt, sampling_params, options=None):
+        stop = self._watch(options)
+        if stop is None:
+            return await self.inner.generate(prompt, sampling_params, options)
+        try:
+            return await self._race(self.inner.generate(prompt, sampling_params, options), stop)
+        finally:
+            stop.cancel()
+
+    async def stream(self, prompt, sampling_params, options=None):
+        stop = self._watch(options)
+        if stop is None:
+            async for output in self.inner.stream(prompt, sampling_params, options):
+                yield output
+            return
+
+        outputs = self.inner.stream(prompt, sampling_params, options)
+        try:
+            while True:
+                output = await self._race(_next(outputs), stop)
+                if output is _END:
+                    return
+                yield output
+        except asyncio.CancelledError:
+            # StreamingResponse сам отменяет поток при обрыве — тоже считаем
+            disconnected = DISCONNECTED.get()
+            if disconnected is not None and disconnected.is_set():
+                self._cancelled("disconnect")
+            raise
+        finally:
+            stop.cancel()
+            await outputs.aclose()
+
+    def stats(self):
+        return {"cancelled": dict(self.cancelled)}
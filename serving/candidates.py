@@ -0,0 +1,85 @@
+"""Несколько вариантов ответа на один промпт (``n``, ``best_of``).
+
+Чтобы выбрать лучший из нескольких сэмплов, клиенты раньше повторяли запрос
+с тем же промптом — и каждый раз платили за prefill заново. Теперь ``n``
+вариантов генерирует один запрос: vLLM считает промпт один раз, и все
+последовательности делят его KV cache (prefix), расходясь только на декоде.
+
+    n       — сколько вариантов вернуть
+    best_of — сколько сгенерировать (>= n); возвращаются n лучших по
+              суммарному logprob
+
+Ответ: ``response`` — лучший вариант, ``completions`` — все варианты по
+убыванию ``score``. ``score`` — средний logprob токена (суммарный,
+делённый на длину), чтобы короткие ответы не выигрывали только за счёт
+длины; суммарный отдаётся в ``cumulative_logprob``. Потоковый режим
+поддерживает только один вариант.
+
+Переменные окружения:
+    MAX_CANDIDATES — наибольшие n и best_of в одном запросе, по умолчанию 8
+"""
+import os
+
+from fastapi import HTTPException
+
+MAX_CANDIDATES = int(os.environ.get("MAX_CANDIDATES", "8"))
+
+
+def candidate_params(request):
+    """Поля ``n``, ``best_of`` и ``logprobs`` для SamplingParams запроса.
+
+    ``logprobs=0`` — только logprob выбранного токена: без него vLLM не
+    считает ``cumulative_logprob``, а по нему ранжируются варианты.
+    """
+    n = getattr(request, "n", None) or 1
+    best_of = getattr(request, "best_of", None)
+    if not 1 <= n <= MAX_CANDIDATES:
+        raise HTTPException(status_code=422, detail=f"n должно быть от 1 до {MAX_CANDIDATES}")
+    if best_of is not None and not n <= best_of <= MAX_CANDIDATES:
+        raise HTTPException(status_code=422, detail=f"best_of должно быть от n до {MAX_CANDIDATES}")
+    if (best_of or n) == 1:
+        return {}
+    if getattr(request, "stream", False):
+        raise HTTPException(status_code=422, detail="Потоковый режим поддерживает только n=1")
+    if getattr(request, "temperature", None) == 0:
+        # Жадный декод даёт n одинаковых ответов
+        raise HTTPException(status_code=422, detail="Для n/best_of > 1 нужна temperature > 0")
+    return {"n": n, "best_of": best_of, "logprobs": 0}
+
+
+def score(completion):
+    if completion.cumulative_logprob is None:
+        return None
+    return completion.cumulative_logprob / max(len(completion.token_ids), 1)
+
+
+def ranked_completions(output, strip=True):
+    """Варианты ответа по убыванию ``score``."""
+    completions = sorted(
+        output.outputs,
+        key=lambda c: (score(c) is not None, score(c) or 0.0),
+        reverse=True,
+    )
+    return [
+        {
+            "text": c.text.strip() if strip else c.text,
+            "score": None if score(c) is None else round(score(c), 4),
+            "cumulative_logprob": c.cumulative_logprob,
+            "completion_tokens": len(c.token_ids),
+            "finish_reason": c.finish_reason,
+        }
+        for c in completions
+    ]
+
+
+def candidates_response(output, strip=True):
+    """Тело ответа одиночного эндпоинта при нескольких вариантах."""
+    completions = ranked_completions(output, strip)
+    return {"response": completions[0]["text"], "completions": completions}
+
+
+def output_body(output, response_text, strip=True):
+    """``{"response": ...}`` или, при нескольких вариантах, ``candidates_response``."""
+    if len(output.outputs) > 1:
+        return candidates_response(output, strip)
+    return {"response": response_text(output)}
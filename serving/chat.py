@@ -0,0 +1,202 @@
+"""Эндпоинт ``/chat``: диалог целиком (``messages``) с учётом сессий.
+
+Фронтенд присылает на каждом ходу всю историю. С включённым prefix caching
+vLLM (``enable_prefix_caching``) уже посчитанный префикс — системное
+сообщение и прошлые ходы — берётся из KV cache, и prefill идёт только по
+новому сообщению. Чтобы это работало, история должна токенизироваться так
+же, как в прошлый раз, поэтому диалог рендерится тем же шаблоном модели.
+
+По ``session_id`` сервер помнит токены последнего хода сессии (промпт и
+ответ) и считает, сколько токенов нового промпта совпадает с ними: это
+оценка экономии prefill, которую видно в ``/chat/stats`` и ``/metrics``.
+При ``PREFIX_KEEPALIVE_S`` > 0 история простаивающих активных сессий
+периодически повторно прогоняется через движок (``max_tokens=1``), чтобы её
+блоки не вытеснились из prefix cache до следующего хода пользователя.
+
+Переменные окружения:
+    CHAT_SESSIONS_MAX  — сколько сессий помнить, по умолчанию 1024
+    CHAT_SESSION_TTL_S — сессия активна столько секунд после хода, по умолчанию 600
+    PREFIX_KEEPALIVE_S — период прогрева префиксов активных сессий, по умолчанию 0 (выключен)
+"""
+import asyncio
+import copy
+import os
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel, create_model
+
+from serving import metrics
+from serving.schemas import GenerateOptions
+from serving.streaming import stream_response
+
+CHAT_PROMPT_TOKENS = metrics.Counter("llm_chat_prompt_tokens_total", "Токены промптов /chat с session_id")
+CHAT_REUSED_TOKENS = metrics.Counter(
+    "llm_chat_reused_prefix_tokens_total", "Токены промптов /chat, совпавшие с прошлым ходом сессии"
+)
+
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
+
+
+def common_prefix_len(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class _Session:
+    __slots__ = ("token_ids", "sampling_params", "last_turn", "last_touch")
+
+    def __init__(self):
+        self.token_ids = []
+        self.sampling_params = None
+        self.last_turn = self.last_touch = time.monotonic()
+
+
+class SessionPrefixes:
+    """Последние токены каждой сессии (LRU) и статистика повторного использования."""
+
+    def __init__(self, max_sessions=None, ttl_s=None):
+        self.max_sessions = max_sessions or int(os.environ.get("CHAT_SESSIONS_MAX", "1024"))
+        self.ttl_s = ttl_s or float(os.environ.get("CHAT_SESSION_TTL_S", "600"))
+        self._sessions = OrderedDict()
+
+        self.turns = 0
+        self.prompt_tokens = 0
+        self.reused_tokens = 0
+
+    def observe(self, session_id, prompt_ids):
+        """Учитывает новый ход: сколько токенов промпта совпало с прошлым ходом."""
+        session = self._sessions.get(session_id)
+        reused = common_prefix_len(session.token_ids, prompt_ids) if session else 0
+        self.turns += 1
+        self.prompt_tokens += len(prompt_ids)
+        self.reused_tokens += reused
+        return reused
+
+    def remember(self, session_id, token_ids, sampling_params):
+        session = self._sessions.pop(session_id, None) or _Session()
+        session.token_ids = list(token_ids)
+        session.sampling_params = sampling_params
+        session.last_turn = session.last_touch = time.monotonic()
+        self._sessions[session_id] = session
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def idle_active(self, idle_s):
+        """Активные сессии, к которым больше ``idle_s`` секунд никто не обращался."""
+        now = time.monotonic()
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_turn > self.ttl_s:
+                del self._sessions[session_id]
+            elif now - session.last_touch >= idle_s:
+                yield session
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "turns": self.turns,
+            "prompt_tokens": self.prompt_tokens,
+            "reused_prefix_tokens": self.reused_tokens,
+            "prefix_reuse_rate": self.reused_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+        }
+
+
+async def keep_prefixes_warm(engine, sessions, interval_s):
+    # Отдельная метка endpoint, чтобы прогрев не смешивался с запросами
+    metrics.ENDPOINT.set("prefix_keepalive")
+    options = GenerateOptions(use_cache=False)
+    while True:
+        await asyncio.sleep(interval_s)
+        for session in sessions.idle_active(interval_s):
+            params = copy.deepcopy(session.sampling_params)
+            params.max_tokens = 1
+            session.last_touch = time.monotonic()
+            try:
+                await engine.generate({"prompt_token_ids": session.token_ids}, params, options)
+            except Exception as e:
+                print(f"⚠️  Прогрев префикса сессии не удался: {e}")
+
+
+def add_chat_endpoint(app, engine, chat_template, request_model, sampling_params_for,
+                      response_text, system_prompt=None, path="/chat", response_body=None, events=None):
+    """Регистрирует ``/chat`` и ``/chat/stats``.
+
+    ``request_model`` — модель одиночного запроса (поля сэмплинга берутся из
+    неё), ``sampling_params_for(request)`` строит SamplingParams,
+    ``system_prompt`` добавляется, если диалог не начинается с system.
+    ``response_body(output, request)`` и ``events(request)`` — тело ответа и
+    SSE-события, если они у модели свои (например, режимы ``reasoning``).
+    """
+    sessions = SessionPrefixes()
+    ChatRequest = create_model(
+        "ChatRequest",
+        __base__=request_model,
+        prompt=(str, ""),
+        messages=(List[ChatMessage], ...),
+        session_id=(Optional[str], None),
+    )
+
+    @metrics.timed_template
+    def prepare_chat(request):
+        messages = [m.model_dump() for m in request.messages]
+        if system_prompt and (not messages or messages[0]["role"] != "system"):
+            messages.insert(0, {"role": "system", "content": system_prompt})
+        return chat_template.messages_token_ids(messages), sampling_params_for(request)
+
+    async def remembering(outputs, session_id, prompt_ids, sampling_params):
+        final = None
+        async for output in outputs:
+            final = output
+            yield output
+        if final is not None and final.finished:
+            sessions.remember(session_id, prompt_ids + list(final.outputs[0].token_ids), sampling_params)
+
+    @app.post(path)
+    async def chat(request: ChatRequest):
+        if not request.messages:
+            raise HTTPException(status_code=422, detail="Пустой список messages")
+        try:
+            prompt_ids, sampling_params = prepare_chat(request)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"Не удалось применить chat template: {e}")
+
+        if request.session_id:
+            reused = sessions.observe(request.session_id, prompt_ids)
+            CHAT_PROMPT_TOKENS.inc(engine.model_name, metrics.ENDPOINT.get(), amount=len(prompt_ids))
+            CHAT_REUSED_TOKENS.inc(engine.model_name, metrics.ENDPOINT.get(), amount=reused)
+
+        prompt = {"prompt_token_ids": prompt_ids}
+        outputs = engine.stream(prompt, sampling_params, request)
+        if request.session_id:
+            outputs = remembering(outputs, request.session_id, prompt_ids, sampling_params)
+        if request.stream:
+            return stream_response(outputs, events(request) if events else None)
+
+        final = None
+        async for output in outputs:
+            final = output
+        body = response_body(final, request) if response_body else {"response": response_text(final)}
+        return {**body, "session_id": request.session_id}
+
+    @app.get(path + "/stats")
+    async def chat_stats():
+        return sessions.stats()
+
+    interval_s = float(os.environ.get("PREFIX_KEEPALIVE_S", "0"))
+    if interval_s > 0:
+        async def start_keepalive():
+            asyncio.ensure_future(keep_prefixes_warm(engine, sessions, interval_s))
+
+        app.add_event_handler("startup", start_keepalive)
+
+    return sessions
@@ -0,0 +1,131 @@
+"""Склейка одинаковых запросов, которые выполняются одновременно (single-flight).
+
+Если пока идёт генерация приходит запрос с тем же промптом и теми же
+параметрами сэмплинга, новая генерация не запускается: запрос подписывается
+на уже идущую и получает тот же результат. Потоковые подписчики, пришедшие
+позже, сначала получают уже накопленный текст, затем — новые токены.
+
+Как и кэш, по умолчанию склеиваются только детерминированные запросы
+(temperature=0 или seed): иначе параллельные запросы за разными сэмплами
+получили бы один и тот же ответ.
+
+Генерация идёт с параметрами первого запроса, поэтому склеиваются только
+запросы одного класса приоритета: иначе interactive-запрос ждал бы в очереди
+bulk вслед за батчем. Дедлайн и обрыв соединения у каждого подписчика свои
+(их проверяет ``CancellationEngine`` выше этого слоя): отменённый запрос
+только отписывается, а генерация прерывается, когда уходит последний
+подписчик.
+
+Переменные окружения:
+    COALESCE_INFLIGHT — false выключает склейку, по умолчанию true
+    COALESCE_ALL      — true: склеивать и запросы с сэмплингом
+"""
+import asyncio
+import os
+
+from serving.cache import is_deterministic, request_key
+from serving.fairness import request_priority
+
+_DONE = object()
+
+
+class _Flight:
+    def __init__(self):
+        self.subscribers = []
+        self.latest = None
+        self.task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue()
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        self.subscribers.append(queue)
+        return queue
+
+    def publish(self, item):
+        for queue in self.subscribers:
+            queue.put_nowait(item)
+
+
+class CoalescingEngine:
+    def __init__(self, inner, coalesce_all=False):
+        self.inner = inner
+        self.coalesce_all = coalesce_all
+        self._flights = {}
+
+        self.started = 0
+        self.coalesced = 0
+
+    @classmethod
+    def wrap_from_env(cls, inner):
+        if os.environ.get("COALESCE_INFLIGHT", "true").lower() != "true":
+            return inner
+        return cls(inner, coalesce_all=os.environ.get("COALESCE_ALL", "false").lower() == "true")
+
+    def _eligible(self, sampling_params, options):
+        if options is not None and not getattr(options, "use_cache", True):
+            return False
+        return self.coalesce_all or is_deterministic(sampling_params)
+
+    async def _run(self, key, flight, prompt, sampling_params, options):
+        try:
+            async for output in self.inner.stream(prompt, sampling_params, options):
+                flight.latest = output
+                flight.publish(output)
+        except Exception as e:
+            flight.publish(e)
+        else:
+            flight.publish(_DONE)
+        finally:
+            self._forget(key, flight)
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def stream(self, prompt, sampling_params, options=None):
+        if not self._eligible(sampling_params, options):
+            async for output in self.inner.stream(prompt, sampling_params, options):
+                yield output
+            return
+
+        key = (request_priority(options), request_key(None, prompt, sampling_params))
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(
+                self._run(key, flight, prompt, sampling_params, options)
+            )
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        queue = flight.subscribe()
+        try:
+            while True:
+                item = await queue.get()
+                if item is _DONE:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            flight.subscribers.remove(queue)
+            # Последний подписчик ушёл — генерация больше никому не нужна
+            if not flight.subscribers and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    async def generate(self, prompt, sampling_params, options=None):
+        final = None
+        async for output in self.stream(prompt, sampling_params, options):
+            final = output
+        return final
+
+    def stats(self):
+        return {
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._flights),
+        }
@@ -0,0 +1,192 @@
+"""Плавная остановка (drain) для перезапуска без ошибок у клиентов.
+
+Раньше сервис останавливали ``tmux kill-session``/``kill -9``: запросы в
+работе обрывались, а до старта нового процесса клиенты получали ошибки.
+Теперь по ``SIGTERM`` или ``POST /admin/drain`` сервис:
+
+1. перестаёт принимать новую работу: ``/health/ready`` отвечает 503
+   (шлюз убирает реплику из ротации), новые POST-запросы получают 503 с
+   ``Retry-After`` и заголовком ``X-Draining`` — шлюз сразу повторяет их на
+   другой реплике;
+2. ждёт, пока запросы в работе закончатся, но не дольше ``DRAIN_TIMEOUT_S``;
+3. оставшиеся по истечении срока прерывает и передаёт дальше: обычный
+   запрос получает 503 с ``X-Draining`` (шлюз повторит его на другой
+   реплике), поток — событие ошибки (начатый поток повторить нельзя);
+4. завершает процесс.
+
+Повторный ``SIGTERM`` во время drain завершает процесс сразу.
+
+``GET /admin/drain`` — состояние: сколько запросов в работе, сколько
+отклонено. Вызов ``POST /admin/drain`` требует заголовка ``X-Admin-Token``,
+если задан ``ADMIN_TOKEN``; без него — только с localhost напрямую (не
+через туннель).
+
+Переменные окружения:
+    DRAIN_TIMEOUT_S — сколько ждать запросы в работе, по умолчанию 120
+    ADMIN_TOKEN     — токен для ``POST /admin/drain``
+"""
+import asyncio
+import hmac
+import os
+import signal
+import time
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+# Срок drain истёк: запросы в работе прерываются и передаются другой реплике
+HANDOFF = asyncio.Event()
+
+DRAINING_HEADERS = {"Retry-After": "1", "X-Draining": "1", "Connection": "close"}
+
+# Сколько ждать, пока прерванные запросы отдадут ответ, перед выходом
+HANDOFF_GRACE_S = 5.0
+
+
+class Drain:
+    def __init__(self):
+        self.draining = False
+        self.reason = None
+        self.started = None
+        self.in_flight = 0
+        self.rejected = 0
+        self.handed_off = 0
+        self.timeout_s = float(os.environ.get("DRAIN_TIMEOUT_S", "120"))
+        self.task = None
+        self._idle = asyncio.Event()
+        self._exit = None
+
+    def start(self, reason):
+        if self.draining:
+            return
+        self.draining = True
+        self.reason = reason
+        self.started = time.monotonic()
+        print(f"🚰 Drain ({reason}): новые запросы не принимаются, "
+              f"в работе {self.in_flight}, ждём до {self.timeout_s:.0f} с")
+        self.task = asyncio.ensure_future(self._run())
+
+    async def _wait_idle(self, timeout):
+        if self.in_flight == 0:
+            return True
+        self._idle.clear()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _run(self):
+        if not await self._wait_idle(self.timeout_s):
+            self.handed_off = self.in_flight
+            print(f"⏱️  Срок drain истёк, прерываю и передаю дальше запросов: {self.in_flight}")
+            HANDOFF.set()
+            await self._wait_idle(HANDOFF_GRACE_S)
+        print(f"✅ Drain завершён за {time.monotonic() - self.started:.1f} с, выхожу")
+        self._stop_server()
+
+    def _stop_server(self):
+        # Обработчик uvicorn: штатная остановка сервера, как по обычному SIGTERM
+        if callable(self._exit):
+            self._exit(signal.SIGTERM, None)
+        else:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.raise_signal(signal.SIGTERM)
+
+    def install_signal_handler(self):
+        """SIGTERM запускает drain вместо немедленной остановки uvicorn.
+
+        Вызывается после того, как uvicorn поставил свои обработчики (на startup).
+        """
+        loop = asyncio.get_running_loop()
+        self._exit = signal.getsignal(signal.SIGTERM)
+
+        def on_sigterm(signum, frame):
+            if self.draining:
+                # Второй SIGTERM — выходим, не дожидаясь
+                self._stop_server()
+                return
+            loop.call_soon_threadsafe(self.start, "SIGTERM")
+
+        try:
+            signal.signal(signal.SIGTERM, on_sigterm)
+        except ValueError:
+            # Не главный поток (например, TestClient) — только через /admin/drain
+            pass
+
+    def request_started(self):
+        self.in_flight += 1
+
+    def request_finished(self):
+        self.in_flight -= 1
+        if self.in_flight == 0:
+            self._idle.set()
+
+    def stats(self):
+        return {
+            "draining": self.draining,
+            "reason": self.reason,
+            "elapsed_s": round(time.monotonic() - self.started, 1) if self.started else None,
+            "timeout_s": self.timeout_s,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "handed_off": self.handed_off,
+        }
+
+
+DRAIN = Drain()
+
+
+class DrainMiddleware:
+    """ASGI-middleware: считает POST-запросы в работе и отклоняет новые во время drain."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"].startswith("/admin/"):
+            await self.app(scope, receive, send)
+            return
+        if DRAIN.draining:
+            DRAIN.rejected += 1
+            response = JSONResponse(
+                {"detail": "Сервис перезапускается, повторите запрос", "reason": "drain"},
+                status_code=503,
+                headers=DRAINING_HEADERS,
+            )
+            await response(scope, receive, send)
+            return
+        DRAIN.request_started()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            DRAIN.request_finished()
+
+
+def admin_allowed(request: Request):
+    token = os.environ.get("ADMIN_TOKEN")
+    if token:
+        return hmac.compare_digest(request.headers.get("x-admin-token", ""), token)
+    # Запросы через туннель приходят с localhost, но с заголовками клиента
+    proxied = "cf-connecting-ip" in request.headers or "x-forwarded-for" in request.headers
+    return not proxied and request.client is not None and request.client.host in ("127.0.0.1", "::1")
+
+
+def add_drain_endpoints(app):
+    app.add_middleware(DrainMiddleware)
+
+    async def install():
+        DRAIN.install_signal_handler()
+
+    app.add_event_handler("startup", install)
+
+    @app.post("/admin/drain")
+    async def start_drain(request: Request):
+        if not admin_allowed(request):
+            raise HTTPException(status_code=403, detail="Нужен X-Admin-Token")
+        DRAIN.start("admin")
+        return DRAIN.stats()
+
+    @app.get("/admin/drain")
+    async def drain_status():
+        return DRAIN.stats()
@@ -0,0 +1,101 @@
+"""Служебные эндпоинты, общие для всех app_*.py."""
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from serving import metrics
+from serving.admission import AdmissionEngine, ClientIdMiddleware, Overloaded
+from serving.batching import MicroBatcher
+from serving.cache import CachingEngine
+from serving.cancellation import CancellationEngine, DisconnectMiddleware, RequestCancelled
+from serving.coalescing import CoalescingEngine
+from serving.drain import DRAINING_HEADERS, add_drain_endpoints
+from serving.engine import AsyncVLLMEngine, find_layer, prefix_cache_hit_rate, vllm_engine
+from serving.fairness import FairQueueEngine
+
+PREFIX_HIT_RATE = metrics.Gauge(
+    "llm_prefix_cache_hit_rate", "Доля блоков промпта из prefix cache vLLM", labels=("model",)
+)
+
+
+def add_service_endpoints(app, engine):
+    caching = find_layer(engine, CachingEngine)
+    coalescing = find_layer(engine, CoalescingEngine)
+    admission = find_layer(engine, AdmissionEngine)
+    cancellation = find_layer(engine, CancellationEngine)
+    fairness = find_layer(engine, FairQueueEngine)
+    app.add_middleware(DisconnectMiddleware)
+    app.add_middleware(ClientIdMiddleware)
+    app.add_middleware(metrics.EndpointLabelMiddleware)
+    # Drain — самым внешним: во время остановки новые запросы не доходят до слоёв
+    add_drain_endpoints(app)
+
+    @app.exception_handler(Overloaded)
+    async def overloaded(request, exc):
+        return JSONResponse(
+            status_code=429,
+            content={"detail": exc.detail, "reason": exc.reason},
+            headers={"Retry-After": str(exc.retry_after)},
+        )
+
+    @app.exception_handler(RequestCancelled)
+    async def cancelled(request, exc):
+        if exc.reason == "drain":
+            # Генерация прервана до ответа — шлюз повторит запрос на другой реплике
+            return JSONResponse(
+                status_code=503, content={"detail": exc.detail, "reason": exc.reason}, headers=DRAINING_HEADERS,
+            )
+        # 499 (как в nginx) клиент уже не увидит, но он попадёт в логи uvicorn
+        status_code = 504 if exc.reason == "deadline" else 499
+        return JSONResponse(status_code=status_code, content={"detail": exc.detail, "reason": exc.reason})
+
+    def collect_prefix_hit_rate():
+        hit_rate = prefix_cache_hit_rate(engine)
+        if hit_rate is not None:
+            PREFIX_HIT_RATE.set(hit_rate, engine.model_name)
+
+    metrics.COLLECTORS.append(collect_prefix_hit_rate)
+
+    @app.get("/metrics")
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/cache/stats")
+    async def cache_stats():
+        if caching is None:
+            return {"enabled": False}
+        return {"enabled": True, **caching.cache.stats()}
+
+    @app.get("/coalescing/stats")
+    async def coalescing_stats():
+        if coalescing is None:
+            return {"enabled": False}
+        return {"enabled": True, **coalescing.stats()}
+
+    @app.get("/admission/stats")
+    async def admission_stats():
+        if admission is None:
+            return {"enabled": False}
+        return {"enabled": True, **admission.stats()}
+
+    @app.get("/fairness/stats")
+    async def fairness_stats():
+        if fairness is None:
+            return {"enabled": False}
+        return {"enabled": True, **fairness.stats()}
+
+    @app.get("/cancellation/stats")
+    async def cancellation_stats():
+        batcher = find_layer(engine, MicroBatcher)
+        async_engine = find_layer(engine, AsyncVLLMEngine)
+        stats = cancellation.stats() if cancellation is not None else {"cancelled": {}}
+        if batcher is not None:
+            stats["dropped_before_gpu"] = batcher.dropped
+        if async_engine is not None:
+            stats["aborted_before_first_token"] = async_engine.aborted_queued
+            stats["aborted_while_decoding"] = async_engine.aborted_running
+        return stats
+
+    @app.get("/prefix_cache/stats")
+    async def prefix_cache_stats():
+        llm_engine = vllm_engine(engine)
+        enabled = llm_engine is not None and llm_engine.cache_config.enable_prefix_caching
+        return {"enabled": bool(enabled), "hit_rate": prefix_cache_hit_rate(engine)}
@@ -0,0 +1,395 @@
+"""Движки генерации за единым интерфейсом.
+
+Батч-движок (``VLLMEngine``, ``FakeEngine``) принимает список промптов и список
+SamplingParams (по одному на промпт) и возвращает список объектов в формате
+vLLM ``RequestOutput`` (``.outputs[0].text``, ``.outputs[0].token_ids``,
+``.prompt_token_ids``). Эндпоинты работают не с ним напрямую, а с объектом из
+``create_engine``: у него есть ``await generate(prompt, params, options)``,
+который возвращает один ``RequestOutput`` и не блокирует event loop, и
+асинхронный генератор ``stream(prompt, params, options)`` с накопленными
+промежуточными результатами. ``options`` — модель запроса (``GenerateOptions``)
+с флагами, которые читают отдельные слои.
+"""
+import asyncio
+import math
+import os
+import random
+import time
+import uuid
+import zlib
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional
+
+
+class VLLMEngine:
+    """Обёртка над ``vllm.LLM``: один вызов ``llm.generate`` на весь батч."""
+
+    def __init__(self, llm):
+        self.llm = llm
+
+    def generate(self, prompts, sampling_params):
+        return self.llm.generate(
+            prompts,
+            sampling_params=sampling_params,
+            use_tqdm=False,
+        )
+
+
+@dataclass
+class CompletionData:
+    """Аналог ``vllm.CompletionOutput`` без привязки к vLLM."""
+
+    index: int
+    text: str
+    token_ids: List[int]
+    cumulative_logprob: Optional[float] = None
+    finish_reason: Optional[str] = "length"
+
+
+@dataclass
+class RequestOutputData:
+    """Аналог ``vllm.RequestOutput``: его отдают заглушки и кэш ответов."""
+
+    request_id: str
+    prompt: Optional[str]
+    prompt_token_ids: List[int]
+    outputs: List[CompletionData] = field(default_factory=list)
+    finished: bool = True
+
+    @classmethod
+    def snapshot(cls, output):
+        """Копия любого ``RequestOutput`` в виде простых данных."""
+        return cls(
+            request_id=str(output.request_id),
+            prompt=output.prompt if isinstance(output.prompt, str) else None,
+            prompt_token_ids=list(output.prompt_token_ids or []),
+            outputs=[
+                CompletionData(
+                    index=c.index,
+                    text=c.text,
+                    token_ids=list(c.token_ids),
+                    cumulative_logprob=c.cumulative_logprob,
+                    finish_reason=c.finish_reason,
+                )
+                for c in output.outputs
+            ],
+            finished=output.finished,
+        )
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data["outputs"] = [CompletionData(**c) for c in data["outputs"]]
+        return cls(**data)
+
+
+def fake_tokenize(prompt):
+    # Грубая оценка: одно «слово» ~ один токен
+    if isinstance(prompt, dict):
+        return list(prompt.get("prompt_token_ids") or [])
+    return [hash(word) % 32000 for word in str(prompt).split()]
+
+
+def parse_output_tokens(value):
+    """Длина ответа заглушки: ``32`` — всегда 32 токена, ``lognormal:200:0.8`` —
+    логнормальное распределение с медианой 200 и sigma 0.8 (как у живых ответов:
+    большинство короткие, немногие очень длинные). Возвращает ``(медиана, sigma)``.
+    """
+    if isinstance(value, int):
+        return value, 0.0
+    kind, _, spec = str(value).partition(":")
+    if kind == "lognormal":
+        median, _, sigma = spec.partition(":")
+        return int(median), float(sigma or "1.0")
+    return int(value), 0.0
+
+
+def fake_word(t, index=0):
+    # Варианты ответа (n > 1) отличаются текстом, первый — как при n = 1
+    return f"tok{t}" if index == 0 else f"tok{t}.{index}"
+
+
+def fake_finish(completions, params, prompt):
+    """Logprob и отбор вариантов, как у vLLM: из ``best_of`` остаются ``n``
+    лучших по суммарному logprob. Logprob только если запрошен ``logprobs``.
+    """
+    n = getattr(params, "n", None) or 1
+    if getattr(params, "logprobs", None) is not None:
+        for c in completions:
+            rng = random.Random(zlib.crc32(repr((prompt, c.index)).encode()))
+            c.cumulative_logprob = -rng.uniform(0.1, 2.0) * len(c.token_ids)
+    if len(completions) > n:
+        completions = sorted(completions, key=lambda c: c.cumulative_logprob or 0.0, reverse=True)[:n]
+    return completions
+
+
+def fake_width(params):
+    # Сколько последовательностей генерируется на промпт: общий prefill, декод у каждой свой
+    n = getattr(params, "n", None) or 1
+    return max(getattr(params, "best_of", None) or n, n)
+
+
+class FakeEngine:
+    """CPU-заглушка для нагрузочных тестов без GPU.
+
+    Время батча моделируется как у настоящего движка: префилл пропорционален
+    суммарной длине промптов, декод идёт шагами по самой длинной генерации.
+    """
+
+    def __init__(self, prefill_tokens_per_s=None, decode_step_s=None, output_tokens=None):
+        self.prefill_tokens_per_s = prefill_tokens_per_s or float(
+            os.environ.get("FAKE_PREFILL_TPS", "20000")
+        )
+        self.decode_step_s = decode_step_s if decode_step_s is not None else float(
+            os.environ.get("FAKE_DECODE_STEP_MS", "20")
+        ) / 1000
+        self.output_tokens, self.output_sigma = parse_output_tokens(
+            output_tokens or os.environ.get("FAKE_OUTPUT_TOKENS", "32")
+        )
+        self.calls = 0
+
+    def _completion_tokens(self, params, prompt=None):
+        n_tokens = self.output_tokens
+        if self.output_sigma:
+            # Длина зависит только от промпта: повторный прогон даёт ту же нагрузку
+            rng = random.Random(zlib.crc32(repr(prompt).encode()))
+            n_tokens = max(round(rng.lognormvariate(math.log(self.output_tokens), self.output_sigma)), 1)
+        max_tokens = getattr(params, "max_tokens", None) or n_tokens
+        return min(max_tokens, n_tokens)
+
+    def generate(self, prompts, sampling_params, use_tqdm=False):
+        self.calls += 1
+        prompt_ids = [fake_tokenize(p) for p in prompts]
+        lengths = [self._completion_tokens(sp, p) for p, sp in zip(prompts, sampling_params)]
+
+        prefill_s = sum(len(ids) for ids in prompt_ids) / self.prefill_tokens_per_s
+        time.sleep(prefill_s + self.decode_step_s * max(lengths, default=0))
+
+        results = []
+        for i, (ids, n_tokens) in enumerate(zip(prompt_ids, lengths)):
+            token_ids = list(range(n_tokens))
+            completions = [
+                CompletionData(
+                    index=index,
+                    text=" ".join(fake_word(t, index) for t in token_ids),
+                    token_ids=list(token_ids),
+                )
+                for index in range(fake_width(sampling_params[i]))
+            ]
+            results.append(RequestOutputData(
+                request_id=str(i),
+                prompt=prompts[i] if isinstance(prompts[i], str) else None,
+                prompt_token_ids=ids,
+                outputs=fake_finish(completions, sampling_params[i], prompts[i]),
+            ))
+        return results
+
+
+class AsyncVLLMEngine:
+    """Обёртка над ``vllm.AsyncLLMEngine`` (continuous batching).
+
+    Движок сам планирует конкурентные запросы на уровне итераций декода,
+    а ``await`` отдаёт управление event loop'у на время генерации.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.in_flight = 0
+        # Прерванные запросы: до первого токена (ещё в очереди/prefill) и во время декода
+        self.aborted_queued = 0
+        self.aborted_running = 0
+
+    def load(self):
+        # Очередь и текущий батч планирует сам AsyncLLMEngine
+        return {"queued": None, "running": self.in_flight}
+
+    async def stream(self, prompt, sampling_params, options=None):
+        request_id = uuid.uuid4().hex
+        self.in_flight += 1
+        started = finished = False
+        try:
+            async for output in self.engine.generate(prompt, sampling_params, request_id):
+                started = True
+                finished = output.finished
+                yield output
+        finally:
+            self.in_flight -= 1
+            if not finished:
+                # Поток закрыли раньше конца (клиент ушёл, дедлайн): освобождаем
+                # место в батче и KV cache, а не догенерируем ответ впустую
+                if started:
+                    self.aborted_running += 1
+                else:
+                    self.aborted_queued += 1
+                await self.engine.abort(request_id)
+
+    async def generate(self, prompt, sampling_params, options=None):
+        final = None
+        async for output in self.stream(prompt, sampling_params, options):
+            final = output
+        return final
+
+
+class FakeAsyncLLMEngine:
+    """CPU-заглушка с интерфейсом ``vllm.AsyncLLMEngine``.
+
+    Отдаёт накопленный результат после каждого «декодированного» токена.
+    """
+
+    def __init__(self, prefill_tokens_per_s=None, decode_step_s=None, output_tokens=None):
+        self._timing = FakeEngine(prefill_tokens_per_s, decode_step_s, output_tokens)
+        self._aborted = set()
+
+    async def generate(self, prompt, sampling_params, request_id):
+        prompt_ids = fake_tokenize(prompt)
+        await asyncio.sleep(len(prompt_ids) / self._timing.prefill_tokens_per_s)
+
+        n_tokens = self._timing._completion_tokens(sampling_params, prompt)
+        completions = [
+            CompletionData(index=index, text="", token_ids=[], finish_reason=None)
+            for index in range(fake_width(sampling_params))
+        ]
+        output = RequestOutputData(
+            request_id=request_id,
+            prompt=prompt if isinstance(prompt, str) else None,
+            prompt_token_ids=prompt_ids,
+            outputs=list(completions),
+            finished=False,
+        )
+        try:
+            for t in range(n_tokens):
+                await asyncio.sleep(self._timing.decode_step_s)
+                if request_id in self._aborted:
+                    return
+                for completion in completions:
+                    completion.token_ids.append(t)
+                    completion.text += ("" if t == 0 else " ") + fake_word(t, completion.index)
+                if t == n_tokens - 1:
+                    for completion in completions:
+                        completion.finish_reason = "length"
+                    output.outputs = fake_finish(completions, sampling_params, prompt)
+                    output.finished = True
+                yield output
+        finally:
+            self._aborted.discard(request_id)
+
+    async def abort(self, request_id):
+        self._aborted.add(request_id)
+
+
+# Режим движка: batch — LLM + MicroBatcher в отдельном потоке,
+# async — AsyncLLMEngine с continuous batching
+ENGINE_MODE = os.environ.get("ENGINE_MODE", "batch").lower()
+
+# Бэкенд генерации: vllm — настоящая модель, fake — CPU-заглушка
+# (FAKE_PREFILL_TPS, FAKE_DECODE_STEP_MS, FAKE_OUTPUT_TOKENS) для нагрузочных тестов
+LLM_ENGINE = os.environ.get("LLM_ENGINE", "vllm").lower()
+
+
+def prefix_caching_enabled(default=True):
+    """Automatic prefix caching vLLM: общий префикс промптов (системное
+    сообщение, история диалога) не считается заново при каждом запросе.
+
+    Значение по умолчанию задаёт приложение модели, PREFIX_CACHING=true|false
+    его переопределяет.
+    """
+    value = os.environ.get("PREFIX_CACHING")
+    if value is None:
+        return default
+    return value.lower() == "true"
+
+
+def load_llm(**engine_kwargs):
+    """Создаёт ``LLM`` или ``AsyncLLMEngine`` в зависимости от ENGINE_MODE.
+
+    При LLM_ENGINE=fake вместо модели — CPU-заглушка с тем же интерфейсом:
+    приложение поднимается целиком (шаблоны, слои, эндпоинты) без GPU.
+    """
+    if LLM_ENGINE == "fake":
+        print(f"🧪 LLM_ENGINE=fake: заглушка вместо {engine_kwargs.get('model', 'модели')}")
+        return FakeAsyncLLMEngine() if ENGINE_MODE == "async" else FakeEngine()
+    if ENGINE_MODE == "async":
+        from vllm import AsyncEngineArgs, AsyncLLMEngine
+        return AsyncLLMEngine.from_engine_args(
+            AsyncEngineArgs(disable_log_requests=True, **engine_kwargs)
+        )
+    from vllm import LLM
+    return LLM(**engine_kwargs)
+
+
+def create_engine(llm, model_name):
+    """Оборачивает загруженную модель в объект с ``await generate(prompt, params)``.
+
+    Поверх базового движка навешиваются слои из переменных окружения
+    (склейка одинаковых запросов, кэш ответов и т.д.); каждый слой хранит следующий в атрибуте ``inner``.
+    """
+    if ENGINE_MODE == "async":
+        engine = AsyncVLLMEngine(llm)
+    else:
+        from serving.batching import MicroBatcher
+        engine = MicroBatcher(VLLMEngine(llm))
+
+    # Честная очередь — прямо перед движком: ответы из кэша и склеенные
+    # запросы места у движка не занимают
+    from serving.fairness import FairQueueEngine
+    engine = FairQueueEngine.wrap_from_env(engine, model_name)
+
+    from serving.coalescing import CoalescingEngine
+    engine = CoalescingEngine.wrap_from_env(engine)
+
+    from serving.cache import CachingEngine, ResponseCache
+    cache = ResponseCache.from_env(model_name)
+    if cache is not None:
+        engine = CachingEngine(engine, cache)
+
+    # Метрики снаружи: в них попадают и ответы из кэша, и склеенные запросы
+    from serving.metrics import MetricsEngine
+    engine = MetricsEngine(engine, model_name)
+
+    # Обрыв соединения и дедлайн прерывают генерацию во всех слоях ниже
+    from serving.cancellation import CancellationEngine
+    engine = CancellationEngine(engine, model_name)
+
+    # Ограничение нагрузки — самым внешним слоем: отклонённый запрос
+    # не занимает ни очередь, ни кэш, ни счётчики in-flight
+    from serving.admission import AdmissionEngine
+    return AdmissionEngine.wrap_from_env(engine, model_name)
+
+
+def vllm_engine(engine):
+    """``vllm.LLMEngine`` под цепочкой слоёв (или None для заглушек)."""
+    seen = set()
+    while engine is not None and id(engine) not in seen:
+        seen.add(id(engine))
+        if hasattr(engine, "scheduler"):
+            return engine
+        engine = next(
+            (getattr(engine, name) for name in ("inner", "engine", "llm", "llm_engine")
+             if getattr(engine, name, None) is not None),
+            None,
+        )
+    return None
+
+
+def prefix_cache_hit_rate(engine):
+    """Доля блоков промптов, найденных в prefix cache vLLM, или None."""
+    llm_engine = vllm_engine(engine)
+    if llm_engine is None or not llm_engine.cache_config.enable_prefix_caching:
+        return None
+    try:
+        from vllm.utils import Device
+        return llm_engine.scheduler[0].get_prefix_cache_hit_rate(Device.GPU)
+    except Exception:
+        return None
+
+
+def find_layer(engine, cls):
+    """Ищет слой заданного типа в цепочке, собранной ``create_engine``."""
+    while engine is not None:
+        if isinstance(engine, cls):
+            return engine
+        engine = getattr(engine, "inner", None)
+    return None
@@ -0,0 +1,227 @@
+"""Приоритеты и честная очередь между клиентами (weighted fair queuing).
+
+Один экземпляр модели делят интерактивный чат и массовые прогоны
+(оценки, ``/generate_batch``): без разделения прогон занимает все места в
+батче и чат ждёт. ``FairQueueEngine`` пускает к движку не больше
+``FAIR_SLOTS`` запросов одновременно, остальные ждут в очередях:
+
+* два класса приоритета — ``interactive`` и ``bulk`` (поле ``priority``
+  запроса; по умолчанию элементы ``/generate_batch`` — bulk, остальное —
+  interactive). Свободное место всегда сначала получает interactive;
+* ``FAIR_INTERACTIVE_SLOTS`` мест гарантированы interactive: пока был
+  интерактивный трафик за последние ``FAIR_IDLE_S`` секунд, bulk занимает не
+  больше ``FAIR_SLOTS - FAIR_INTERACTIVE_SLOTS``, а в простое — все места;
+* внутри класса клиенты (``X-Tenant``, API-ключ или IP) обслуживаются по
+  start-time fair queuing: запрос получает метку ``max(V, конец прошлого
+  запроса клиента)``, где стоимость — оценка токенов, делённая на вес клиента.
+  Клиент с сотней запросов в очереди не задерживает клиента с одним.
+
+Переменные окружения:
+    FAIR_SLOTS             — мест у движка, по умолчанию 0 (очередь выключена)
+    FAIR_INTERACTIVE_SLOTS — гарантированные места interactive, по умолчанию FAIR_SLOTS / 4 (не меньше 1)
+    FAIR_IDLE_S            — сколько секунд после interactive-запроса держать резерв, по умолчанию 5
+    FAIR_TENANT_WEIGHTS    — веса клиентов: ``chat:4,eval:1`` (по умолчанию вес 1)
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+from serving import metrics
+from serving.admission import CLIENT, estimate_tokens
+
+PRIORITIES = ("interactive", "bulk")
+
+FAIR_QUEUE_SECONDS = metrics.Histogram(
+    "llm_fair_queue_seconds", "Ожидание места у движка в честной очереди",
+    labels=("model", "tenant", "priority"),
+)
+
+# Дальше метка tenant одна на всех, чтобы не раздувать /metrics
+MAX_TENANT_LABELS = 100
+
+
+def parse_weights(value):
+    weights = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        tenant, _, weight = item.rpartition(":")
+        weights[tenant] = float(weight)
+    return weights
+
+
+def request_priority(options):
+    priority = getattr(options, "priority", None)
+    if priority in PRIORITIES:
+        return priority
+    return "bulk" if metrics.ENDPOINT.get().endswith("_batch") else "interactive"
+
+
+class _Waiter:
+    __slots__ = ("tenant", "priority", "tag", "future", "enqueued")
+
+    def __init__(self, tenant, priority, tag):
+        self.tenant = tenant
+        self.priority = priority
+        self.tag = tag
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class _TenantStats:
+    __slots__ = ("dispatched", "wait_s", "max_wait_s")
+
+    def __init__(self):
+        self.dispatched = 0
+        self.wait_s = 0.0
+        self.max_wait_s = 0.0
+
+
+class FairQueueEngine:
+    def __init__(self, inner, model_name, slots, interactive_slots=None, weights=None, idle_s=5.0):
+        self.inner = inner
+        self.model_name = model_name
+        self.slots = slots
+        if interactive_slots is None:
+            interactive_slots = max(slots // 4, 1) if slots > 1 else 0
+        self.interactive_slots = interactive_slots
+        self.weights = weights or {}
+        self.idle_s = idle_s
+
+        # класс -> клиент -> очередь ожидающих
+        self._queues = {priority: {} for priority in PRIORITIES}
+        # (класс, клиент) -> конец последнего запроса клиента в виртуальном времени
+        self._finish = {}
+        self._vtime = {priority: 0.0 for priority in PRIORITIES}
+        self.running = {priority: 0 for priority in PRIORITIES}
+        self._last_interactive = float("-inf")
+        self._labels = set()
+        self._stats = {}
+
+    @classmethod
+    def wrap_from_env(cls, inner, model_name):
+        slots = int(os.environ.get("FAIR_SLOTS", "0"))
+        if slots <= 0:
+            return inner
+        interactive_slots = os.environ.get("FAIR_INTERACTIVE_SLOTS")
+        return cls(
+            inner,
+            model_name,
+            slots,
+            interactive_slots=int(interactive_slots) if interactive_slots else None,
+            weights=parse_weights(os.environ.get("FAIR_TENANT_WEIGHTS", "")),
+            idle_s=float(os.environ.get("FAIR_IDLE_S", "5")),
+        )
+
+    def _bulk_limit(self):
+        interactive_active = (
+            self.running["interactive"] or self._queues["interactive"]
+            or time.monotonic() - self._last_interactive < self.idle_s
+        )
+        return self.slots - self.interactive_slots if interactive_active else self.slots
+
+    def _pop(self, priority):
+        queues = self._queues[priority]
+        while queues:
+            tenant = min(queues, key=lambda t: queues[t][0].tag)
+            waiter = queues[tenant].popleft()
+            if not queues[tenant]:
+                del queues[tenant]
+            if waiter.future.cancelled():
+                # Ушёл из очереди (клиент отключился, дедлайн)
+                continue
+            self._vtime[priority] = waiter.tag
+            return waiter
+        return None
+
+    def _dispatch(self):
+        while sum(self.running.values()) < self.slots:
+            waiter = self._pop("interactive")
+            if waiter is None:
+                if self.running["bulk"] >= self._bulk_limit():
+                    return
+                waiter = self._pop("bulk")
+                if waiter is None:
+                    return
+            self.running[waiter.priority] += 1
+            waiter.future.set_result(None)
+
+    def _release(self, priority):
+        self.running[priority] -= 1
+        self._dispatch()
+
+    def _tenant_label(self, tenant):
+        if tenant not in self._labels and len(self._labels) >= MAX_TENANT_LABELS:
+            return "other"
+        self._labels.add(tenant)
+        return tenant
+
+    async def _acquire(self, prompt, sampling_params, options):
+        tenant = CLIENT.get()
+        priority = request_priority(options)
+        if priority == "interactive":
+            self._last_interactive = time.monotonic()
+
+        key = (priority, tenant)
+        if len(self._finish) > 10000:
+            # Клиенты, чьи метки уже позади виртуального времени, ничего не должны
+            self._finish = {k: v for k, v in self._finish.items() if v > self._vtime[k[0]]}
+        tag = max(self._vtime[priority], self._finish.get(key, 0.0))
+        cost = max(estimate_tokens(prompt, sampling_params), 1) / self.weights.get(tenant, 1.0)
+        self._finish[key] = tag + cost
+
+        waiter = _Waiter(tenant, priority, tag)
+        self._queues[priority].setdefault(tenant, deque()).append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            # Место успели выдать, но задачу уже отменили — возвращаем его
+            if not waiter.future.cancelled():
+                self._release(priority)
+            raise
+
+        wait_s = time.monotonic() - waiter.enqueued
+        label = self._tenant_label(tenant)
+        FAIR_QUEUE_SECONDS.observe(wait_s, self.model_name, label, priority)
+        stats = self._stats.setdefault((label, priority), _TenantStats())
+        stats.dispatched += 1
+        stats.wait_s += wait_s
+        stats.max_wait_s = max(stats.max_wait_s, wait_s)
+        return priority
+
+    async def generate(self, prompt, sampling_params, options=None):
+        priority = await self._acquire(prompt, sampling_params, options)
+        try:
+            return await self.inner.generate(prompt, sampling_params, options)
+        finally:
+            self._release(priority)
+
+    async def stream(self, prompt, sampling_params, options=None):
+        priority = await self._acquire(prompt, sampling_params, options)
+        try:
+            async for output in self.inner.stream(prompt, sampling_params, options):
+                yield output
+        finally:
+            self._release(priority)
+
+    def stats(self):
+        return {
+            "slots": self.slots,
+            "interactive_slots": self.interactive_slots,
+            "bulk_limit": self._bulk_limit(),
+            "running": dict(self.running),
+            "queued": {
+                priority: sum(len(q) for q in queues.values())
+                for priority, queues in self._queues.items()
+            },
+            "tenants": [
+                {
+                    "tenant": tenant,
+                    "priority": priority,
+                    "dispatched": s.dispatched,
+                    "avg_wait_s": s.wait_s / s.dispatched,
+                    "max_wait_s": s.max_wait_s,
+                }
+                for (tenant, priority), s in sorted(self._stats.items())
+            ],
+        }
@@ -0,0 +1,81 @@
+"""Заглушки токенизатора и SamplingParams для ``LLM_ENGINE=fake``.
+
+С CPU-заглушкой движка сервис поднимается без GPU, но раньше ему всё равно
+были нужны пакет vllm (ради ``SamplingParams``) и токенизатор модели с HF
+Hub. ``FakeTokenizer`` — простой токенизатор со своим chat template
+(служебные теги вида ``<|user|>`` — отдельные токены, остальное — слова и
+пробелы), ``FakeSamplingParams`` принимает те же аргументы, что и vLLM.
+Шаблоны, сессии, кэш и слои движка работают с ними так же, как с
+настоящими.
+"""
+import re
+from types import SimpleNamespace
+
+SPECIAL_TOKENS = ("<|bos|>", "<|eos|>", "<|system|>", "<|user|>", "<|assistant|>", "<|end|>")
+
+# Служебный тег целиком, пробелы, слово без «<», одиночный «<»
+TOKEN_RE = re.compile(r"<\|[a-z]+\|>|\s+|[^\s<]+|<")
+
+
+class FakeTokenizer:
+    """Токенизатор без словаря: ID выдаются новым кускам текста по мере появления."""
+
+    def __init__(self):
+        self._ids = {token: i for i, token in enumerate(SPECIAL_TOKENS)}
+        self._pieces = list(SPECIAL_TOKENS)
+        self.bos_token_id = self._ids["<|bos|>"]
+        self.eos_token_id = self._ids["<|eos|>"]
+
+    def _id(self, piece):
+        token_id = self._ids.get(piece)
+        if token_id is None:
+            token_id = self._ids.setdefault(piece, len(self._pieces))
+            if token_id == len(self._pieces):
+                self._pieces.append(piece)
+        return token_id
+
+    def encode(self, text):
+        return [self._id(piece) for piece in TOKEN_RE.findall(text)]
+
+    def __call__(self, text, add_special_tokens=True, **kwargs):
+        ids = self.encode(text)
+        if add_special_tokens:
+            ids = [self.bos_token_id] + ids
+        return SimpleNamespace(input_ids=ids)
+
+    def decode(self, token_ids, skip_special_tokens=False, **kwargs):
+        pieces = []
+        for token_id in token_ids:
+            if 0 <= token_id < len(self._pieces):
+                piece = self._pieces[token_id]
+                if not (skip_special_tokens and piece in SPECIAL_TOKENS):
+                    pieces.append(piece)
+        return "".join(pieces)
+
+    def apply_chat_template(self, messages, tokenize=True, add_generation_prompt=False, **kwargs):
+        text = "".join(f"<|{m['role']}|>\n{m['content']}<|end|>\n" for m in messages)
+        if add_generation_prompt:
+            text += "<|assistant|>\n"
+        return self.encode(text) if tokenize else text
+
+
+class FakeSamplingParams:
+    """Аргументы как у ``vllm.SamplingParams``; поля, которые читают слои и заглушки движка."""
+
+    def __init__(self, n=1, best_of=None, temperature=1.0, top_p=1.0, top_k=-1, max_tokens=16,
+                 seed=None, logprobs=None, logits_processors=None, **kwargs):
+        self.n = n
+        self.best_of = best_of or n
+        self.temperature = temperature
+        self.top_p = top_p
+        self.top_k = top_k
+        self.max_tokens = max_tokens
+        self.seed = seed
+        self.logprobs = logprobs
+        self.logits_processors = logits_processors
+        self.__dict__.update(kwargs)
+
+    def __repr__(self):
+        # Кэш ответов и склейка запросов строят ключ из repr, как у vLLM
+        fields = ", ".join(f"{k}={v!r}" for k, v in sorted(self.__dict__.items()) if k != "logits_processors")
+        return f"FakeSamplingParams({fields})"
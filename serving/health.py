@@ -0,0 +1,185 @@
+"""Проверки живости и готовности вместо опроса ``/docs``.
+
+``/docs`` отдаётся сразу после старта uvicorn, хотя движок ещё ни разу не
+делал forward pass: первый настоящий запрос платил за компиляцию ядер и
+прогрев. Теперь при старте приложения в фоне прогоняется набор типичных
+промптов, и только после этого сервис считается готовым.
+
+* ``GET /health/live``  — процесс жив и обрабатывает HTTP (всегда 200).
+* ``GET /health/ready`` — 200 после прогрева, иначе 503 (в том числе во
+  время drain); в теле JSON с состоянием движка, прогрессом прогрева и
+  глубиной очереди.
+* ``GET /startup/status`` — то же тело, но всегда 200, плюс этапы старта
+  (какие идут сейчас и сколько заняли) и время до готовности. При запуске
+  через ``serving.launcher`` отвечает и пока модель ещё грузится.
+
+Переменные окружения:
+    WARMUP               — false: не прогревать, готов сразу после старта
+    WARMUP_PROMPTS       — JSONL-файл с телами запросов для прогрева
+                           (как у batch_runner.py); по умолчанию встроенный набор
+    WARMUP_MAX_TOKENS    — ограничение длины ответа при прогреве, по умолчанию 16
+    WARMUP_RETRIES       — сколько раз повторить неудачный прогрев, по умолчанию 3
+    WARMUP_RETRY_S       — пауза перед первым повтором, секунд (дальше удваивается), по умолчанию 5
+
+Если прогрев так и не удался, состояние — ``failed``: его видит run.sh и
+останавливает запуск, а не ждёт готовности, которой не будет.
+"""
+import asyncio
+import copy
+import json
+import os
+import time
+
+from fastapi.responses import JSONResponse
+
+from serving.drain import DRAIN
+from serving.engine import ENGINE_MODE
+from serving.metrics import ENDPOINT
+from serving.startup import mark_ready, startup_status
+
+# Короткий, средний и длинный промпт: прогреваются разные размеры prefill
+DEFAULT_WARMUP = [
+    {"prompt": "Привет! Ответь одним словом: как дела?"},
+    {"prompt": "Объясни простыми словами, что такое нейронная сеть и как она обучается."},
+    {"prompt": "Кратко перескажи текст.\n\n" + "Языковая модель генерирует текст токен за токеном, "
+               "опираясь на контекст запроса и ранее сгенерированные токены. " * 24},
+]
+
+
+def load_warmup_items():
+    if os.environ.get("WARMUP", "true").lower() != "true":
+        return []
+    path = os.environ.get("WARMUP_PROMPTS")
+    if not path:
+        return DEFAULT_WARMUP
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def engine_layers(engine):
+    layers = []
+    while engine is not None:
+        layers.append(type(engine).__name__)
+        engine = getattr(engine, "inner", None)
+    return layers
+
+
+def queue_depth(engine):
+    """Запросы в очереди и в работе у нижнего слоя цепочки (батчер или AsyncLLMEngine)."""
+    while engine is not None:
+        if hasattr(engine, "load"):
+            return engine.load()
+        engine = getattr(engine, "inner", None)
+    return None
+
+
+class Health:
+    def __init__(self, engine, request_model, prepare, warmup_items):
+        self.engine = engine
+        self.request_model = request_model
+        self.prepare = prepare
+        self.warmup_items = warmup_items
+        self.max_tokens = int(os.environ.get("WARMUP_MAX_TOKENS", "16"))
+        self.retries = int(os.environ.get("WARMUP_RETRIES", "3"))
+        self.retry_s = float(os.environ.get("WARMUP_RETRY_S", "5"))
+
+        self.state = "warming_up" if warmup_items else "ready"
+        self.warmed = 0
+        self.attempts = 0
+        self.warmup_s = None
+        self.error = None
+        self.started = time.monotonic()
+        self.task = None
+
+    @property
+    def ready(self):
+        # Во время drain трафик уходит на другие реплики
+        return self.state == "ready" and not DRAIN.draining
+
+    async def _warm_one(self, item):
+        # Прогрев не должен попадать в кэш ответов и склеиваться с живыми запросами
+        request = self.request_model(**{**item, "use_cache": False})
+        prompt, sampling_params = self.prepare(request)
+        sampling_params = copy.deepcopy(sampling_params)
+        sampling_params.max_tokens = min(sampling_params.max_tokens or self.max_tokens, self.max_tokens)
+        await self.engine.generate(prompt, sampling_params, request)
+        self.warmed += 1
+
+    async def warmup(self):
+        if not self.warmup_items:
+            mark_ready()
+            return
+        ENDPOINT.set("warmup")
+        print(f"🔥 Прогрев модели, промптов: {len(self.warmup_items)}...")
+        start = time.monotonic()
+        while True:
+            self.attempts += 1
+            self.warmed = 0
+            try:
+                # Первый промпт отдельно, остальные одним батчем
+                await self._warm_one(self.warmup_items[0])
+                await asyncio.gather(*(self._warm_one(item) for item in self.warmup_items[1:]))
+                break
+            except Exception as e:
+                self.error = f"{type(e).__name__}: {e}"
+            if self.attempts > self.retries:
+                self.state = "failed"
+                print(f"❌ Прогрев не удался после {self.attempts} попыток: {self.error}")
+                return
+            # Временная ошибка (нехватка памяти под батч, занятый GPU) не должна
+            # оставлять реплику неготовой навсегда
+            delay = self.retry_s * 2 ** (self.attempts - 1)
+            print(f"⚠️  Ошибка прогрева: {self.error}; повтор через {delay:g} с")
+            await asyncio.sleep(delay)
+        self.error = None
+        self.warmup_s = round(time.monotonic() - start, 2)
+        self.state = "ready"
+        print(f"✅ Прогрев завершён за {self.warmup_s} с, сервис готов")
+        mark_ready()
+
+    def status(self):
+        return {
+            "status": "draining" if DRAIN.draining else self.state,
+            "ready": self.ready,
+            "engine": {"mode": ENGINE_MODE, "layers": engine_layers(self.engine)},
+            "warmup": {
+                "done": self.warmed,
+                "total": len(self.warmup_items),
+                "attempts": self.attempts,
+                "seconds": self.warmup_s,
+                "error": self.error,
+            },
+            "queue": queue_depth(self.engine),
+            "uptime_s": round(time.monotonic() - self.started, 1),
+            "startup": startup_status(),
+        }
+
+
+def add_health_endpoints(app, engine, request_model, prepare, warmup_items=None):
+    """Регистрирует ``/health/live`` и ``/health/ready`` и запускает прогрев при старте.
+
+    ``prepare(request)`` — та же функция, что у одиночного эндпоинта.
+    """
+    if warmup_items is None:
+        warmup_items = load_warmup_items()
+    health = Health(engine, request_model, prepare, warmup_items)
+
+    async def start_warmup():
+        # Прогрев идёт в фоне: /health/live отвечает уже во время него
+        health.task = asyncio.ensure_future(health.warmup())
+
+    app.add_event_handler("startup", start_warmup)
+
+    @app.get("/health/live")
+    async def health_live():
+        return {"status": "alive"}
+
+    @app.get("/health/ready")
+    async def health_ready():
+        return JSONResponse(health.status(), status_code=200 if health.ready else 503)
+
+    @app.get("/startup/status")
+    async def startup_progress():
+        return health.status()
+
+    return health
@@ -0,0 +1,171 @@
+"""Запуск сервиса модели: порт слушается сразу, модель грузится в фоне.
+
+``python app_tlite.py`` грузит токенизатор и движок при импорте модуля, и
+uvicorn занимает порт только через несколько минут: до этого снаружи не
+видно, жив ли процесс и на каком он этапе, а проверка «свободен ли порт»
+в run.sh успевает устареть к моменту запуска. Лаунчер сначала сам
+занимает порт (при занятом — следующий, если разрешено ``PORT_SEARCH``) и
+пишет его в ``PORT_FILE``, поднимает uvicorn, а модуль приложения
+выполняет в фоновом потоке. Пока модуль грузится:
+
+* ``/health/live``    — 200;
+* ``/health/ready``   — 503 со статусом ``loading`` и этапами старта;
+* ``/startup/status`` — 200 с тем же телом (этапы, время с запуска процесса);
+* остальное           — 503 с ``Retry-After``.
+
+Когда модуль загружен, запускаются его обработчики startup (прогрев), и
+все запросы уходят в приложение. Если загрузка упала, процесс завершается
+с кодом 1, как и при обычном запуске.
+
+    HOST=0.0.0.0 PORT=8083 python -u -m serving.launcher app_tlite.py
+
+Переменные окружения:
+    HOST        — адрес, по умолчанию 0.0.0.0
+    PORT        — порт, по умолчанию 8000
+    PORT_SEARCH — сколько следующих портов пробовать, если PORT занят, по умолчанию 0
+    PORT_FILE   — файл, куда записать занятый порт
+"""
+import asyncio
+import os
+import runpy
+import socket
+import sys
+import threading
+import traceback
+
+import uvicorn
+from starlette.responses import JSONResponse
+
+from serving.startup import startup_status
+
+# Эти пути лаунчер отвечает сам, пока приложение не загружено
+LOADING_PATHS = ("/health/live", "/health/ready", "/startup/status")
+
+
+def bind_socket(host, port, search=0):
+    """Занимает первый свободный порт из ``port .. port + search``."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    for candidate in range(port, port + search + 1):
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            sock.bind((host, candidate))
+        except OSError:
+            sock.close()
+            continue
+        # Соединения, пришедшие до старта uvicorn, ждут в очереди, а не получают отказ
+        sock.listen(2048)
+        return sock, candidate
+    raise OSError(f"Порты {port}..{port + search} заняты")
+
+
+class LazyApp:
+    """ASGI-приложение, которое отвечает о ходе загрузки, пока нет настоящего."""
+
+    def __init__(self):
+        self.app = None
+        self.error = None
+        self.loop = None
+        self.started = threading.Event()
+
+    def status(self):
+        return {
+            "status": "failed" if self.error else "loading",
+            "ready": False,
+            "error": self.error,
+            "startup": startup_status(),
+        }
+
+    async def activate(self, app):
+        # Обработчики startup приложения (прогрев) — в цикле uvicorn, как при обычном запуске
+        await app.router.startup()
+        self.app = app
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.loop = asyncio.get_running_loop()
+                self.started.set()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.app is not None:
+                    await self.app.router.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if self.app is not None:
+            await self.app(scope, receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        if path == "/health/live":
+            response = JSONResponse({"status": "alive"})
+        elif path in LOADING_PATHS:
+            response = JSONResponse(self.status(), status_code=200 if path == "/startup/status" else 503)
+        else:
+            response = JSONResponse(
+                {"detail": "Модель загружается", **self.status()},
+                status_code=503,
+                headers={"Retry-After": "10"},
+            )
+        await response(scope, receive, send)
+
+
+def load_app(lazy, server, path):
+    try:
+        namespace = runpy.run_path(path, run_name="__launcher__")
+        app = namespace["app"]
+    except BaseException as e:
+        lazy.error = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+        print(f"❌ Не удалось загрузить {path}: {lazy.error}")
+        server.should_exit = True
+        return
+
+    lazy.started.wait()
+    try:
+        asyncio.run_coroutine_threadsafe(lazy.activate(app), lazy.loop).result()
+    except Exception as e:
+        lazy.error = f"{type(e).__name__}: {e}"
+        traceback.print_exc()
+        server.should_exit = True
+        return
+    print("✅ Приложение загружено, запросы идут в него")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Использование: python -m serving.launcher app_tlite.py")
+        sys.exit(2)
+    path = sys.argv[1]
+    # Модуль приложения видит свои аргументы, как при обычном запуске
+    sys.argv = sys.argv[1:]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+
+    host = os.environ.get("HOST", "0.0.0.0")
+    sock, port = bind_socket(host, int(os.environ.get("PORT", "8000")), int(os.environ.get("PORT_SEARCH", "0")))
+    # Приложение само читает PORT (например, для логов) — пусть видит настоящий
+    os.environ["PORT"] = str(port)
+    port_file = os.environ.get("PORT_FILE")
+    if port_file:
+        with open(port_file, "w") as f:
+            f.write(f"{port}\n")
+    print(f"🔌 Порт {port} занят, модель грузится в фоне (прогресс: /startup/status)")
+
+    lazy = LazyApp()
+    server = uvicorn.Server(uvicorn.Config(lazy, host=host, port=port, lifespan="on"))
+    threading.Thread(target=load_app, args=(lazy, server, path), name="app-loader", daemon=True).start()
+    server.run(sockets=[sock])
+    if lazy.error:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""Метрики Prometheus (``GET /metrics``) и разбивка задержки запроса по этапам.
+
+Для каждого запроса к движку измеряются:
+
+* ``queue``    — от прихода запроса до начала его обработки на GPU (ожидание
+  в микро-батчере и в планировщике vLLM);
+* ``template`` — рендеринг chat template в ``prepare``;
+* ``prefill``  — от начала обработки до первого токена;
+* ``decode``   — от первого токена до конца генерации;
+* ``ttft``     — время до первого токена с точки зрения клиента;
+* скорость декода (токенов в секунду), число токенов промпта и ответа.
+
+Этапы queue/prefill/decode берутся из ``RequestOutput.metrics`` vLLM; у
+ответов из кэша и у заглушек их нет, и эти гистограммы не пополняются.
+Все метрики помечены метками ``model`` и ``endpoint``, где ``endpoint`` —
+путь HTTP-запроса, внутри которого шла генерация (``warmup`` для прогрева).
+
+Формат вывода — текстовый формат Prometheus; отдельная библиотека не нужна.
+
+Переменные окружения:
+    REQUEST_LOG — false: не писать JSON-строку с таймингами каждого запроса
+                  в $LLM_LOG_DIR/requests-<model>.jsonl (по умолчанию пишется)
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+
+from serving.startup import LOG_DIR, model_slug
+
+# Путь HTTP-запроса, в рамках которого идёт генерация
+ENDPOINT = contextvars.ContextVar("endpoint", default="none")
+# Время рендеринга chat template последнего prepare() в этом контексте
+TEMPLATE_S = contextvars.ContextVar("template_s", default=None)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+RATE_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 500, 1000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=("model", "endpoint")):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value):
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, labels=("model", "endpoint")):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _render_value(self, key, value):
+        counts, total, count = value
+        lines = []
+        for bound, n in zip(self.buckets, counts):
+            le = 'le="%s"' % bound
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {n}")
+        le = 'le="+Inf"'
+        lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {count}")
+        return lines
+
+
+REGISTRY = []
+# Функции, обновляющие значения перед выдачей /metrics
+COLLECTORS = []
+
+REQUESTS = Counter("llm_requests_total", "Запросы к движку по статусу (ok, error, cancelled)",
+                   labels=("model", "endpoint", "status"))
+IN_FLIGHT = Gauge("llm_requests_in_flight", "Запросы, которые сейчас генерируются")
+REQUEST_SECONDS = Histogram("llm_request_seconds", "Полное время генерации запроса")
+QUEUE_SECONDS = Histogram("llm_queue_seconds", "Ожидание до начала обработки на GPU")
+TEMPLATE_SECONDS = Histogram("llm_template_render_seconds", "Рендеринг chat template")
+PREFILL_SECONDS = Histogram("llm_prefill_seconds", "Prefill: от начала обработки до первого токена")
+DECODE_SECONDS = Histogram("llm_decode_seconds", "Decode: от первого токена до конца генерации")
+TTFT_SECONDS = Histogram("llm_time_to_first_token_seconds", "Время до первого токена")
+TOKENS_PER_SECOND = Histogram("llm_decode_tokens_per_second", "Скорость декода одного запроса",
+                              buckets=RATE_BUCKETS)
+PROMPT_TOKENS = Histogram("llm_prompt_tokens", "Токенов в промпте", buckets=TOKEN_BUCKETS)
+COMPLETION_TOKENS = Histogram("llm_completion_tokens", "Токенов в ответе", buckets=TOKEN_BUCKETS)
+
+
+def render():
+    for collect in COLLECTORS:
+        collect()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Имя модели для метрик вне движка (рендеринг шаблона); задаёт MetricsEngine
+_model_name = None
+
+
+def timed_template(prepare):
+    """Декоратор для ``prepare(request)``: замеряет рендеринг chat template."""
+
+    @functools.wraps(prepare)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = prepare(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        TEMPLATE_S.set(elapsed)
+        if _model_name is not None:
+            TEMPLATE_SECONDS.observe(elapsed, _model_name, ENDPOINT.get())
+        return result
+
+    return wrapper
+
+
+class EndpointLabelMiddleware:
+    """ASGI-middleware: запоминает путь запроса для метки ``endpoint``."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            ENDPOINT.set(scope["path"])
+            TEMPLATE_S.set(None)
+        await self.app(scope, receive, send)
+
+
+class _Tracker:
+    def __init__(self, model_name):
+        self.model_name = model_name
+        self.endpoint = ENDPOINT.get()
+        self.template_s = TEMPLATE_S.get()
+        self.start_wall = time.time()
+        self.start = time.monotonic()
+        self.first_token = None
+        self.final = None
+        IN_FLIGHT.inc(model_name, self.endpoint)
+
+    def on_output(self, output, streamed=True):
+        self.final = output
+        if streamed and self.first_token is None and output.outputs and output.outputs[0].token_ids:
+            self.first_token = time.monotonic()
+
+    def finish(self, status):
+        labels = (self.model_name, self.endpoint)
+        IN_FLIGHT.dec(*labels)
+        REQUESTS.inc(*labels, status)
+        timing = {"total_s": time.monotonic() - self.start, "template_s": self.template_s}
+        REQUEST_SECONDS.observe(timing["total_s"], *labels)
+
+        output = self.final
+        if output is not None:
+            timing.update(self._stages(output))
+            timing["prompt_tokens"] = len(output.prompt_token_ids or [])
+            timing["completion_tokens"] = sum(len(c.token_ids) for c in output.outputs)
+            PROMPT_TOKENS.observe(timing["prompt_tokens"], *labels)
+            COMPLETION_TOKENS.observe(timing["completion_tokens"], *labels)
+            for histogram, key in (
+                (QUEUE_SECONDS, "queue_s"),
+                (PREFILL_SECONDS, "prefill_s"),
+                (DECODE_SECONDS, "decode_s"),
+                (TTFT_SECONDS, "ttft_s"),
+            ):
+                if timing.get(key) is not None:
+                    histogram.observe(timing[key], *labels)
+            decode_s = timing.get("decode_s")
+            tokens = timing["completion_tokens"]
+            if decode_s:
+                timing["tokens_per_s"] = (tokens - 1) / decode_s
+            elif tokens:
+                timing["tokens_per_s"] = tokens / timing["total_s"]
+            if timing.get("tokens_per_s"):
+                TOKENS_PER_SECOND.observe(timing["tokens_per_s"], *labels)
+
+        log_request({"model": self.model_name, "endpoint": self.endpoint, "status": status, **timing})
+
+    def _stages(self, output):
+        stages = {}
+        metrics = getattr(output, "metrics", None)
+        scheduled = getattr(metrics, "first_scheduled_time", None)
+        first_token = getattr(metrics, "first_token_time", None)
+        finished = getattr(metrics, "finished_time", None)
+        if scheduled:
+            # Отсчёт от прихода в наш сервис, а не в vLLM: так в очередь
+            # попадает и ожидание в микро-батчере
+            stages["queue_s"] = max(scheduled - self.start_wall, 0.0)
+        if scheduled and first_token:
+            stages["prefill_s"] = first_token - scheduled
+        if first_token and finished:
+            stages["decode_s"] = finished - first_token
+        if first_token:
+            stages["ttft_s"] = max(first_token - self.start_wall, 0.0)
+        elif self.first_token is not None:
+            # Нет отметок vLLM (заглушка): первый токен, увиденный в потоке
+            stages["ttft_s"] = self.first_token - self.start
+        return stages
+
+
+_log_lock = threading.Lock()
+
+
+def log_request(record):
+    if os.environ.get("REQUEST_LOG", "true").lower() != "true":
+        return
+    record = {"ts": round(time.time(), 3), **{
+        k: round(v, 4) if isinstance(v, float) else v for k, v in record.items()
+    }}
+    try:
+        os.makedirs(LOG_DIR, exist_ok=True)
+        path = os.path.join(LOG_DIR, f"requests-{model_slug(record['model'])}.jsonl")
+        with _log_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError:
+        pass
+
+
+class MetricsEngine:
+    """Внешний слой движка: считает метрики по каждому запросу."""
+
+    def __init__(self, inner, model_name):
+        global _model_name
+        self.inner = inner
+        self.model_name = model_name
+        _model_name = model_name
+
+    async def generate(self, prompt, sampling_params, options=None):
+        tracker = _Tracker(self.model_name)
+        status = "cancelled"
+        try:
+            output = await self.inner.generate(prompt, sampling_params, options)
+            tracker.on_output(output, streamed=False)
+            status = "ok"
+            return output
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            tracker.finish(status)
+
+    async def stream(self, prompt, sampling_params, options=None):
+        tracker = _Tracker(self.model_name)
+        status = "cancelled"
+        try:
+            async for output in self.inner.stream(prompt, sampling_params, options):
+                tracker.on_output(output)
+                yield output
+            status = "ok"
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            tracker.finish(status)
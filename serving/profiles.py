@@ -0,0 +1,146 @@
+"""Запоминание рабочих параметров движка вместо перезагрузки при ошибках KV cache.
+
+Раньше каждый старт на той же машине сначала пробовал загрузить модель с
+большим ``max_model_len``, получал ``ValueError`` про KV cache и грузил
+модель заново с меньшими параметрами. Теперь удачная конфигурация
+сохраняется в профиль (модель + «отпечаток» железа), и следующий старт сразу
+использует её.
+
+Если профиля нет, можно оценить ёмкость KV cache заранее (KV_PREFLIGHT=true):
+по конфигу модели, размеру весов и памяти GPU выбирается наибольший
+контекст, который поместится, без пробной загрузки.
+"""
+import hashlib
+import json
+import os
+
+from serving.engine import LLM_ENGINE, load_llm
+from serving.startup import load_state, model_slug, save_state
+
+# Запас памяти под активации и CUDA graphs, которые не входят в KV cache
+ACTIVATION_RESERVE_BYTES = int(float(os.environ.get("KV_PREFLIGHT_RESERVE_GB", "1.5")) * 1024 ** 3)
+
+DTYPE_BYTES = {"float16": 2, "bfloat16": 2, "float32": 4}
+
+
+def is_kv_cache_error(error):
+    message = str(error).lower()
+    return "max seq len" in message or "kv cache" in message
+
+
+def gpu_inventory():
+    try:
+        import torch
+        if not torch.cuda.is_available():
+            return []
+        return [
+            {
+                "name": torch.cuda.get_device_name(i),
+                "total_memory": torch.cuda.get_device_properties(i).total_memory,
+            }
+            for i in range(torch.cuda.device_count())
+        ]
+    except Exception:
+        return []
+
+
+def hardware_fingerprint():
+    try:
+        import vllm
+        vllm_version = vllm.__version__
+    except Exception:
+        vllm_version = None
+    raw = json.dumps({"gpus": gpu_inventory(), "vllm": vllm_version}, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def profile_name(model_name):
+    return f"profile-{model_slug(model_name)}-{hardware_fingerprint()}.json"
+
+
+def cached_weights_bytes(model_name):
+    from huggingface_hub import snapshot_download
+    try:
+        snapshot = snapshot_download(model_name, local_files_only=True)
+    except Exception:
+        return None
+    total = 0
+    for root, _, files in os.walk(snapshot):
+        for name in files:
+            if name.endswith((".safetensors", ".bin")):
+                total += os.path.getsize(os.path.join(root, name))
+    return total or None
+
+
+def estimate_max_model_len(model_name, gpu_memory_utilization, requested, trust_remote_code=False):
+    """Наибольший контекст, для которого одна последовательность влезет в KV cache.
+
+    Возвращает None, если оценку сделать не из чего (нет GPU, весов в кэше и т.п.).
+    """
+    gpus = gpu_inventory()
+    weights = cached_weights_bytes(model_name)
+    if not gpus or weights is None:
+        return None
+    from transformers import AutoConfig
+    config = AutoConfig.from_pretrained(model_name, trust_remote_code=trust_remote_code)
+    text_config = getattr(config, "text_config", None) or config
+
+    layers = text_config.num_hidden_layers
+    heads = text_config.num_attention_heads
+    kv_heads = getattr(text_config, "num_key_value_heads", None) or heads
+    head_dim = getattr(text_config, "head_dim", None) or text_config.hidden_size // heads
+    dtype_bytes = DTYPE_BYTES.get(str(getattr(text_config, "torch_dtype", "float16")).replace("torch.", ""), 2)
+    kv_bytes_per_token = 2 * layers * kv_heads * head_dim * dtype_bytes
+
+    budget = gpus[0]["total_memory"] * gpu_memory_utilization - weights - ACTIVATION_RESERVE_BYTES
+    if budget <= 0:
+        return None
+    capacity = int(budget // kv_bytes_per_token)
+    limit = getattr(text_config, "max_position_embeddings", None) or requested
+    # Округляем вниз до размера блока, кратного 256
+    return max(min(requested, limit, capacity) // 256 * 256, 256)
+
+
+def load_llm_profiled(model_name, candidates, **engine_kwargs):
+    """Загружает модель, начиная с сохранённой рабочей конфигурации.
+
+    ``candidates`` — список словарей с ``max_model_len`` и
+    ``gpu_memory_utilization`` в порядке предпочтения (как раньше в цепочке
+    try/except). Возвращает ``(llm, config)``; удачный ``config``
+    сохраняется в профиль.
+    """
+    requested = dict(candidates[0])
+    if LLM_ENGINE == "fake":
+        # Заглушке профиль машины и оценка KV cache не нужны
+        return load_llm(model=model_name, **requested, **engine_kwargs), requested
+
+    name = profile_name(model_name)
+    profile = load_state(name)
+
+    attempts = []
+    if profile and profile.get("requested") == requested:
+        print(f"📋 Профиль для этой машины: {profile['config']}")
+        attempts.append(profile["config"])
+    elif os.environ.get("KV_PREFLIGHT", "false").lower() == "true":
+        estimated = estimate_max_model_len(
+            model_name,
+            requested["gpu_memory_utilization"],
+            requested["max_model_len"],
+            trust_remote_code=engine_kwargs.get("trust_remote_code", False),
+        )
+        if estimated is not None:
+            print(f"📐 Оценка ёмкости KV cache: max_model_len={estimated}")
+            attempts.append({**requested, "max_model_len": estimated})
+    attempts.extend(c for c in candidates if c not in attempts)
+
+    for i, config in enumerate(attempts):
+        try:
+            llm = load_llm(model=model_name, **config, **engine_kwargs)
+        except ValueError as e:
+            if not is_kv_cache_error(e) or i == len(attempts) - 1:
+                raise
+            print(f"⚠️  Ошибка с max_model_len={config['max_model_len']}: {str(e)[:300]}")
+            print(f"💡 Пробую {attempts[i + 1]}...")
+            continue
+        save_state(name, {"model": model_name, "requested": requested, "config": config})
+        return llm, config
@@ -0,0 +1,237 @@
+"""Бюджет рассуждений для reasoning-моделей (DeepSeek-R1, GPT-OSS).
+
+Такие модели тратят большую часть ``max_tokens`` на блок рассуждений, и
+задержка с временем GPU уходит на токены, которые потом выбрасываются.
+``reasoning_budget`` ограничивает рассуждения: после стольких токенов
+logits processor принудительно закрывает блок рассуждений (подставляет
+токены закрытия по одному) и модель переходит к ответу — в том же проходе,
+без повторного prefill.
+
+Поле ``reasoning`` управляет ответом:
+
+    inline   — как раньше: текст модели целиком
+    strip    — только финальный ответ; в потоке идут только его токены
+    separate — ответ в ``response``, рассуждения в ``reasoning``; в потоке —
+               события ``{"reasoning": ...}`` и ``{"delta": ...}``
+
+Режим действует во всех эндпоинтах модели: одиночном, батче, ``/chat`` и
+сессиях; в историю сессии сохраняется только финальный ответ. Токены
+рассуждений и ответа считаются отдельно в ``/metrics``.
+
+Переменные окружения:
+    REASONING_BUDGET — бюджет по умолчанию, токенов (по умолчанию без ограничения)
+    REASONING_MODE   — inline | strip | separate, по умолчанию inline
+"""
+import os
+
+from serving import metrics
+from serving.streaming import sse_event, usage
+
+REASONING_MODES = ("inline", "strip", "separate")
+
+REASONING_TOKENS = metrics.Counter("llm_reasoning_tokens_total", "Токены в блоке рассуждений")
+ANSWER_TOKENS = metrics.Counter("llm_answer_tokens_total", "Токены финального ответа после рассуждений")
+BUDGET_HITS = metrics.Counter(
+    "llm_reasoning_budget_hits_total", "Ответы, в которых рассуждения закрыты по бюджету"
+)
+REASONING_SHARE = metrics.Histogram(
+    "llm_reasoning_token_share", "Доля токенов рассуждений в ответе",
+    buckets=(0.1, 0.25, 0.5, 0.75, 0.9, 0.95, 1.0),
+)
+
+
+class ReasoningFormat:
+    """Разметка блока рассуждений.
+
+    ``start``/``close`` — как начало и конец рассуждений выглядят в тексте
+    ответа, ``close_tokens`` — текст токенов конца рассуждений (для поиска
+    по ID токенов), ``force`` — что подставить, чтобы закрыть рассуждения и
+    начать ответ.
+    """
+
+    def __init__(self, start, close, force, close_tokens=None):
+        self.start = start
+        self.close = close
+        self.force = force
+        self.close_tokens = close_tokens or close
+
+    def split(self, text, finish_reason=None):
+        """``(reasoning, answer)``; пока рассуждения не закрыты, ответ пустой."""
+        if self.start.startswith(text):
+            # Разметка начала ещё не пришла целиком
+            return "", ""
+        if text.startswith(self.start):
+            text = text[len(self.start):]
+        i = text.find(self.close)
+        if i >= 0:
+            return text[:i].lstrip(), text[i + len(self.close):].lstrip()
+        if finish_reason == "stop":
+            # Закончил без рассуждений — весь текст и есть ответ
+            return "", text.lstrip()
+        # Не отдаём как рассуждения начало разметки конца, пришедшее не целиком
+        for n in range(min(len(self.close) - 1, len(text)), 0, -1):
+            if self.close.startswith(text[-n:]):
+                text = text[:-n]
+                break
+        return text.lstrip(), ""
+
+
+# DeepSeek-R1 и его дистилляты: <think> ... </think> ответ
+THINK_TAGS = ReasoningFormat(start="<think>", close="</think>", force="\n</think>\n\n")
+
+# Формат harmony (gpt-oss). Служебные токены vLLM из текста убирает,
+# остаются названия каналов: "analysis...assistantfinal..."
+HARMONY = ReasoningFormat(
+    start="analysis",
+    close="assistantfinal",
+    close_tokens="<|end|>",
+    force="<|end|><|start|>assistant<|channel|>final<|message|>",
+)
+
+
+def find_sequence(token_ids, sequence, end=None):
+    """Позиция первого вхождения ``sequence`` в ``token_ids[:end]`` или -1."""
+    n = len(sequence)
+    end = len(token_ids) if end is None else end
+    first = sequence[0]
+    for i in range(end - n + 1):
+        if token_ids[i] == first and list(token_ids[i:i + n]) == sequence:
+            return i
+    return -1
+
+
+class ReasoningBudget:
+    """Logits processor vLLM: после ``budget`` токенов без закрытия рассуждений
+    по одному подставляет токены ``force_ids``.
+
+    Не хранит состояния — всё выводится из уже сгенерированных токенов,
+    поэтому один объект можно разделять между последовательностями (n > 1).
+    """
+
+    def __init__(self, budget, close_ids, force_ids):
+        self.budget = budget
+        self.close_ids = close_ids
+        self.force_ids = force_ids
+
+    def __call__(self, token_ids, logits):
+        k = len(token_ids) - self.budget
+        if k < 0 or k >= len(self.force_ids):
+            return logits
+        # Уже начали подставлять или только дошли до бюджета
+        if list(token_ids[self.budget:]) != self.force_ids[:k]:
+            return logits
+        if find_sequence(token_ids, self.close_ids, end=self.budget) >= 0:
+            return logits
+        token = self.force_ids[k]
+        logits.fill_(float("-inf"))
+        logits[token] = 0.0
+        return logits
+
+    def __repr__(self):
+        # Попадает в ключ кэша ответов и склейки запросов
+        return f"ReasoningBudget({self.budget})"
+
+
+class Reasoning:
+    """Бюджет и разбор рассуждений для одной модели."""
+
+    def __init__(self, tokenizer, fmt, model_name):
+        self.format = fmt
+        self.model_name = model_name
+        self.close_ids = tokenizer(fmt.close_tokens, add_special_tokens=False).input_ids
+        self.force_ids = tokenizer(fmt.force, add_special_tokens=False).input_ids
+        # Где в подставляемых токенах стоит закрытие рассуждений
+        self.close_offset = max(find_sequence(self.force_ids, self.close_ids), 0)
+        budget = os.environ.get("REASONING_BUDGET")
+        self.default_budget = int(budget) if budget else None
+        self.default_mode = os.environ.get("REASONING_MODE", "inline")
+        if self.default_mode not in REASONING_MODES:
+            self.default_mode = "inline"
+
+    def budget(self, request):
+        budget = getattr(request, "reasoning_budget", None)
+        return self.default_budget if budget is None else budget
+
+    def mode(self, request):
+        return getattr(request, "reasoning", None) or self.default_mode
+
+    def apply(self, sampling_params, request):
+        """Добавляет бюджет к SamplingParams запроса."""
+        budget = self.budget(request)
+        if budget is not None and budget < sampling_params.max_tokens:
+            sampling_params.logits_processors = [
+                *(sampling_params.logits_processors or []),
+                ReasoningBudget(budget, self.close_ids, self.force_ids),
+            ]
+        return sampling_params
+
+    def observe(self, output, request):
+        """Счётчики токенов рассуждений и ответа по завершённому ответу."""
+        labels = (self.model_name, metrics.ENDPOINT.get())
+        token_ids = output.outputs[0].token_ids
+        i = find_sequence(token_ids, self.close_ids) if token_ids else -1
+        if i < 0:
+            # Закончил без рассуждений или упёрся в max_tokens, не закрыв их
+            reasoning_tokens = 0 if output.outputs[0].finish_reason == "stop" else len(token_ids)
+        else:
+            reasoning_tokens = i
+            budget = self.budget(request)
+            if budget is not None and i == budget + self.close_offset:
+                BUDGET_HITS.inc(*labels)
+        answer_tokens = len(token_ids) - reasoning_tokens
+        REASONING_TOKENS.inc(*labels, amount=reasoning_tokens)
+        ANSWER_TOKENS.inc(*labels, amount=answer_tokens)
+        if token_ids:
+            REASONING_SHARE.observe(reasoning_tokens / len(token_ids), *labels)
+        return reasoning_tokens, answer_tokens
+
+    def response(self, output, request):
+        """Тело ответа одиночного эндпоинта."""
+        reasoning_tokens, answer_tokens = self.observe(output, request)
+        completion = output.outputs[0]
+        mode = self.mode(request)
+        if mode == "inline":
+            return {"response": completion.text.strip()}
+        reasoning, answer = self.format.split(completion.text, completion.finish_reason)
+        body = {"response": answer.strip()}
+        if mode == "separate":
+            body["reasoning"] = reasoning.strip()
+            body["usage"] = {"reasoning_tokens": reasoning_tokens, "answer_tokens": answer_tokens}
+        return body
+
+    def answer(self, output):
+        """Только финальный ответ, без рассуждений — он и сохраняется в истории сессии."""
+        completion = output.outputs[0]
+        return self.format.split(completion.text, completion.finish_reason)[1].strip()
+
+    def events(self, request):
+        """Генератор SSE-событий для ``stream_response`` с учётом режима ``reasoning``."""
+        mode = self.mode(request)
+
+        async def sse_answer(outputs):
+            sent_reasoning = sent_answer = ""
+            final = None
+            try:
+                async for output in outputs:
+                    final = output
+                    completion = output.outputs[0]
+                    if mode == "inline":
+                        reasoning, answer = "", completion.text
+                    else:
+                        reasoning, answer = self.format.split(completion.text, completion.finish_reason)
+                    if mode == "separate" and len(reasoning) > len(sent_reasoning):
+                        yield sse_event({"reasoning": reasoning[len(sent_reasoning):]})
+                        sent_reasoning = reasoning
+                    if len(answer) > len(sent_answer):
+                        yield sse_event({"delta": answer[len(sent_answer):]})
+                        sent_answer = answer
+            except Exception as e:
+                yield sse_event({"error": str(e)})
+                return
+            if final is not None:
+                reasoning_tokens, answer_tokens = self.observe(final, request)
+                yield sse_event({"done": True, "usage": {
+                    **usage(final), "reasoning_tokens": reasoning_tokens, "answer_tokens": answer_tokens,
+                }})
+
+        return sse_answer
@@ -0,0 +1,12 @@
+"""``SamplingParams`` для приложений: из vLLM или заглушка при ``LLM_ENGINE=fake``.
+
+С заглушкой движка пакет vllm не нужен вовсе: приложение импортирует
+``SamplingParams`` отсюда, а не из ``vllm``.
+"""
+from serving.engine import LLM_ENGINE
+
+if LLM_ENGINE == "fake":
+    from serving.fake import FakeSamplingParams as SamplingParams
+else:
+    from vllm import SamplingParams
+
@@ -0,0 +1,19 @@
+"""Общие поля запросов, одинаковые для всех моделей.
+
+Каждый app_*.py наследует от ``GenerateOptions`` свой ``GenerateRequest``
+с промптом и дефолтами сэмплинга конкретной модели.
+"""
+from typing import Literal, Optional
+
+from pydantic import BaseModel
+
+
+class GenerateOptions(BaseModel):
+    # Отдавать ответ потоком Server-Sent Events по мере генерации токенов
+    stream: bool = False
+    # false — не читать и не записывать кэш ответов для этого запроса
+    use_cache: bool = True
+    # Дедлайн в секундах: не успели — генерация прерывается (504)
+    timeout_s: Optional[float] = None
+    # Класс приоритета; по умолчанию /generate_batch — bulk, остальное — interactive
+    priority: Optional[Literal["interactive", "bulk"]] = None
@@ -0,0 +1,444 @@
+"""Сессии диалога с токенизированной историей на сервере.
+
+Вместо того чтобы присылать всю историю в одном ``prompt``, клиент создаёт
+сессию, добавляет в неё сообщения и просит сгенерировать ответ:
+
+    POST   /sessions                     {"system": "..."} → {"session_id": ...}
+    POST   /sessions/{id}/messages       {"role": "user", "content": "..."}
+    POST   /sessions/{id}/generate       поля GenerateRequest; prompt — ещё одно
+                                         сообщение пользователя (необязательно)
+    GET    /sessions/{id}, DELETE /sessions/{id}, GET /sessions/stats
+
+Сервер хранит историю как ID токенов по ходам. Обёртку шаблона для каждой
+роли (служебные токены до и после текста) ``IncrementalTemplate`` считает
+один раз, поэтому новый ход — это токенизация только его текста. Ответ
+модели добавляется в историю как сообщение assistant.
+
+Инкрементальная сборка совпадает с полным ``apply_chat_template`` не для
+всех шаблонов: некоторые переносят системное сообщение или вырезают
+рассуждения из прошлых ответов. Поэтому при старте сборка сверяется с полным
+рендерингом на примерах диалогов; при расхождении сессии этой модели
+рендерятся целиком на каждом ходу (медленнее, но корректно).
+
+Когда история с запасом на ответ перестаёт помещаться в ``max_model_len``,
+из неё удаляются самые старые ходы; системное сообщение остаётся. Запас на
+ответ — ``max_tokens``, но не больше половины контекста: у многих моделей
+``max_tokens`` равен всему ``max_model_len``. Ответ получает ``max_tokens``,
+урезанный до места, оставшегося после промпта. Сессии вытесняются по LRU
+при превышении числа сессий или общего числа токенов.
+
+Переменные окружения:
+    SESSIONS_MAX            — сколько сессий хранить, по умолчанию 1024
+    SESSIONS_MAX_TOKENS     — токенов во всех сессиях суммарно, по умолчанию 4000000
+"""
+import asyncio
+import os
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from fastapi import HTTPException
+from pydantic import BaseModel, create_model
+
+from serving.engine import vllm_engine
+from serving.streaming import stream_response
+from serving.templates import SENTINEL
+
+PROBE = {"role": "user", "content": "A"}
+
+# Диалоги для сверки инкрементальной сборки с полным рендерингом
+VERIFY_DIALOGS = [
+    [
+        {"role": "user", "content": "Привет!"},
+        {"role": "assistant", "content": "Здравствуйте! Чем помочь?"},
+        {"role": "user", "content": "Расскажи про Python."},
+    ],
+    [
+        {"role": "system", "content": "Ты полезный ассистент."},
+        {"role": "user", "content": "Сколько будет 2+2?"},
+        {"role": "assistant", "content": "4"},
+        {"role": "user", "content": "А 3+3?"},
+        {"role": "assistant", "content": "6"},
+        {"role": "user", "content": "Спасибо"},
+    ],
+]
+
+
+class IncrementalTemplate:
+    """ID токенов диалога, собираемые из заранее токенизированных обёрток ролей."""
+
+    def __init__(self, chat_template):
+        self.chat_template = chat_template
+        self.tokenizer = chat_template.tokenizer
+        self.add_special_tokens = chat_template.add_special_tokens
+        self.incremental = False
+        try:
+            self._build()
+            self.incremental = self._verify()
+        except Exception as e:
+            print(f"⚠️  Инкрементальная сборка шаблона недоступна: {e}")
+        if not self.incremental:
+            print("ℹ️  Сессии будут рендерить шаблон целиком на каждом ходу")
+
+    def _render(self, messages, add_generation_prompt=False):
+        return self.tokenizer.apply_chat_template(
+            messages, tokenize=False, add_generation_prompt=add_generation_prompt
+        )
+
+    def _encode(self, text, add_special_tokens=False):
+        return self.tokenizer(text, add_special_tokens=add_special_tokens).input_ids
+
+    def _build(self):
+        base = self._render([PROBE])
+        with_prompt = self._render([PROBE], add_generation_prompt=True)
+        if not with_prompt.startswith(base):
+            raise ValueError("приглашение ассистента не дописывается в конец")
+        self.generation_ids = self._encode(with_prompt[len(base):])
+
+        # Обёртка сообщения каждой роли в середине диалога
+        self.segments = {}
+        texts = {}
+        for role in ("user", "assistant", "system"):
+            try:
+                text = self._render([PROBE, {"role": role, "content": SENTINEL}])
+            except Exception:
+                continue
+            if text.startswith(base) and text.count(SENTINEL) == 1:
+                texts[role] = text[len(base):].split(SENTINEL)
+                self.segments[role] = tuple(self._encode(t) for t in texts[role])
+        if "user" not in texts:
+            raise ValueError("не удалось выделить обёртку сообщения пользователя")
+
+        # Начало диалога, который открывается сообщением пользователя:
+        # BOS и системное сообщение по умолчанию, если шаблон его подставляет
+        first = self._render([{"role": "user", "content": SENTINEL}]).split(SENTINEL)[0]
+        user_pre = texts["user"][0]
+        if not first.endswith(user_pre):
+            raise ValueError("первое сообщение пользователя обёрнуто иначе, чем остальные")
+        self.head_ids = self._encode(first[: len(first) - len(user_pre)], self.add_special_tokens)
+
+        # Диалог, который открывается системным сообщением
+        self.system_head = None
+        probe_text = "".join((texts["user"][0], PROBE["content"], texts["user"][1]))
+        try:
+            text = self._render([{"role": "system", "content": SENTINEL}, PROBE])
+        except Exception:
+            text = ""
+        if text.endswith(probe_text) and text.count(SENTINEL) == 1:
+            pre, post = text[: len(text) - len(probe_text)].split(SENTINEL)
+            self.system_head = (self._encode(pre, self.add_special_tokens), self._encode(post))
+
+    def message_ids(self, message, first):
+        """ID токенов одного сообщения; ``first`` — сообщение открывает диалог."""
+        role, content = message["role"], message["content"]
+        if first and role == "system":
+            if self.system_head is None:
+                raise ValueError("шаблон не поддерживает системное сообщение в начале")
+            pre, post = self.system_head
+        elif role in self.segments:
+            pre, post = self.segments[role]
+            if first:
+                pre = self.head_ids + pre
+        else:
+            raise ValueError(f"шаблон не поддерживает роль {role}")
+        return pre + self._encode(content) + post
+
+    def _verify(self):
+        for dialog in VERIFY_DIALOGS:
+            expected = self.chat_template.messages_token_ids(dialog)
+            actual = []
+            for i, message in enumerate(dialog):
+                actual += self.message_ids(message, first=i == 0)
+            actual += self.generation_ids
+            if actual != expected:
+                print("⚠️  Инкрементальная сборка расходится с apply_chat_template")
+                return False
+        return True
+
+
+class Turn:
+    __slots__ = ("message", "token_ids")
+
+    def __init__(self, message, token_ids=None):
+        self.message = message
+        # array занимает ~4 байта на токен против ~36 у списка int
+        self.token_ids = array("i", token_ids) if token_ids is not None else None
+
+
+class Session:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.turns = []
+        self.lock = asyncio.Lock()
+        self.tokens = 0
+        self.truncated_turns = 0
+        self.created = self.last_used = time.time()
+
+    def info(self):
+        return {
+            "session_id": self.session_id,
+            "turns": len(self.turns),
+            "tokens": self.tokens,
+            "truncated_turns": self.truncated_turns,
+            "messages": [turn.message for turn in self.turns],
+        }
+
+
+class SessionStore:
+    def __init__(self, template, max_model_len, max_sessions=None, max_total_tokens=None):
+        self.template = template
+        self.max_model_len = max_model_len
+        self.max_sessions = max_sessions or int(os.environ.get("SESSIONS_MAX", "1024"))
+        self.max_total_tokens = max_total_tokens or int(os.environ.get("SESSIONS_MAX_TOKENS", "4000000"))
+        self._sessions = OrderedDict()
+        self.total_tokens = 0
+        self.evicted = 0
+
+    def create(self):
+        session = Session(uuid.uuid4().hex)
+        self._sessions[session.session_id] = session
+        self._evict()
+        return session
+
+    def get(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            raise HTTPException(status_code=404, detail=f"Сессия {session_id} не найдена или вытеснена")
+        self._sessions.move_to_end(session_id)
+        session.last_used = time.time()
+        return session
+
+    def delete(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self.total_tokens -= session.tokens
+
+    def _set_tokens(self, session, tokens):
+        self.total_tokens += tokens - session.tokens
+        session.tokens = tokens
+        self._evict()
+
+    def _evict(self):
+        while len(self._sessions) > 1 and (
+            len(self._sessions) > self.max_sessions or self.total_tokens > self.max_total_tokens
+        ):
+            # Самая давняя сессия, которая сейчас не генерирует
+            victim = next((s for s in self._sessions.values() if not s.lock.locked()), None)
+            if victim is None:
+                return
+            self.delete(victim.session_id)
+            self.evicted += 1
+
+    def append(self, session, message):
+        if self.template.incremental:
+            token_ids = self.template.message_ids(message, first=not session.turns)
+            session.turns.append(Turn(message, token_ids))
+            self._set_tokens(session, session.tokens + len(token_ids))
+        else:
+            session.turns.append(Turn(message))
+
+    def pop_last(self, session):
+        """Убирает последний ход (например, не поместившееся сообщение)."""
+        turn = session.turns.pop()
+        if turn.token_ids is not None:
+            self._set_tokens(session, session.tokens - len(turn.token_ids))
+
+    def _drop_oldest(self, turns):
+        """Удаляет из ``turns`` самые старые ходы, кроме системного сообщения в начале.
+
+        Возвращает число удалённых ходов (0 — удалять нечего).
+        """
+        start = 1 if turns and turns[0].message["role"] == "system" else 0
+        if len(turns) - start <= 1:
+            return 0
+        del turns[start]
+        dropped = 1
+        # История после системного сообщения должна начинаться с пользователя
+        while len(turns) - start > 1 and turns[start].message["role"] != "user":
+            del turns[start]
+            dropped += 1
+        if self.template.incremental and start == 0:
+            # Новое первое сообщение получает начало диалога (BOS и т.п.);
+            # новый Turn, а не правка старого — план может не примениться
+            message = turns[0].message
+            turns[0] = Turn(message, self.template.message_ids(message, first=True))
+        return dropped
+
+    def _ids(self, turns):
+        if self.template.incremental:
+            return [t for turn in turns for t in turn.token_ids] + self.template.generation_ids
+        return self.template.chat_template.messages_token_ids([t.message for t in turns])
+
+    def reserve(self, max_tokens):
+        """Сколько токенов контекста оставить под ответ."""
+        return min(max_tokens or 0, self.max_model_len // 2)
+
+    def answer_tokens(self, prompt_tokens, max_tokens):
+        """``max_tokens`` ответа, урезанный до места после промпта."""
+        room = self.max_model_len - prompt_tokens
+        return min(max_tokens, room) if max_tokens else room
+
+    def prompt_ids(self, session, max_tokens):
+        """ID промпта для генерации; старые ходы отбрасываются, пока не влезет ответ.
+
+        Обрезка планируется на копии истории и применяется, только если
+        промпт в итоге помещается: иначе 413, а история остаётся как была.
+        """
+        budget = self.max_model_len - self.reserve(max_tokens)
+        turns = list(session.turns)
+        dropped = 0
+        ids = self._ids(turns)
+        while len(ids) > budget:
+            n = self._drop_oldest(turns)
+            if not n:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Последнее сообщение не помещается в контекст: {len(ids)} > {budget} токенов",
+                )
+            dropped += n
+            ids = self._ids(turns)
+        session.turns = turns
+        session.truncated_turns += dropped
+        self._set_tokens(session, len(ids))
+        return ids
+
+    def stats(self):
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "total_tokens": self.total_tokens,
+            "max_total_tokens": self.max_total_tokens,
+            "evicted": self.evicted,
+            "incremental": self.template.incremental,
+        }
+
+
+async def resumed(first, outputs):
+    """Поток ``outputs``, из которого уже прочитан ``first``."""
+    if first is not None:
+        yield first
+    async for output in outputs:
+        yield output
+
+
+class SessionMessage(BaseModel):
+    role: str = "user"
+    content: str
+
+
+class CreateSession(BaseModel):
+    system: Optional[str] = None
+    messages: List[SessionMessage] = []
+
+
+def add_session_endpoints(app, engine, chat_template, request_model, sampling_params_for,
+                          response_text, system_prompt=None, max_model_len=None,
+                          response_body=None, events=None, answer_text=None):
+    """Регистрирует API сессий ``/sessions``.
+
+    ``max_model_len`` по умолчанию берётся из конфигурации движка vLLM.
+    ``response_body(output, request)`` и ``events(request)`` — тело ответа и
+    SSE-события, если они у модели свои; ``answer_text(output)`` — что
+    сохранить в истории как ход ассистента (у reasoning-моделей — ответ без
+    рассуждений), по умолчанию ``response_text``.
+    """
+    if max_model_len is None:
+        llm_engine = vllm_engine(engine)
+        max_model_len = llm_engine.model_config.max_model_len if llm_engine else 4096
+    store = SessionStore(IncrementalTemplate(chat_template), max_model_len)
+    SessionGenerate = create_model("SessionGenerate", __base__=request_model, prompt=(str, ""))
+
+    def append(session, message):
+        try:
+            store.append(session, message)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    @app.post("/sessions")
+    async def create_session(request: Optional[CreateSession] = None):
+        request = request or CreateSession()
+        session = store.create()
+        system = request.system if request.system is not None else system_prompt
+        if system:
+            append(session, {"role": "system", "content": system})
+        for message in request.messages:
+            append(session, message.model_dump())
+        return session.info()
+
+    @app.get("/sessions/stats")
+    async def sessions_stats():
+        return store.stats()
+
+    @app.get("/sessions/{session_id}")
+    async def get_session(session_id: str):
+        return store.get(session_id).info()
+
+    @app.delete("/sessions/{session_id}")
+    async def delete_session(session_id: str):
+        store.get(session_id)
+        store.delete(session_id)
+        return {"deleted": session_id}
+
+    @app.post("/sessions/{session_id}/messages")
+    async def append_message(session_id: str, message: SessionMessage):
+        session = store.get(session_id)
+        async with session.lock:
+            append(session, message.model_dump())
+        return {"session_id": session_id, "turns": len(session.turns), "tokens": session.tokens}
+
+    async def generate_locked(session, request):
+        if request.prompt:
+            append(session, {"role": "user", "content": request.prompt})
+        if not session.turns:
+            raise HTTPException(status_code=422, detail="В сессии нет сообщений")
+        final = None
+        try:
+            sampling_params = sampling_params_for(request)
+            prompt_ids = store.prompt_ids(session, sampling_params.max_tokens)
+            sampling_params.max_tokens = store.answer_tokens(len(prompt_ids), sampling_params.max_tokens)
+            async for output in engine.stream({"prompt_token_ids": prompt_ids}, sampling_params, request):
+                final = output
+                yield output
+        except BaseException:
+            # Не оставляем в истории сообщение без ответа: не поместилось
+            # в контекст, перегрузка (429), отмена или ошибка движка
+            if request.prompt:
+                store.pop_last(session)
+            raise
+        if final is not None and final.finished:
+            append(session, {"role": "assistant", "content": (answer_text or response_text)(final)})
+        elif request.prompt:
+            store.pop_last(session)
+
+    @app.post("/sessions/{session_id}/generate")
+    async def generate(session_id: str, request: SessionGenerate):
+        session = store.get(session_id)
+
+        async def locked():
+            # Ходы одной сессии выполняются по очереди
+            async with session.lock:
+                async for output in generate_locked(session, request):
+                    yield output
+
+        if request.stream:
+            # Генерация начинается до отправки заголовков (первый ответ движка
+            # читаем здесь): перегрузка (429) и ошибки до начала генерации
+            # возвращаются статусом, а не событием внутри потока
+            outputs = locked()
+            first = await anext(outputs, None)
+            return stream_response(resumed(first, outputs), events(request) if events else None)
+        final = None
+        async for output in locked():
+            final = output
+        body = response_body(final, request) if response_body else {"response": response_text(final)}
+        return {
+            **body,
+            "session_id": session_id,
+            "turns": len(session.turns),
+            "tokens": session.tokens,
+            "truncated_turns": session.truncated_turns,
+        }
+
+    return store
@@ -0,0 +1,321 @@
+"""Быстрый старт: проверка окружения один раз, проверка кэша весов, тайминги.
+
+* ``verify_environment`` сверяет версии пакетов через метаданные (без импорта)
+  и запоминает успешный результат. Пока версии не изменились, повторные
+  запуски ничего не проверяют и не вызывают pip.
+* ``verify_cached_weights`` проверяет, что скачанные safetensors-файлы модели
+  целы (размер совпадает с заголовком), и докачивает только повреждённые,
+  вместо удаления всего кэша.
+* ``StartupTimer`` собирает время по этапам: импорт, токенизатор, загрузка
+  весов, инициализация движка — и пишет отчёт в лог и в JSON. Этапы могут
+  идти параллельно (``background``: токенизатор грузится, пока строится
+  движок); текущий прогресс отдаёт ``startup_status`` для ``/startup/status``.
+* ``mark_ready`` фиксирует время до готовности — от запуска процесса до
+  окончания прогрева (``time_to_ready`` в отчёте).
+
+Переменные окружения:
+    LLM_STATE_DIR — где хранить результаты проверок, по умолчанию ~/.cache/llm-models
+    LLM_LOG_DIR   — куда писать отчёт о старте, по умолчанию /tmp/llm_logs
+"""
+import importlib.metadata
+import json
+import os
+import struct
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+STATE_DIR = os.environ.get("LLM_STATE_DIR", os.path.expanduser("~/.cache/llm-models"))
+LOG_DIR = os.environ.get("LLM_LOG_DIR", "/tmp/llm_logs")
+
+IMPORTED = time.monotonic()
+
+# Таймер старта текущего процесса и время до готовности
+_timer = None
+_ready_s = None
+
+
+def model_slug(model_name):
+    return model_name.replace("/", "--")
+
+
+def load_state(name):
+    path = os.path.join(STATE_DIR, name)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(name, state):
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = os.path.join(STATE_DIR, name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def installed_versions(packages):
+    versions = {"python": sys.executable}
+    for package in packages:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+
+def version_at_least(version, minimum):
+    from packaging.version import Version
+    return version is not None and Version(version) >= Version(minimum)
+
+
+def verify_environment(model_name, requirements):
+    """Проверяет минимальные версии пакетов, например ``{"transformers": "4.40.0"}``.
+
+    Результат хранится в ``env-<model>.json``; если версии с прошлой успешной
+    проверки не менялись, проверка пропускается. Недостающие версии
+    доустанавливаются один раз, без ``--force-reinstall``.
+    """
+    from serving.engine import LLM_ENGINE
+    if LLM_ENGINE == "fake":
+        print("🧪 LLM_ENGINE=fake: проверку окружения пропускаю")
+        return
+
+    state_name = f"env-{model_slug(model_name)}.json"
+    versions = installed_versions(requirements)
+    state = load_state(state_name)
+    if state and state.get("ok") and state.get("versions") == versions:
+        print(f"✅ Окружение проверено ранее ({state.get('checked_at')}), пропускаю")
+        return
+
+    print("🔧 Проверка окружения (один раз)...")
+    outdated = [
+        f"{package}>={minimum}"
+        for package, minimum in requirements.items()
+        if not version_at_least(versions[package], minimum)
+    ]
+    if outdated:
+        print(f"📦 Требуется обновление: {', '.join(outdated)}")
+        subprocess.run([sys.executable, "-m", "pip", "install", *outdated], check=True)
+        versions = installed_versions(requirements)
+
+    for package, version in versions.items():
+        print(f"   {package}: {version}")
+    save_state(state_name, {
+        "ok": True,
+        "versions": versions,
+        "requirements": requirements,
+        "checked_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    })
+    print("✅ Окружение в порядке, результат сохранён")
+
+
+def safetensors_intact(path):
+    """Файл не обрезан: размер совпадает с концом последнего тензора из заголовка."""
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as f:
+            (header_len,) = struct.unpack("<Q", f.read(8))
+            if header_len <= 0 or 8 + header_len > size:
+                return False
+            header = json.loads(f.read(header_len))
+    except (OSError, ValueError, struct.error):
+        return False
+    data_end = max(
+        (meta["data_offsets"][1] for key, meta in header.items() if key != "__metadata__"),
+        default=0,
+    )
+    return size == 8 + header_len + data_end
+
+
+def verify_cached_weights(model_name):
+    """Проверяет кэш весов HF Hub и докачивает только повреждённые файлы.
+
+    Возвращает True, если модель уже в кэше и цела (или восстановлена),
+    False — если модели в кэше нет и её скачает обычная загрузка.
+    """
+    from serving.engine import LLM_ENGINE
+    if LLM_ENGINE == "fake":
+        print("🧪 LLM_ENGINE=fake: веса не нужны, проверку кэша пропускаю")
+        return False
+
+    from huggingface_hub import hf_hub_download, snapshot_download
+
+    try:
+        snapshot = snapshot_download(model_name, local_files_only=True)
+    except Exception:
+        print("ℹ️  Модели нет в локальном кэше, будет скачана при загрузке")
+        return False
+
+    broken = []
+    for root, _, files in os.walk(snapshot):
+        for name in files:
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, snapshot)
+            if not os.path.exists(path):
+                # Битая симлинка на blob
+                broken.append(rel)
+            elif name.endswith(".safetensors") and not safetensors_intact(path):
+                broken.append(rel)
+
+    if not broken:
+        print(f"✅ Кэш весов цел: {snapshot}")
+        return True
+
+    print(f"⚠️  Повреждены файлы кэша: {', '.join(broken)}")
+    for rel in broken:
+        print(f"   Докачиваю {rel}...")
+        hf_hub_download(model_name, rel, force_download=True)
+    print("✅ Кэш весов восстановлен")
+    return True
+
+
+def process_uptime():
+    """Секунды с запуска процесса (по /proc), иначе с импорта этого модуля."""
+    try:
+        with open("/proc/self/stat") as f:
+            # Имя процесса в скобках может содержать пробелы
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.monotonic() - IMPORTED
+
+
+def load_tokenizer(model_name, **kwargs):
+    """``AutoTokenizer.from_pretrained`` с импортом transformers внутри — для фонового потока.
+
+    При LLM_ENGINE=fake — локальный ``FakeTokenizer``: ни transformers, ни
+    токенизатор модели с HF Hub не нужны.
+    """
+    from serving.engine import LLM_ENGINE
+    if LLM_ENGINE == "fake":
+        from serving.fake import FakeTokenizer
+        print(f"🧪 LLM_ENGINE=fake: заглушка вместо токенизатора {model_name}")
+        return FakeTokenizer()
+
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name, **kwargs)
+
+
+def startup_status():
+    """Прогресс старта для ``/startup/status``."""
+    status = {"uptime_s": round(process_uptime(), 1), "time_to_ready_s": _ready_s}
+    if _timer is not None:
+        status.update(_timer.status())
+    return status
+
+
+def mark_ready():
+    """Сервис готов: запоминает время от запуска процесса и дописывает его в отчёт."""
+    global _ready_s
+    if _ready_s is not None:
+        return
+    _ready_s = round(process_uptime(), 2)
+    print(f"🚀 Время до готовности: {_ready_s:.1f} с от запуска процесса")
+    if _timer is not None:
+        _timer.report()
+
+
+class StartupTimer:
+    def __init__(self, model_name):
+        global _timer
+        self.model_name = model_name
+        self.stages = {}
+        self.active = {}
+        self.started = time.monotonic()
+        _timer = self
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        self.active[name] = start
+        try:
+            yield
+        finally:
+            self.active.pop(name, None)
+            self.stages[name] = self.stages.get(name, 0.0) + time.monotonic() - start
+
+    def background(self, name, fn, *args, **kwargs):
+        """Запускает ``fn`` этапом ``name`` в отдельном потоке; возвращает Future с результатом."""
+        future = Future()
+
+        def run():
+            try:
+                with self.stage(name):
+                    result = fn(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+        threading.Thread(target=run, name=f"startup-{name}", daemon=True).start()
+        return future
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            "model": self.model_name,
+            "active": {name: round(now - start, 1) for name, start in list(self.active.items())},
+            "done": {name: seconds for name, seconds in self.summary().items() if name not in ("total", "time_to_ready")},
+        }
+
+    @contextmanager
+    def engine_init(self):
+        """Замеряет конструирование движка, отдельно выделяя загрузку весов.
+
+        Загрузку весов vLLM делает в ``ModelRunner.load_model``; на время
+        конструирования оборачиваем этот метод таймером. Если внутренний API
+        vLLM изменился, этап просто не разбивается.
+        """
+        try:
+            from vllm.worker.model_runner import GPUModelRunnerBase
+        except Exception:
+            GPUModelRunnerBase = None
+
+        original = GPUModelRunnerBase.load_model if GPUModelRunnerBase else None
+        if original is not None:
+            timer = self
+
+            def load_model(runner, *args, **kwargs):
+                with timer.stage("weight_load"):
+                    return original(runner, *args, **kwargs)
+
+            GPUModelRunnerBase.load_model = load_model
+        try:
+            with self.stage("engine_total"):
+                yield
+        finally:
+            if original is not None:
+                GPUModelRunnerBase.load_model = original
+
+    def summary(self):
+        stages = dict(self.stages)
+        total_engine = stages.pop("engine_total", None)
+        if total_engine is not None:
+            stages["engine_init"] = total_engine - stages.get("weight_load", 0.0)
+        stages["total"] = time.monotonic() - self.started
+        if _ready_s is not None:
+            stages["time_to_ready"] = _ready_s
+        return {name: round(seconds, 2) for name, seconds in stages.items()}
+
+    def report(self):
+        summary = self.summary()
+        print("⏱️  Время старта по этапам:")
+        for name, seconds in summary.items():
+            print(f"   {name:<15}{seconds:>8.2f} с")
+        try:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            path = os.path.join(LOG_DIR, f"startup-{model_slug(self.model_name)}.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "stages": summary}, f, indent=2)
+        except OSError as e:
+            print(f"⚠️  Не удалось сохранить отчёт о старте: {e}")
+        return summary
@@ -0,0 +1,50 @@
+"""Потоковые ответы (Server-Sent Events).
+
+Движок отдаёт накопленные ``RequestOutput``; клиенту уходят только приращения
+текста (``{"delta": ...}``), а в конце — событие со статистикой
+(``{"done": true, "usage": {...}}``).
+"""
+import json
+
+from fastapi.responses import StreamingResponse
+
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def usage(output):
+    completion = output.outputs[0]
+    return {
+        "prompt_tokens": len(output.prompt_token_ids or []),
+        "completion_tokens": len(completion.token_ids),
+        "finish_reason": completion.finish_reason,
+    }
+
+
+async def sse_deltas(outputs):
+    sent = ""
+    final = None
+    try:
+        async for output in outputs:
+            text = output.outputs[0].text
+            delta = text[len(sent):]
+            if delta:
+                yield sse_event({"delta": delta})
+                sent = text
+            final = output
+    except Exception as e:
+        # Заголовки уже отправлены, поэтому ошибку передаём событием
+        yield sse_event({"error": str(e)})
+        return
+    if final is not None:
+        yield sse_event({"done": True, "usage": usage(final)})
+
+
+def stream_response(outputs, events=None):
+    """``events(outputs)`` — свой генератор SSE-событий вместо ``sse_deltas``."""
+    return StreamingResponse(
+        (events or sse_deltas)(outputs),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
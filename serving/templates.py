@@ -0,0 +1,242 @@
+"""Кэш рендеринга chat template: постоянные префикс и суффикс считаются один раз.
+
+Шаблон каждой модели оборачивает сообщение пользователя одним и тем же
+текстом (системное сообщение, служебные токены ролей, приглашение
+ассистента). ``ChatTemplate`` один раз рендерит шаблон с меткой вместо
+сообщения, делит результат на префикс и суффикс и токенизирует их. На запрос
+остаётся токенизировать только текст пользователя и склеить ID токенов.
+
+ID совпадают с тем, что раньше получал движок: ``add_special_tokens=True``
+повторяет токенизацию текстового промпта внутри vLLM (с BOS), ``False`` —
+``apply_chat_template(tokenize=True)``. На границах сообщения BPE мог бы
+склеить токены иначе (например, SentencePiece добавляет пробел в начало
+текста), поэтому текст с пробелами по краям идёт полным путём, а при старте
+быстрый путь сверяется с полным на корпусе промптов; при любом расхождении
+кэш отключается и все запросы рендерятся целиком.
+
+Некоторые шаблоны (gpt-oss) подставляют текущую дату, поэтому префикс и
+суффикс пересчитываются при смене дня. Если они изменились, сверка идёт
+заново в фоновом потоке, а не на запросе, который первым пришёл после
+полуночи; пока она не закончилась, запросы рендерятся целиком.
+
+Переменные окружения:
+    CHAT_TEMPLATE_CACHE       — false: всегда рендерить шаблон целиком
+    CHAT_TEMPLATE_VERIFY      — false: не сверять с полным рендерингом (по умолчанию сверяется)
+    CHAT_TEMPLATE_VERIFY_FILE — JSONL с полем prompt: дополнительный корпус
+
+Проверка вручную:
+
+    python -m serving.templates yandex/YandexGPT-5-Lite-8B-instruct
+"""
+import json
+import os
+import threading
+import time
+
+# Метка вместо текста пользователя; шаблоны её не меняют
+SENTINEL = "<<<USER_CONTENT>>>"
+
+VERIFY_CORPUS = [
+    "Привет!",
+    "Расскажи анекдот про программиста.",
+    "Переведи на английский: «Мама мыла раму».",
+    "  Пробелы в начале и в конце  ",
+    "Многострочный\nзапрос\n\nс пустой строкой",
+    "Emoji 🚀🔥 и символы <s> </s> [INST] {json: true}",
+    "Код: def f(x):\n    return x ** 2  # квадрат",
+    "Очень длинный запрос. " * 200,
+    "Mixed language: что такое attention in transformers?",
+    "Числа 3.14159, 2,71828 и 1e-10",
+    "a",
+    "",
+]
+
+
+def user_messages(content):
+    return [{"role": "user", "content": content}]
+
+
+def first_difference(a, b):
+    for i, (x, y) in enumerate(zip(a, b)):
+        if x != y:
+            return i
+    return min(len(a), len(b))
+
+
+class ChatTemplate:
+    def __init__(self, tokenizer, build_messages=user_messages, add_special_tokens=True):
+        self.tokenizer = tokenizer
+        self.build_messages = build_messages
+        self.add_special_tokens = add_special_tokens
+        self.enabled = os.environ.get("CHAT_TEMPLATE_CACHE", "true").lower() == "true"
+        self._parts = None
+        self._day = None
+
+        # Быстрый путь против полного рендеринга
+        self.hits = 0
+        self.fallbacks = 0
+
+        self.corpus = None
+        if os.environ.get("CHAT_TEMPLATE_VERIFY", "true").lower() == "true":
+            self.corpus = list(VERIFY_CORPUS)
+            path = os.environ.get("CHAT_TEMPLATE_VERIFY_FILE")
+            if path:
+                with open(path, encoding="utf-8") as f:
+                    self.corpus += [json.loads(line)["prompt"] for line in f if line.strip()]
+
+        # Префикс и суффикс считаются (и сверяются) сразу при старте, а не на первом запросе
+        if self.enabled:
+            self.parts()
+
+    def render_full(self, content):
+        return self.tokenizer.apply_chat_template(
+            self.build_messages(content),
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+
+    def token_ids_full(self, content):
+        return self.tokenizer(
+            self.render_full(content), add_special_tokens=self.add_special_tokens
+        ).input_ids
+
+    def messages_token_ids(self, messages):
+        """ID токенов для произвольного диалога (без кэша префикса)."""
+        rendered = self.tokenizer.apply_chat_template(
+            messages,
+            tokenize=False,
+            add_generation_prompt=True,
+        )
+        return self.tokenizer(rendered, add_special_tokens=self.add_special_tokens).input_ids
+
+    def _encode(self, text, add_special_tokens=False):
+        return self.tokenizer(text, add_special_tokens=add_special_tokens).input_ids
+
+    def _render_parts(self):
+        try:
+            rendered = self.render_full(SENTINEL)
+        except Exception:
+            return None
+        if rendered.count(SENTINEL) != 1:
+            return None
+        prefix, suffix = rendered.split(SENTINEL)
+        return prefix, suffix, self._encode(prefix, self.add_special_tokens), self._encode(suffix)
+
+    def parts(self):
+        """``(prefix_text, suffix_text, prefix_ids, suffix_ids)`` или None."""
+        day = time.strftime("%Y-%m-%d")
+        if self._day != day:
+            startup = self._day is None
+            self._day = day
+            parts = self._render_parts()
+            if parts is None or not (self.enabled and self.corpus):
+                self._parts = parts
+            elif self._parts is not None and parts[:2] == self._parts[:2]:
+                pass  # Шаблон не зависит от даты: сверять заново нечего
+            elif startup:
+                self._check(parts, day)
+            else:
+                # Сверка на корпусе — в фоне, не на запросе; пока что полный рендеринг
+                self._parts = None
+                threading.Thread(
+                    target=self._check, args=(parts, day), name="chat-template-verify", daemon=True
+                ).start()
+        return self._parts
+
+    def _check(self, parts, day):
+        # Быстрый путь не должен менять промпт: при расхождении — только полный рендеринг
+        mismatches = self.verify(self.corpus, parts)
+        if mismatches:
+            print(f"⚠️  Кэш шаблона расходится с apply_chat_template "
+                  f"на {len(mismatches)} промптах, отключаю")
+            self.enabled = False
+        else:
+            print(f"✅ Кэш шаблона совпал с apply_chat_template на {len(self.corpus)} промптах")
+            if self._day == day:
+                self._parts = parts
+
+    def _fast(self, content):
+        # По краям сообщения BPE может склеить символы с префиксом/суффиксом
+        if not self.enabled or not content or content != content.strip():
+            return None
+        return self.parts()
+
+    def render(self, content):
+        parts = self._fast(content)
+        if parts is None:
+            self.fallbacks += 1
+            return self.render_full(content)
+        self.hits += 1
+        return parts[0] + content + parts[1]
+
+    def token_ids(self, content):
+        parts = self._fast(content)
+        if parts is None:
+            self.fallbacks += 1
+            return self.token_ids_full(content)
+        self.hits += 1
+        return parts[2] + self._encode(content) + parts[3]
+
+    def verify(self, corpus, parts=None):
+        """Сравнивает быстрый путь с полным; печатает и возвращает расхождения.
+
+        ``parts`` — проверить эти префикс и суффикс, а не текущие.
+        """
+        mismatches = []
+        for content in corpus:
+            if parts is None:
+                actual = self.token_ids(content)
+            elif not content or content != content.strip():
+                continue  # Такие промпты и так идут полным путём
+            else:
+                actual = parts[2] + self._encode(content) + parts[3]
+            expected = self.token_ids_full(content)
+            if expected != actual:
+                i = first_difference(expected, actual)
+                print(f"❌ Расхождение на {content[:40]!r}, позиция {i}:")
+                print(f"   apply_chat_template: {expected[max(i - 3, 0):i + 5]}")
+                print(f"   кэш шаблона:         {actual[max(i - 3, 0):i + 5]}")
+                mismatches.append(content)
+        return mismatches
+
+    def stats(self):
+        return {"enabled": self.enabled, "hits": self.hits, "fallbacks": self.fallbacks}
+
+
+def main():
+    import argparse
+
+    from transformers import AutoTokenizer
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model")
+    parser.add_argument("--system", help="системное сообщение перед сообщением пользователя")
+    parser.add_argument("--no-special-tokens", action="store_true",
+                        help="как apply_chat_template(tokenize=True), без добавления BOS")
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    # Сверяем ниже сами, с отчётом и замером; автопроверка выключила бы быстрый путь
+    os.environ["CHAT_TEMPLATE_VERIFY"] = "false"
+    tokenizer = AutoTokenizer.from_pretrained(args.model, trust_remote_code=True)
+    build = user_messages
+    if args.system:
+        def build(content):
+            return [{"role": "system", "content": args.system}, *user_messages(content)]
+    template = ChatTemplate(tokenizer, build, add_special_tokens=not args.no_special_tokens)
+
+    mismatches = template.verify(VERIFY_CORPUS)
+    print(f"Совпало {len(VERIFY_CORPUS) - len(mismatches)} из {len(VERIFY_CORPUS)}")
+
+    for name, fn in (("полный рендеринг", template.token_ids_full), ("кэш шаблона", template.token_ids)):
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            for content in VERIFY_CORPUS:
+                fn(content)
+        per_request = (time.perf_counter() - start) / (args.iterations * len(VERIFY_CORPUS))
+        print(f"   {name:<17} {per_request * 1e6:>9.1f} мкс на запрос")
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
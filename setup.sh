@@ -111,15 +111,15 @@ for MODEL in "${MODELS[@]}"; do
     case $MODEL in
         tlite)
             log_info "Запуск T-lite на порту 8083..."
-            tmux new -s tlite -d "python app_tlite.py 2>&1 | tee logs/tlite.log"
+            tmux new -s tlite -d "PORT=8083 python -m serving.launcher app_tlite.py 2>&1 | tee logs/tlite.log"
             ;;
         yagpt)
             log_info "Запуск YandexGPT на порту 8081..."
-            tmux new -s yagpt -d "python app_yagpt.py 2>&1 | tee logs/yagpt.log"
+            tmux new -s yagpt -d "PORT=8081 python -m serving.launcher app_yagpt.py 2>&1 | tee logs/yagpt.log"
             ;;
         vikhr)
             log_info "Запуск Vikhr на порту 8082..."
-            tmux new -s vikhr -d "python app_vikhr.py 2>&1 | tee logs/vikhr.log"
+            tmux new -s vikhr -d "PORT=8082 python -m serving.launcher app_vikhr.py 2>&1 | tee logs/vikhr.log"
             ;;
     esac
 done
@@ -10,24 +10,27 @@ echo "🚀 Запуск LLM сервисов..."
 mkdir -p logs
 
 # Запуск моделей (раскомментируй нужные)
+# Модели слушают только localhost: снаружи доступен один шлюз
 echo "Запуск T-lite..."
-tmux new -s tlite -d "python app_tlite.py 2>&1 | tee logs/tlite.log"
+tmux new -s tlite -d "HOST=127.0.0.1 PORT=8083 python -m serving.launcher app_tlite.py 2>&1 | tee logs/tlite.log"
 
 echo "Запуск YandexGPT..."
-tmux new -s yagpt -d "python app_yagpt.py 2>&1 | tee logs/yagpt.log"
+tmux new -s yagpt -d "HOST=127.0.0.1 PORT=8081 python -m serving.launcher app_yagpt.py 2>&1 | tee logs/yagpt.log"
 
 echo "Запуск Vikhr..."
-tmux new -s vikhr -d "python app_vikhr.py 2>&1 | tee logs/vikhr.log"
+tmux new -s vikhr -d "HOST=127.0.0.1 PORT=8082 python -m serving.launcher app_vikhr.py 2>&1 | tee logs/vikhr.log"
+
+# Шлюз: все модели на одном порту
+echo "Запуск шлюза..."
+tmux new -s gateway -d "GATEWAY_WORKERS=tlite=http://127.0.0.1:8083,yagpt=http://127.0.0.1:8081,vikhr=http://127.0.0.1:8082 PORT=8000 python gateway.py 2>&1 | tee logs/gateway.log"
 
 # Ожидание загрузки
 echo "⏳ Ожидание загрузки моделей (30 сек)..."
 sleep 30
 
-# Запуск туннелей
-echo "🌐 Создание туннелей..."
-tmux new -s tlite-tunnel -d "cloudflared tunnel --url http://localhost:8083 2>&1 | tee logs/tlite-tunnel.log"
-tmux new -s yagpt-tunnel -d "cloudflared tunnel --url http://localhost:8081 2>&1 | tee logs/yagpt-tunnel.log"
-tmux new -s vikhr-tunnel -d "cloudflared tunnel --url http://localhost:8082 2>&1 | tee logs/vikhr-tunnel.log"
+# Один туннель на шлюз вместо туннеля на каждую модель
+echo "🌐 Создание туннеля..."
+tmux new -s gateway-tunnel -d "cloudflared tunnel --url http://localhost:8000 2>&1 | tee logs/gateway-tunnel.log"
 
 sleep 5
 
@@ -6,15 +6,31 @@
 
 echo "🛑 Остановка всех сервисов..."
 
+# Сначала плавно: SIGTERM запускает drain — модель доделывает запросы в работе
+# (не дольше DRAIN_TIMEOUT_S) и завершается сама. Сигнал только процессу
+# python, не оболочке tmux: иначе закрытие сессии оборвёт его SIGHUP.
+LAUNCHER='^[^ ]*python[^ ]* .*-m serving\.launcher'
+PIDS=$(pgrep -f "$LAUNCHER")
+if [ -n "$PIDS" ]; then
+    echo "🚰 Drain моделей (PID: $(echo $PIDS))..."
+    kill -TERM $PIDS 2>/dev/null
+    for i in $(seq 1 $(( ${DRAIN_TIMEOUT_S:-120} + 15 ))); do
+        pgrep -f "$LAUNCHER" >/dev/null || break
+        sleep 1
+    done
+fi
+
 # Остановка моделей
 tmux kill-session -t tlite 2>/dev/null && echo "✓ T-lite остановлен"
 tmux kill-session -t yagpt 2>/dev/null && echo "✓ YandexGPT остановлен"
 tmux kill-session -t vikhr 2>/dev/null && echo "✓ Vikhr остановлен"
+tmux kill-session -t gateway 2>/dev/null && echo "✓ Шлюз остановлен"
 
 # Остановка туннелей
 tmux kill-session -t tlite-tunnel 2>/dev/null && echo "✓ T-lite tunnel остановлен"
 tmux kill-session -t yagpt-tunnel 2>/dev/null && echo "✓ YandexGPT tunnel остановлен"
 tmux kill-session -t vikhr-tunnel 2>/dev/null && echo "✓ Vikhr tunnel остановлен"
+tmux kill-session -t gateway-tunnel 2>/dev/null && echo "✓ Gateway tunnel остановлен"
 
 echo ""
 echo "✅ Все сервисы остановлены!"